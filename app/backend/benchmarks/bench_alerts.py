@@ -0,0 +1,161 @@
+"""Risk alert fan-out: thousands of simulated subscribers on the AlertHub, then the real endpoints.
+
+Part 1 attaches ``--subscribers`` subscriptions straight to an AlertHub.
+Each follows ``--follow`` of ``--patients`` patients. A ``--slow-fraction``
+of them read at ``--slow-ms`` per event, and the rest read as fast as they
+can. It publishes ``--events`` vitals events at ``--rate`` per second and
+reports publisher cost per event, delivery latency, and whether fast
+subscribers got every event. It also checks that slow subscribers stayed
+inside their queue bound, were told to resync, or were cut off.
+
+Part 2 goes through the ASGI app. A doctor opens GET /api/alerts/stream
+and a patient booked with them posts vitals that push them to high risk.
+The doctor must see the ``vitals`` and ``risk_transition`` events.
+
+    cd app/backend
+    python benchmarks/bench_alerts.py --subscribers 5000 --events 2000
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import statistics
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+
+from harness import client, create_user, load_app
+
+
+async def fan_out(args, server):
+    from services.alertService import AlertHub, Subscription
+
+    hub = AlertHub(server.db, source="local", queue_size=args.queue_size, max_subscribers=args.subscribers)
+    patients = [str(uuid.uuid4()) for _ in range(args.patients)]
+    subs, slow = [], set()
+    for i in range(args.subscribers):
+        sub = hub.add(Subscription(f"doctor-{i}", random.sample(patients, args.follow), args.queue_size,
+                                   max_drops=args.max_drops))
+        subs.append(sub)
+        if random.random() < args.slow_fraction:
+            slow.add(sub)
+
+    sent_at = {}
+    received = {id(s): 0 for s in subs}
+    latencies, resyncs, peak_queue = [], 0, 0
+
+    async def consume(sub):
+        nonlocal resyncs, peak_queue
+        async for kind, data in sub.events(heartbeat=60):
+            peak_queue = max(peak_queue, sub.queue.qsize())
+            if kind == "vitals":
+                received[id(sub)] += 1
+                if sub not in slow:
+                    latencies.append(time.perf_counter() - sent_at[json.loads(data)["latest"]["id"]])
+                else:
+                    await asyncio.sleep(args.slow_ms / 1000)
+            elif kind == "resync":
+                resyncs += 1
+            elif kind == "closed":
+                return
+
+    consumers = [asyncio.create_task(consume(s)) for s in subs]
+    expected = {id(s): 0 for s in subs}
+    publish_ns, deliveries = [], 0
+    now = datetime.now(timezone.utc)
+    interval = 1 / args.rate
+    started = time.perf_counter()
+    for n in range(args.events):
+        patient_id = random.choice(patients)
+        doc = {"id": f"e{n}", "user_id": patient_id, "heart_rate": random.randint(55, 130),
+               "timestamp": now + timedelta(seconds=n)}
+        for sub in hub._by_patient.get(patient_id, ()):
+            expected[id(sub)] += 1
+        sent_at[doc["id"]] = time.perf_counter()
+        t0 = time.perf_counter_ns()
+        deliveries += hub._publish_vitals(patient_id, [doc])
+        publish_ns.append(time.perf_counter_ns() - t0)
+        # Let consumers run between publishes, as they would between requests
+        await asyncio.sleep(max(0.0, started + (n + 1) * interval - time.perf_counter()))
+    elapsed = time.perf_counter() - started
+    await asyncio.sleep(0.5)
+    for sub in subs:
+        sub.close("bench done")
+    await asyncio.gather(*consumers)
+
+    fast = [s for s in subs if s not in slow]
+    complete = sum(1 for s in fast if received[id(s)] == expected[id(s)])
+    latencies.sort()
+    print(f"{len(subs)} subscribers ({len(slow)} slow), {args.events} events in {elapsed:.2f}s, {deliveries} deliveries")
+    print(f"publish cost: median {statistics.median(publish_ns) / 1000:.1f} us, "
+          f"p99 {sorted(publish_ns)[int(len(publish_ns) * 0.99)] / 1000:.1f} us per event")
+    if latencies:
+        print(f"delivery latency (fast): p50 {latencies[len(latencies) // 2] * 1000:.2f} ms, "
+              f"p99 {latencies[int(len(latencies) * 0.99)] * 1000:.2f} ms")
+    print(f"fast subscribers with every event: {complete}/{len(fast)}")
+    print(f"slow subscribers: {resyncs} resync notices, "
+          f"{sum(1 for s in subs if s.close_reason == 'slow consumer')} cut off as slow, "
+          f"peak queue {peak_queue}/{args.queue_size}")
+    for sub in subs:
+        hub.unsubscribe(sub)
+    print(f"after unsubscribe: {hub.stats()}")
+
+
+async def end_to_end(server):
+    from services.indexService import ensure_indexes
+
+    await ensure_indexes(server.db)
+    doctor = await create_user(server, role="doctor")
+    patient = await create_user(server)
+    async with client(server) as http:
+        response = await http.post("/api/appointments", headers=doctor["headers"], json={
+            "patient_id": patient["user"]["id"], "doctor_id": doctor["user"]["id"],
+            "scheduled_time": (datetime.now(timezone.utc) + timedelta(days=1)).isoformat(), "reason": "check-up",
+        })
+        response.raise_for_status()
+        await http.post("/api/vitals", json={"heart_rate": 72, "oxygen_saturation": 98}, headers=patient["headers"])
+
+        # httpx's ASGI transport hands back the body once the stream ends, so the hub is stopped to end it
+        stream = asyncio.create_task(http.get("/api/alerts/stream", headers=doctor["headers"]))
+        while server.alert_hub.subscribers == 0:
+            await asyncio.sleep(0.01)
+        await http.post("/api/vitals", json={"heart_rate": 150, "oxygen_saturation": 85, "temperature": 39.5},
+                        headers=patient["headers"])
+        await server.alert_hub.stop()
+        body = (await stream).text
+    events = [line.split(": ", 1)[1] for line in body.splitlines() if line.startswith("event: ")]
+    transitions = [json.loads(line.split(": ", 1)[1]) for line in body.splitlines()
+                   if line.startswith("data: ") and '"risk_transition"' in line]
+    print(f"SSE events seen by the doctor: {events}")
+    if transitions:
+        t = transitions[0]
+        print(f"risk_transition: {t['from']} -> {t['to']} (score {t['score']})")
+    print(f"hub after disconnect: {server.alert_hub.stats()}")
+
+
+async def bench(args):
+    os.environ.setdefault("FIT_SCHEDULER_ENABLED", "false")
+    server = load_app(args.mongo_url)
+    await fan_out(args, server)
+    await end_to_end(server)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--subscribers", type=int, default=5000)
+    parser.add_argument("--patients", type=int, default=500)
+    parser.add_argument("--follow", type=int, default=20, help="patients per subscriber")
+    parser.add_argument("--events", type=int, default=2000)
+    parser.add_argument("--rate", type=float, default=500, help="events published per second")
+    parser.add_argument("--slow-fraction", type=float, default=0.05)
+    parser.add_argument("--slow-ms", type=float, default=1000, help="per-event processing time of slow subscribers")
+    parser.add_argument("--queue-size", type=int, default=8)
+    parser.add_argument("--max-drops", type=int, default=40)
+    parser.add_argument("--mongo-url", default=None, help="real MongoDB; defaults to mongomock-motor")
+    args = parser.parse_args()
+    asyncio.run(bench(args))
+
+
+if __name__ == "__main__":
+    main()
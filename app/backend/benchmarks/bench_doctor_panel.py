@@ -0,0 +1,138 @@
+"""Doctor panel: one GET /api/doctor/panel vs. the old per-patient fan-out.
+
+Seeds ``--patients`` patients booked with one doctor (plus patients of
+another doctor who must not show up), each with ``--vitals`` readings
+and a few risk scores, then backfills patient_summaries with
+``PatientPanel.rebuild``. It checks every summary against the latest
+vitals / risk / upcoming appointment computed straight from the source
+collections, and checks the risk ordering across keyset pages. Then it
+logs a reading through POST /api/vitals and checks the panel picked it
+up. Finally it times loading the panel against the N+1 pattern the
+doctor UI used (patient list, then vitals per patient).
+
+    cd app/backend
+    python benchmarks/bench_doctor_panel.py --patients 500
+"""
+import argparse
+import asyncio
+import random
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+
+from harness import client, create_user, load_app
+
+
+async def walk_panel(http, headers, params):
+    rows, cursor, requests = [], None, 0
+    while True:
+        response = await http.get("/api/doctor/panel", params={**params, **({"cursor": cursor} if cursor else {})},
+                                  headers=headers)
+        response.raise_for_status()
+        rows += response.json()
+        requests += 1
+        cursor = response.headers.get("x-next-cursor")
+        if not cursor:
+            return rows, requests
+
+
+async def bench(args):
+    server = load_app(args.mongo_url)
+    from services.indexService import ensure_indexes
+    from services.riskEngineService import risk_level_for
+
+    await ensure_indexes(server.db)
+    doctor = await create_user(server, role="doctor", full_name="Dr. Panel")
+    other = await create_user(server, role="doctor", full_name="Dr. Other")
+    now = datetime.now(timezone.utc)
+    patients, vitals, risks, appointments = [], [], [], []
+    for i in range(args.patients + args.patients // 10):
+        patient = await create_user(server, full_name=f"Patient {i:05d}")
+        pid = patient["user"]["id"]
+        patients.append(patient)
+        booked_with = doctor if i < args.patients else other
+        for k in range(args.vitals):
+            vitals.append({"id": str(uuid.uuid4()), "user_id": pid, "heart_rate": random.randint(55, 130),
+                           "timestamp": now - timedelta(hours=k, minutes=random.randint(0, 59))})
+        for k in range(3):
+            score = random.choice([0.0, 15.0, 30.0, 45.0, 60.0, 85.0])
+            risks.append({"id": str(uuid.uuid4()), "user_id": pid, "score": score,
+                          "risk_level": risk_level_for(score),
+                          "factors": [], "recommendations": [], "timestamp": now - timedelta(days=k)})
+        # One past and (for most patients) one upcoming appointment
+        for offset in ([-3, random.randint(1, 30)] if i % 5 else [-3]):
+            appointments.append({"id": str(uuid.uuid4()), "patient_id": pid, "patient_name": patient["user"]["full_name"],
+                                 "doctor_id": booked_with["user"]["id"], "doctor_name": booked_with["user"]["full_name"],
+                                 "scheduled_time": now + timedelta(days=offset), "reason": "follow-up",
+                                 "status": "scheduled", "created_at": now})
+    await server.db.vitals.insert_many(vitals)
+    await server.db.risk_scores.insert_many(risks)
+    await server.db.appointments.insert_many(appointments)
+    print(f"seeded {len(patients)} patients, {len(vitals)} vitals, {len(risks)} risk scores, "
+          f"{len(appointments)} appointments")
+
+    started = time.perf_counter()
+    await server.panel.rebuild()
+    print(f"panel rebuild: {time.perf_counter() - started:.2f}s")
+
+    expected = {}
+    for p in patients[:args.patients]:
+        pid = p["user"]["id"]
+        upcoming = [a for a in appointments if a["patient_id"] == pid and a["scheduled_time"] >= now]
+        expected[pid] = (
+            max((v for v in vitals if v["user_id"] == pid), key=lambda v: v["timestamp"])["id"],
+            max((r for r in risks if r["user_id"] == pid), key=lambda r: r["timestamp"])["id"],
+            min(upcoming, key=lambda a: a["scheduled_time"])["id"] if upcoming else None,
+        )
+
+    async with client(server) as http:
+        headers = doctor["headers"]
+        rows, requests = await walk_panel(http, headers, {"limit": args.page_size})
+        got = {r["id"]: (r["latest_vitals"]["id"], r["latest_risk"]["id"],
+                         (r["next_appointment"] or {}).get("id")) for r in rows}
+        mismatches = sum(1 for pid, want in expected.items() if got.get(pid) != want)
+        scores = [r["latest_risk"]["score"] for r in rows]
+        print(f"panel: {len(rows)} patients in {requests} pages, {len(set(got) - set(expected))} foreign, "
+              f"{mismatches} mismatches, risk-sorted={scores == sorted(scores, reverse=True)}")
+
+        high, _ = await walk_panel(http, headers, {"limit": args.page_size, "risk_level": "high"})
+        print(f"risk_level=high: {len(high)} patients, all high={all(r['risk_level'] == 'high' for r in high)}")
+
+        target = patients[0]
+        response = await http.post("/api/vitals", json={"heart_rate": 200, "oxygen_saturation": 85},
+                                   headers=target["headers"])
+        response.raise_for_status()
+        vital_id = response.json()["id"]
+        rows, _ = await walk_panel(http, headers, {"limit": args.page_size})
+        row = next(r for r in rows if r["id"] == target["user"]["id"])
+        scores = [r["latest_risk"]["score"] for r in rows]
+        print(f"after POST /api/vitals: latest_vitals updated={row['latest_vitals']['id'] == vital_id}, "
+              f"risk {row['latest_risk']['risk_level']} ({row['latest_risk']['score']}), "
+              f"risk-sorted={scores == sorted(scores, reverse=True)}")
+
+        started = time.perf_counter()
+        rows, requests = await walk_panel(http, headers, {"limit": min(args.patients, 500)})
+        panel_ms = (time.perf_counter() - started) * 1000
+        print(f"panel load:   {requests:5d} requests {panel_ms:9.1f} ms")
+
+        started = time.perf_counter()
+        listing = await http.get("/api/doctor/patients", params={"limit": 500}, headers=headers)
+        fanout = listing.json()
+        for p in fanout:
+            await http.get(f"/api/doctor/patients/{p['id']}/vitals", params={"limit": 1}, headers=headers)
+        fanout_ms = (time.perf_counter() - started) * 1000
+        print(f"N+1 fan-out:  {1 + len(fanout):5d} requests {fanout_ms:9.1f} ms (vitals only, no risk or appointments)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--patients", type=int, default=500)
+    parser.add_argument("--vitals", type=int, default=10, help="readings per patient")
+    parser.add_argument("--page-size", type=int, default=100)
+    parser.add_argument("--mongo-url", default=None, help="real MongoDB; defaults to mongomock-motor")
+    args = parser.parse_args()
+    asyncio.run(bench(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,156 @@
+"""Peak RSS of the patient history export for NDJSON, CSV and Parquet.
+
+``--source synthetic`` (default) feeds the encoders an async generator of
+``--rows`` vitals, isolating the export pipeline from the database.
+``--source db`` seeds a patient and downloads
+GET /api/doctor/patients/{id}/export through the ASGI app. Use it with
+--mongo-url: mongomock keeps the whole collection (and a copy per query)
+in this process, which swamps the measurement.
+
+RSS is sampled from /proc/self/status every few ms while the export runs
+and is reported as growth over the pre-export baseline.
+``--materialized`` also measures the old approach: load every row into a
+list, then serialize it in one go.
+
+    cd app/backend
+    python benchmarks/bench_export.py --rows 1000000
+    python benchmarks/bench_export.py --source db --rows 1000000 --mongo-url mongodb://localhost:27017
+"""
+import argparse
+import asyncio
+import json
+import random
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+
+from harness import BACKEND_DIR  # noqa: F401  (puts the backend on sys.path)
+
+from services.exportService import encode_csv, encode_ndjson, encode_parquet  # noqa: E402
+
+
+def rss_mb() -> float:
+    with open("/proc/self/status") as status:
+        for line in status:
+            if line.startswith("VmRSS:"):
+                return int(line.split()[1]) / 1024
+    return 0.0
+
+
+class PeakRss:
+    def __init__(self, interval: float = 0.005):
+        self.interval = interval
+        self.peak = 0.0
+        self._stop = threading.Event()
+
+    def _sample(self):
+        while not self._stop.is_set():
+            self.peak = max(self.peak, rss_mb())
+            time.sleep(self.interval)
+
+    def __enter__(self):
+        self.baseline = rss_mb()
+        self.peak = self.baseline
+        self._thread = threading.Thread(target=self._sample, daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+
+
+def vital(user_id: str, i: int, base: datetime) -> dict:
+    return {
+        "id": str(uuid.uuid4()),
+        "user_id": user_id,
+        "heart_rate": random.randint(55, 110),
+        "blood_pressure_systolic": random.randint(105, 150),
+        "blood_pressure_diastolic": random.randint(65, 95),
+        "temperature": round(random.uniform(36.0, 38.0), 1),
+        "oxygen_saturation": random.randint(92, 100),
+        "sleep_hours": round(random.uniform(4, 9), 1),
+        "activity_minutes": random.randint(0, 90),
+        "notes": None,
+        "timestamp": base + timedelta(minutes=i),
+    }
+
+
+async def synthetic_rows(n: int):
+    base = datetime(2024, 1, 1, tzinfo=timezone.utc)
+    for i in range(n):
+        row = vital("bench", i, base)
+        row["record"] = "vital"
+        yield row
+
+
+async def measure(label: str, body) -> str:
+    total = 0
+    started = time.perf_counter()
+    with PeakRss() as rss:
+        async for chunk in body:
+            total += len(chunk)
+    elapsed = time.perf_counter() - started
+    return (f"{label:12} {total / 1e6:9.1f} MB out in {elapsed:6.1f}s   "
+            f"RSS +{rss.peak - rss.baseline:7.1f} MB (baseline {rss.baseline:.0f} MB)")
+
+
+async def materialized(n: int) -> str:
+    started = time.perf_counter()
+    with PeakRss() as rss:
+        rows = [row async for row in synthetic_rows(n)]
+        total = len(json.dumps(rows).encode())
+        del rows
+    return (f"{'materialized':12} {total / 1e6:9.1f} MB out in {time.perf_counter() - started:6.1f}s   "
+            f"RSS +{rss.peak - rss.baseline:7.1f} MB (baseline {rss.baseline:.0f} MB)")
+
+
+async def bench_synthetic(args):
+    encoders = {"ndjson": encode_ndjson, "csv": encode_csv, "parquet": encode_parquet}
+    if "parquet" in args.formats:
+        import pyarrow.parquet  # noqa: F401  (~50 MB of import belongs in the baseline, not the export)
+    for fmt in args.formats:
+        print(await measure(fmt, encoders[fmt](synthetic_rows(args.rows))))
+    if args.materialized:
+        print(await materialized(args.rows))
+
+
+async def bench_db(args):
+    from harness import client, create_user, load_app
+
+    server = load_app(args.mongo_url)
+    doctor = await create_user(server, "doctor")
+    patient = await create_user(server)
+    user_id = patient["user"]["id"]
+    base = datetime(2024, 1, 1, tzinfo=timezone.utc)
+    for start in range(0, args.rows, 10000):
+        await server.db.vitals.insert_many([vital(user_id, i, base) for i in range(start, min(start + 10000, args.rows))])
+    print(f"seeded {args.rows} vitals")
+
+    async with client(server) as http:
+        for fmt in args.formats:
+            async def body():
+                async with http.stream("GET", f"/api/doctor/patients/{user_id}/export",
+                                       params={"format": fmt}, headers=doctor["headers"]) as response:
+                    response.raise_for_status()
+                    async for chunk in response.aiter_bytes():
+                        yield chunk
+            print(await measure(fmt, body()))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--source", choices=["synthetic", "db"], default="synthetic")
+    parser.add_argument("--formats", default="ndjson,csv,parquet")
+    parser.add_argument("--materialized", action="store_true", help="also measure list-then-serialize")
+    parser.add_argument("--mongo-url", default=None, help="real MongoDB for --source db; defaults to mongomock-motor")
+    args = parser.parse_args()
+    args.formats = [f.strip() for f in args.formats.split(",") if f.strip()]
+    print(f"rows={args.rows} source={args.source}")
+    asyncio.run(bench_db(args) if args.source == "db" else bench_synthetic(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+"""Google token store: refresh calls under a burst of requests.
+
+Connects users through the real callback flow against the mock OAuth
+server, expires their access tokens, then fires ``--burst`` concurrent
+token lookups per user. With single-flight refresh the mock token endpoint
+should see exactly one refresh per user; a later burst should be served
+entirely from the in-memory cache.
+
+    cd app/backend
+    python benchmarks/bench_google_tokens.py --users 50 --burst 100
+"""
+import argparse
+import asyncio
+import os
+import time
+import urllib.parse
+
+from harness import client, create_user, load_app
+from mock_fit_server import MockFitServer
+
+
+async def bench(args, fit: MockFitServer):
+    server = load_app(args.mongo_url)
+    users = [await create_user(server) for _ in range(args.users)]
+
+    async with client(server) as http:
+        for u in users:
+            response = await http.post("/api/google/connect", headers=u["headers"])
+            state = urllib.parse.parse_qs(urllib.parse.urlparse(response.json()["url"]).query)["state"][0]
+            response = await http.get("/auth/oauth2callback", params={"code": "bench", "state": state})
+            assert response.status_code in (302, 307), response.text
+        exchanges = fit.stats["token_requests"]
+        stored = await server.db.users.count_documents({"google_refresh_token": {"$exists": True}})
+        print(f"connect: {exchanges} code exchanges, {stored}/{args.users} users hold a refresh token")
+
+        # Expire every access token, in the db and the in-memory cache
+        for u in users:
+            await server.google_tokens.invalidate(u["user"]["id"])
+
+        store = server.google_tokens
+        started = time.perf_counter()
+        await asyncio.gather(*(
+            store.get_access_token(u["user"]["id"]) for u in users for _ in range(args.burst)
+        ))
+        elapsed = time.perf_counter() - started
+        refreshes = fit.stats["token_requests"] - exchanges
+        print(f"expired burst: {args.users * args.burst} lookups in {elapsed * 1000:.0f} ms, "
+              f"{refreshes} refresh calls ({args.users} expected)")
+
+        before = fit.stats["token_requests"]
+        started = time.perf_counter()
+        await asyncio.gather(*(
+            store.get_access_token(u["user"]["id"]) for u in users for _ in range(args.burst)
+        ))
+        elapsed = time.perf_counter() - started
+        print(f"warm burst:    {args.users * args.burst} lookups in {elapsed * 1000:.0f} ms, "
+              f"{fit.stats['token_requests'] - before} refresh calls")
+
+        response = await http.get("/api/vitals/wearable", params={"metrics": "steps"}, headers=users[0]["headers"])
+        print(f"wearable endpoint with stored token: {response.status_code}")
+        print(f"store stats: {store.stats()}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=50)
+    parser.add_argument("--burst", type=int, default=100)
+    parser.add_argument("--latency-ms", type=float, default=50, help="simulated Google token endpoint latency")
+    parser.add_argument("--mongo-url", default=None, help="real MongoDB; defaults to mongomock-motor")
+    args = parser.parse_args()
+    with MockFitServer(latency_ms=args.latency_ms) as fit:
+        os.environ["GOOGLE_FIT_BASE_URL"] = fit.fit_url
+        os.environ["GOOGLE_TOKEN_URL"] = f"{fit.base_url}/token"
+        os.environ["FIT_SCHEDULER_ENABLED"] = "false"
+        asyncio.run(bench(args, fit))
+
+
+if __name__ == "__main__":
+    main()
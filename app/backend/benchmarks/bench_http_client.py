@@ -0,0 +1,71 @@
+"""Google Fit fetch latency and connection count: client-per-call vs. the shared pooled client.
+
+Starts the local mock Fit server and issues the same aggregate request
+through (a) a fresh httpx.AsyncClient per call, as googleFitService used
+to, and (b) the application-lifetime client from httpClientService.
+
+    cd app/backend
+    python benchmarks/bench_http_client.py --requests 500 --concurrency 20 --latency-ms 20
+"""
+import argparse
+import asyncio
+import statistics
+import time
+
+import httpx
+
+from harness import BACKEND_DIR  # noqa: F401  (puts the backend on sys.path)
+from mock_fit_server import MockFitServer
+
+from services import httpClientService  # noqa: E402
+from services.googleFitService import STEPS_AGGREGATE_BODY  # noqa: E402
+
+
+async def per_call(url: str, headers: dict):
+    async with httpx.AsyncClient() as client:
+        response = await client.post(url, json=STEPS_AGGREGATE_BODY, headers=headers)
+        response.raise_for_status()
+
+
+async def shared(url: str, headers: dict):
+    response = await httpClientService.request_with_retry("POST", url, json=STEPS_AGGREGATE_BODY, headers=headers)
+    response.raise_for_status()
+
+
+async def run(mode, fn, server: MockFitServer, args) -> str:
+    url = f"{server.fit_url}/dataset:aggregate"
+    headers = {"Authorization": "Bearer bench"}
+    semaphore = asyncio.Semaphore(args.concurrency)
+    latencies = []
+    server.stats["connections"].clear()
+
+    async def one():
+        async with semaphore:
+            started = time.perf_counter()
+            await fn(url, headers)
+            latencies.append((time.perf_counter() - started) * 1000)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(one() for _ in range(args.requests)))
+    elapsed = time.perf_counter() - started
+    await httpClientService.close_http_client()
+    latencies.sort()
+    return (f"{mode:9} {args.requests / elapsed:8.1f} req/s  "
+            f"p50 {statistics.median(latencies):7.2f} ms  p95 {latencies[int(len(latencies) * 0.95) - 1]:7.2f} ms  "
+            f"connections {len(server.stats['connections'])}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=500)
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--latency-ms", type=float, default=20, help="simulated Google processing time")
+    args = parser.parse_args()
+    with MockFitServer(latency_ms=args.latency_ms) as server:
+        print(f"requests={args.requests} concurrency={args.concurrency} server latency={args.latency_ms}ms")
+        print(asyncio.run(run("per-call", per_call, server, args)))
+        print(asyncio.run(run("shared", shared, server, args)))
+
+
+if __name__ == "__main__":
+    main()
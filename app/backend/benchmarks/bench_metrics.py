@@ -0,0 +1,132 @@
+"""Cost of the /metrics instrumentation, and what it reports.
+
+The same load runs twice, in fresh processes with METRICS_ENABLED=false
+and =true: ``--requests`` GET /api/vitals plus as many POST /api/vitals,
+``--concurrency`` at a time. Throughput and p50/p99 latency are compared.
+The instrumented run then registers and logs in a user (so bcrypt shows
+up) and scrapes /metrics. It prints per-route latency and each route's
+mean time per stage, plus the event-loop lag gauge.
+
+Mongo command timings come from a pymongo CommandListener, so they only
+appear against a real MongoDB (``--mongo-url``), not mongomock.
+
+    cd app/backend
+    python benchmarks/bench_metrics.py --requests 2000
+"""
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import time
+from collections import defaultdict
+
+
+async def run(args):
+    from harness import client, create_user, load_app
+
+    os.environ.setdefault("FIT_SCHEDULER_ENABLED", "false")
+    os.environ.setdefault("PASSWORD_EXECUTOR", "thread")
+    server = load_app(args.mongo_url)
+    server.loop_lag.start()
+    patients = [await create_user(server) for _ in range(args.patients)]
+    latencies = []
+    semaphore = asyncio.Semaphore(args.concurrency)
+
+    async with client(server) as http:
+        async def one(i):
+            headers = patients[i % len(patients)]["headers"]
+            async with semaphore:
+                started = time.perf_counter()
+                if i % 2:
+                    response = await http.get("/api/vitals?limit=20", headers=headers)
+                else:
+                    response = await http.post("/api/vitals", json={"heart_rate": 60 + i % 40}, headers=headers)
+                latencies.append(time.perf_counter() - started)
+                response.raise_for_status()
+
+        started = time.perf_counter()
+        await asyncio.gather(*(one(i) for i in range(args.requests * 2)))
+        elapsed = time.perf_counter() - started
+        latencies.sort()
+        result = {"rps": len(latencies) / elapsed, "p50": latencies[len(latencies) // 2] * 1000,
+                  "p99": latencies[int(len(latencies) * 0.99)] * 1000}
+
+        if server.METRICS_ENABLED:
+            account = {"email": "metrics@example.com", "password": "correct horse", "full_name": "Metrics", "role": "patient"}
+            (await http.post("/api/auth/register", json=account)).raise_for_status()
+            (await http.post("/api/auth/login", json={"email": account["email"], "password": account["password"]})).raise_for_status()
+            await asyncio.sleep(1.2)  # let the loop-lag probe report
+            scrape = await http.get("/metrics")
+            scrape.raise_for_status()
+            result["metrics"] = scrape.text
+    await server.loop_lag.stop()
+    print(json.dumps(result))
+
+
+def summarize(text: str):
+    from prometheus_client.parser import text_string_to_metric_families
+
+    routes = defaultdict(dict)
+    stages = defaultdict(dict)
+    lag = None
+    for family in text_string_to_metric_families(text):
+        for sample in family.samples:
+            labels = sample.labels
+            if family.name == "carecompanion_http_request_duration_seconds" and sample.name.endswith(("_sum", "_count")):
+                key = (labels["method"], labels["route"], labels["status"])
+                routes[key][sample.name.rsplit("_", 1)[1]] = sample.value
+            elif family.name == "carecompanion_http_request_stage_seconds" and sample.name.endswith(("_sum", "_count")):
+                stages[labels["route"]].setdefault(labels["stage"], {})[sample.name.rsplit("_", 1)[1]] = sample.value
+            elif family.name == "carecompanion_event_loop_lag_seconds":
+                lag = sample.value
+    print("\nper-route latency (mean) and mean time per stage:")
+    for (method, route, status), v in sorted(routes.items()):
+        parts = [f"{stage} {s['sum'] / s['count'] * 1000:.2f} ms" for stage, s in sorted(stages[route].items())]
+        print(f"  {method:4} {route:32} {status}  n={int(v['count']):5d}  {v['sum'] / v['count'] * 1000:7.2f} ms  "
+              f"{', '.join(parts)}")
+    print(f"event loop lag gauge: {lag * 1000:.2f} ms" if lag is not None else "event loop lag gauge: not reported")
+
+
+def timed_cost():
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    from services.metricsService import timed
+
+    n = 200000
+    started = time.perf_counter()
+    for _ in range(n):
+        with timed("auth", "get_current_user"):
+            pass
+    return (time.perf_counter() - started) / n * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=2000, help="GETs and POSTs each")
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--patients", type=int, default=50)
+    parser.add_argument("--mongo-url", default=None, help="real MongoDB; defaults to mongomock-motor")
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.child:
+        asyncio.run(run(args))
+        return
+
+    results = {}
+    for enabled in ("false", "true"):
+        env = {**os.environ, "METRICS_ENABLED": enabled}
+        out = subprocess.run([sys.executable, __file__, "--child", *sys.argv[1:]], env=env,
+                             capture_output=True, text=True, check=True).stdout
+        results[enabled] = json.loads(out.strip().splitlines()[-1])
+    for enabled, label in (("false", "metrics off"), ("true", "metrics on ")):
+        r = results[enabled]
+        print(f"{label}  {r['rps']:7.0f} req/s  p50 {r['p50']:7.2f} ms  p99 {r['p99']:7.2f} ms")
+    off, on = results["false"], results["true"]
+    print(f"throughput change with metrics on: {(on['rps'] / off['rps'] - 1) * 100:+.1f}%")
+    print(f"timed() block cost: {timed_cost():.2f} us")
+    summarize(on["metrics"])
+
+
+if __name__ == "__main__":
+    main()
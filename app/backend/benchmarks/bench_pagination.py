@@ -0,0 +1,92 @@
+"""Paging a long vitals history: keyset cursors vs. skip/limit, and projection payload size.
+
+Seeds one patient with ``--vitals`` readings (with duplicate timestamps
+to exercise the id tie-breaker), walks GET /api/vitals page by page via
+X-Next-Cursor and checks every reading comes back exactly once. It then
+times fetching the deepest page with keyset vs. skip/limit straight
+against the collection, and compares response bytes for a full page vs.
+``fields=heart_rate``. Index-backed timings need --mongo-url; mongomock
+scans either way.
+
+    cd app/backend
+    python benchmarks/bench_pagination.py --vitals 20000 --page-size 200 --mongo-url mongodb://localhost:27017
+"""
+import argparse
+import asyncio
+import random
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+
+from harness import client, create_user, load_app
+
+
+async def bench(args):
+    server = load_app(args.mongo_url)
+    from services.indexService import ensure_indexes
+    from services.paginationService import encode_cursor, fetch_page
+
+    await ensure_indexes(server.db)
+    patient = await create_user(server)
+    user_id = patient["user"]["id"]
+    base = datetime.now(timezone.utc)
+    docs = [{
+        "id": str(uuid.uuid4()),
+        "user_id": user_id,
+        "heart_rate": random.randint(55, 110),
+        "oxygen_saturation": random.randint(92, 100),
+        "notes": "x" * 40,
+        # Pairs of readings share a timestamp
+        "timestamp": base - timedelta(minutes=i // 2),
+    } for i in range(args.vitals)]
+    await server.db.vitals.insert_many(docs)
+
+    async with client(server) as http:
+        seen, pages, cursor = [], 0, None
+        started = time.perf_counter()
+        while True:
+            params = {"limit": args.page_size, **({"cursor": cursor} if cursor else {})}
+            response = await http.get("/api/vitals", params=params, headers=patient["headers"])
+            response.raise_for_status()
+            seen += [v["id"] for v in response.json()]
+            pages += 1
+            cursor = response.headers.get("x-next-cursor")
+            if not cursor:
+                break
+        elapsed = time.perf_counter() - started
+        print(f"walked {pages} pages in {elapsed:.2f}s: {len(seen)} readings, "
+              f"{len(set(seen))} unique, complete={set(seen) == {d['id'] for d in docs}}")
+
+        full = await http.get("/api/vitals", params={"limit": args.page_size}, headers=patient["headers"])
+        slim = await http.get("/api/vitals", params={"limit": args.page_size, "fields": "heart_rate"},
+                              headers=patient["headers"])
+        print(f"page bytes: full {len(full.content)}, fields=heart_rate {len(slim.content)}")
+
+    # Deepest page: keyset seeks from the cursor, skip/limit walks past everything before it
+    query = {"user_id": user_id}
+    sort = [("timestamp", -1), ("id", -1)]
+    before_last = await server.db.vitals.find(query, {"_id": 0}).sort(sort).skip(args.vitals - args.page_size - 1).limit(1).to_list(1)
+    deep_cursor = encode_cursor(before_last[0]["timestamp"], before_last[0]["id"])
+    started = time.perf_counter()
+    for _ in range(args.repeat):
+        await fetch_page(server.db.vitals, query, "timestamp", args.page_size, deep_cursor)
+    keyset = (time.perf_counter() - started) / args.repeat * 1000
+    started = time.perf_counter()
+    for _ in range(args.repeat):
+        await server.db.vitals.find(query, {"_id": 0}).sort(sort).skip(args.vitals - args.page_size).limit(args.page_size).to_list(args.page_size)
+    skip = (time.perf_counter() - started) / args.repeat * 1000
+    print(f"deepest page: keyset {keyset:.2f} ms, skip/limit {skip:.2f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--vitals", type=int, default=5000)
+    parser.add_argument("--page-size", type=int, default=200)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--mongo-url", default=None, help="real MongoDB; defaults to mongomock-motor")
+    args = parser.parse_args()
+    asyncio.run(bench(args))
+
+
+if __name__ == "__main__":
+    main()
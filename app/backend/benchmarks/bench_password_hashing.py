@@ -0,0 +1,86 @@
+"""Login throughput and event-loop lag: bcrypt inline vs. offloaded.
+
+Simulates a login storm by verifying passwords from many concurrent
+coroutines while a probe task measures how late the event loop wakes up.
+
+    cd app/backend
+    python benchmarks/bench_password_hashing.py --rounds 12 --logins 200 --concurrency 50
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from services.passwordService import PasswordHasher, hash_password_sync, verify_password_sync  # noqa: E402
+
+
+async def probe_lag(samples: list, stop: asyncio.Event, interval: float = 0.01):
+    loop = asyncio.get_running_loop()
+    while not stop.is_set():
+        start = loop.time()
+        await asyncio.sleep(interval)
+        samples.append((loop.time() - start - interval) * 1000)
+
+
+async def run(mode: str, args, hashed: str) -> dict:
+    hasher = None if mode == "inline" else PasswordHasher(
+        mode=mode, workers=args.workers, max_pending=args.logins, rounds=args.rounds
+    )
+    if hasher:
+        # Warm the pool so worker startup isn't billed to the first logins
+        await asyncio.gather(*(hasher.verify("warmup", hashed) for _ in range(args.workers)))
+
+    semaphore = asyncio.Semaphore(args.concurrency)
+
+    async def login():
+        async with semaphore:
+            if hasher:
+                assert await hasher.verify(args.password, hashed)
+            else:
+                assert verify_password_sync(args.password, hashed)
+
+    lag: list = []
+    stop = asyncio.Event()
+    probe = asyncio.create_task(probe_lag(lag, stop))
+    await asyncio.sleep(0.05)
+    started = time.perf_counter()
+    await asyncio.gather(*(login() for _ in range(args.logins)))
+    elapsed = time.perf_counter() - started
+    stop.set()
+    await probe
+    if hasher:
+        hasher.shutdown()
+
+    lag.sort()
+    return {
+        "mode": mode,
+        "logins_per_sec": round(args.logins / elapsed, 1),
+        "lag_p50_ms": round(statistics.median(lag), 2) if lag else None,
+        "lag_p99_ms": round(lag[int(len(lag) * 0.99) - 1], 2) if lag else None,
+        "lag_max_ms": round(lag[-1], 2) if lag else None,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rounds", type=int, default=12, help="bcrypt cost factor")
+    parser.add_argument("--logins", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 2)
+    parser.add_argument("--modes", default="inline,thread,process")
+    parser.add_argument("--password", default="correct horse battery staple")
+    args = parser.parse_args()
+
+    hashed = hash_password_sync(args.password, args.rounds)
+    print(f"bcrypt rounds={args.rounds} logins={args.logins} concurrency={args.concurrency} workers={args.workers}")
+    for mode in args.modes.split(","):
+        result = asyncio.run(run(mode.strip(), args, hashed))
+        print("  ".join(f"{k}={v}" for k, v in result.items()))
+
+
+if __name__ == "__main__":
+    main()
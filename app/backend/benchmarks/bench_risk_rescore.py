@@ -0,0 +1,111 @@
+"""Population risk re-scoring throughput (patients/sec).
+
+Default mode uses an in-memory stand-in: vitals are generated in Python,
+reduced to the latest reading per patient (what the $group stage returns)
+and scored both one patient at a time with RiskEngine.score_window and in
+NumPy chunks with score_chunk. Results are checked for equality.
+
+With --mongo-url the vitals are loaded into a scratch database and
+rescore_population runs end to end (aggregation stream + bulk writes).
+
+    cd app/backend
+    python benchmarks/bench_risk_rescore.py --sizes 10000,100000,1000000
+    python benchmarks/bench_risk_rescore.py --mongo-url mongodb://localhost:27017 --sizes 10000,100000
+"""
+import argparse
+import asyncio
+import random
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+
+from harness import BACKEND_DIR  # noqa: F401  (puts the backend on sys.path)
+
+from services.indexService import ensure_indexes  # noqa: E402
+from services.riskEngineService import RiskEngine  # noqa: E402
+from services.riskRescoreService import RESCORE_CHUNK_SIZE, rescore_population, score_chunk  # noqa: E402
+
+
+def generate_vitals(n: int, per_patient: int):
+    base = datetime(2026, 1, 1, tzinfo=timezone.utc)
+    patients = [str(uuid.uuid4()) for _ in range(max(1, n // per_patient))]
+    for i in range(n):
+        yield {
+            "id": str(uuid.uuid4()),
+            "user_id": patients[i % len(patients)],
+            "heart_rate": random.randint(45, 125),
+            "blood_pressure_systolic": random.randint(95, 170),
+            "blood_pressure_diastolic": random.randint(55, 105),
+            "temperature": round(random.uniform(35.5, 39.0), 1),
+            "oxygen_saturation": random.randint(88, 100),
+            "sleep_hours": round(random.uniform(3, 10), 1) if random.random() > 0.2 else None,
+            "activity_minutes": random.randint(0, 120),
+            "notes": None,
+            "timestamp": base + timedelta(seconds=i),
+        }
+
+
+def bench_in_memory(n: int, per_patient: int, chunk_size: int):
+    latest = {}
+    for v in generate_vitals(n, per_patient):
+        latest[v["user_id"]] = v
+    rows = list(latest.values())
+
+    engine = RiskEngine(db=None)
+    started = time.perf_counter()
+    scalar = [{"user_id": v["user_id"], **engine.score_window([v])} for v in rows]
+    scalar_elapsed = time.perf_counter() - started
+
+    started = time.perf_counter()
+    vector = []
+    for i in range(0, len(rows), chunk_size):
+        vector += score_chunk(rows[i:i + chunk_size])
+    vector_elapsed = time.perf_counter() - started
+
+    assert scalar == vector, "vectorized scores diverge from RiskEngine"
+    print(f"vitals={n:>9} patients={len(rows):>8}  "
+          f"scalar {len(rows) / scalar_elapsed:>10.0f} patients/s  "
+          f"numpy {len(rows) / vector_elapsed:>10.0f} patients/s  "
+          f"({scalar_elapsed / vector_elapsed:.1f}x)")
+
+
+async def bench_mongo(url: str, n: int, per_patient: int, chunk_size: int):
+    from motor.motor_asyncio import AsyncIOMotorClient
+    client = AsyncIOMotorClient(url)
+    db = client[f"rescore_bench_{uuid.uuid4().hex[:8]}"]
+    try:
+        await ensure_indexes(db)
+        batch = []
+        for v in generate_vitals(n, per_patient):
+            batch.append(v)
+            if len(batch) == 10000:
+                await db.vitals.insert_many(batch, ordered=False)
+                batch = []
+        if batch:
+            await db.vitals.insert_many(batch, ordered=False)
+        result = await rescore_population(db, chunk_size=chunk_size)
+        print(f"vitals={n:>9} patients={result['patients']:>8}  end-to-end {result['patients_per_sec']:>10.0f} patients/s  "
+              f"({result['seconds']}s, levels={result['levels']})")
+    finally:
+        await client.drop_database(db.name)
+        client.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", default="10000,100000,1000000", help="comma-separated vitals counts")
+    parser.add_argument("--per-patient", type=int, default=10, help="vitals per patient")
+    parser.add_argument("--chunk-size", type=int, default=RESCORE_CHUNK_SIZE)
+    parser.add_argument("--mongo-url", default=None, help="real MongoDB; defaults to the in-memory stand-in")
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+    random.seed(args.seed)
+    for n in (int(s) for s in args.sizes.split(",")):
+        if args.mongo_url:
+            asyncio.run(bench_mongo(args.mongo_url, n, args.per_patient, args.chunk_size))
+        else:
+            bench_in_memory(n, args.per_patient, args.chunk_size)
+
+
+if __name__ == "__main__":
+    main()
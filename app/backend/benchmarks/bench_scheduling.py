@@ -0,0 +1,147 @@
+"""Appointment booking: double-booking under concurrency, availability, renames and the slot backfill.
+
+1. ``--racers`` concurrent POST /api/appointments for the same doctor and
+   slot. Exactly one should get 200 and the rest 409.
+2. ``--bookings`` concurrent bookings spread over ``--doctors`` doctors and
+   a week of slots. It reports p50/p99 latency and checks that no doctor
+   or patient ends up with two appointments in one slot.
+3. GET /api/doctors/{id}/availability must leave out every booked slot.
+4. A doctor and a patient rename themselves through PATCH /api/users/me.
+   The names copied onto appointments and panel summaries must follow.
+5. A claim orphaned by a "crashed" booking is reclaimed by the next
+   booking. ``rebuild`` then backfills claims for appointments written
+   before the slot index existed, including a legacy double booking.
+
+    cd app/backend
+    python benchmarks/bench_scheduling.py --bookings 500
+"""
+import argparse
+import asyncio
+import os
+import random
+import statistics
+import time
+import uuid
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+
+from harness import client, create_user, load_app
+
+
+def next_monday_9am() -> datetime:
+    now = datetime.now(timezone.utc)
+    day = (now + timedelta(days=7 - now.weekday())).replace(hour=9, minute=0, second=0, microsecond=0)
+    return day
+
+
+async def book(http, headers, patient, doctor, when):
+    started = time.perf_counter()
+    response = await http.post("/api/appointments", headers=headers, json={
+        "patient_id": patient["user"]["id"], "doctor_id": doctor["user"]["id"],
+        "scheduled_time": when.isoformat(), "reason": "check-up",
+    })
+    return response, time.perf_counter() - started
+
+
+async def bench(args):
+    os.environ.setdefault("FIT_SCHEDULER_ENABLED", "false")
+    server = load_app(args.mongo_url)
+    from services.indexService import ensure_indexes
+    from services.schedulingService import slot_of
+
+    await ensure_indexes(server.db)
+    doctors = [await create_user(server, role="doctor", full_name=f"Dr. Slot {i}") for i in range(args.doctors)]
+    patients = [await create_user(server, full_name=f"Patient {i}") for i in range(args.patients)]
+    monday = next_monday_9am()
+    rng = random.Random(7)
+
+    async with client(server) as http:
+        # 1. Everyone wants the same slot
+        doctor = doctors[0]
+        results = await asyncio.gather(*(book(http, doctor["headers"], patients[i % len(patients)], doctor,
+                                              monday + timedelta(minutes=rng.randint(0, 29)))
+                                         for i in range(args.racers)))
+        codes = Counter(r.status_code for r, _ in results)
+        print(f"race for one slot: {args.racers} requests -> {dict(codes)}")
+
+        # 2. Random bookings over a week of working slots
+        slots = [monday + timedelta(days=d, minutes=30 * s) for d in range(5) for s in range(16)]
+        jobs = []
+        for _ in range(args.bookings):
+            doctor = rng.choice(doctors)
+            jobs.append(book(http, doctor["headers"], rng.choice(patients), doctor,
+                             rng.choice(slots) + timedelta(minutes=rng.randint(0, 29))))
+        started = time.perf_counter()
+        results = await asyncio.gather(*jobs)
+        elapsed = time.perf_counter() - started
+        codes = Counter(r.status_code for r, _ in results)
+        latencies = sorted(t for _, t in results)
+        appointments = await server.db.appointments.find({"status": "scheduled"}).to_list(None)
+        by_doctor = Counter((a["doctor_id"], slot_of(a["scheduled_time"])) for a in appointments)
+        by_patient = Counter((a["patient_id"], slot_of(a["scheduled_time"])) for a in appointments)
+        print(f"{args.bookings} random bookings in {elapsed:.2f}s: {dict(codes)}, p50 "
+              f"{statistics.median(latencies) * 1000:.1f} ms, p99 {latencies[int(len(latencies) * 0.99)] * 1000:.1f} ms")
+        print(f"double-booked doctor slots: {sum(1 for c in by_doctor.values() if c > 1)}, "
+              f"patient slots: {sum(1 for c in by_patient.values() if c > 1)}")
+
+        # 3. Availability
+        doctor = doctors[1]
+        response = await http.get(f"/api/doctors/{doctor['user']['id']}/availability",
+                                  params={"start": monday.isoformat(), "end": (monday + timedelta(days=5)).isoformat()},
+                                  headers=patients[0]["headers"])
+        response.raise_for_status()
+        body = response.json()
+        booked = {slot_of(a["scheduled_time"]) for a in appointments if a["doctor_id"] == doctor["user"]["id"]}
+        offered = {datetime.fromisoformat(s) for s in body["free"]}
+        print(f"availability: {len(body['free'])} free + {body['booked']} booked of {len(slots)} working slots, "
+              f"booked slots offered as free: {len(offered & booked)}")
+
+        # 4. Renames
+        patient = next(p for p in patients if any(a["patient_id"] == p["user"]["id"] for a in appointments))
+        for user, name in ((doctor, "Dr. Renamed"), (patient, "Renamed Patient")):
+            (await http.patch("/api/users/me", json={"full_name": name}, headers=user["headers"])).raise_for_status()
+        while server.scheduler.stats()["refreshes_running"]:
+            await asyncio.sleep(0.01)
+        stale_doctor = await server.db.appointments.count_documents(
+            {"doctor_id": doctor["user"]["id"], "doctor_name": {"$ne": "Dr. Renamed"}})
+        stale_patient = await server.db.appointments.count_documents(
+            {"patient_id": patient["user"]["id"], "patient_name": {"$ne": "Renamed Patient"}})
+        summary = await server.db.patient_summaries.find_one({"id": patient["user"]["id"]})
+        print(f"after renames: stale doctor_name {stale_doctor}, stale patient_name {stale_patient}, "
+              f"panel summary name {summary['full_name']!r}, "
+              f"next appointment names {summary['next_appointment'] and summary['next_appointment']['patient_name']!r}")
+
+        # 5. Orphaned claim, then a legacy backfill
+        orphan_slot = monday + timedelta(days=7)
+        await server.db.appointment_slots.insert_one({
+            "appointment_id": str(uuid.uuid4()), "doctor_id": doctors[0]["user"]["id"], "patient_id": "someone",
+            "slot": orphan_slot, "created_at": datetime.now(timezone.utc) - timedelta(minutes=10),
+        })
+        response, _ = await book(http, doctors[0]["headers"], patients[0], doctors[0], orphan_slot)
+        print(f"booking over an orphaned claim: {response.status_code}, reclaimed {server.scheduler.reclaimed}")
+
+        legacy_time = monday + timedelta(days=14)
+        for i in range(2):
+            await server.db.appointments.insert_one({
+                "id": str(uuid.uuid4()), "patient_id": patients[i]["user"]["id"], "patient_name": "x",
+                "doctor_id": doctors[0]["user"]["id"], "doctor_name": "x", "scheduled_time": legacy_time,
+                "reason": "legacy", "status": "scheduled", "created_at": datetime.now(timezone.utc),
+            })
+        print(f"rebuild: {await server.scheduler.rebuild(names=True)}")
+        response, _ = await book(http, doctors[0]["headers"], patients[2], doctors[0], legacy_time)
+        print(f"booking the legacy slot afterwards: {response.status_code}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--racers", type=int, default=50)
+    parser.add_argument("--bookings", type=int, default=500)
+    parser.add_argument("--doctors", type=int, default=5)
+    parser.add_argument("--patients", type=int, default=100)
+    parser.add_argument("--mongo-url", default=None, help="real MongoDB; defaults to mongomock-motor")
+    args = parser.parse_args()
+    asyncio.run(bench(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+"""Worker startup time and memory, with Gemini loaded lazily, preloaded or absent.
+
+Every mode runs in a fresh interpreter, because startup cost only shows up
+once per process:
+
+- ``lazy``: the default. The Gemini SDK is not imported until the first chat.
+- ``preload``: GEMINI_PRELOAD=true. The SDK loads in the background once the
+  lifespan startup finishes, so the worker still serves requests right away.
+- ``degraded``: no GEMINI_API_KEY. The app must boot anyway and answer chat
+  with 503.
+
+For each mode the script prints the time to import ``server``, the time the
+lifespan startup takes, and RSS once startup is done. In lazy mode it also
+times loading the SDK, which is the cost the first chat request now pays,
+and RSS afterwards. Multiply the RSS by the number of uvicorn workers to
+size a host. Runs are repeated ``--runs`` times and the median is kept.
+
+    cd app/backend
+    python benchmarks/bench_startup.py --runs 5
+"""
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+MODES = {
+    "lazy": {},
+    "preload": {"GEMINI_PRELOAD": "true"},
+    # Empty rather than unset so load_dotenv doesn't fill it in from .env
+    "degraded": {"GEMINI_API_KEY": ""},
+}
+
+
+async def child(mode: str):
+    started = time.perf_counter()
+    from harness import client, create_user, load_app
+
+    os.environ.setdefault("FIT_SCHEDULER_ENABLED", "false")
+    server = load_app()
+    imported = time.perf_counter()
+    from services.metricsService import rss_bytes
+
+    result = {"import": imported - started}
+    async with server.app.router.lifespan_context(server.app):
+        result["lifespan"] = time.perf_counter() - imported
+        result["rss_mb"] = rss_bytes() / 2**20
+        result["sdk_imported"] = "google.generativeai" in sys.modules
+        async with client(server) as http:
+            result["root"] = (await http.get("/api/")).json()["message"]
+            if mode == "degraded":
+                patient = await create_user(server)
+                response = await http.post("/api/chat", json={"message": "hello"}, headers=patient["headers"])
+                result["chat_status"] = response.status_code
+        if mode == "lazy":
+            loading = time.perf_counter()
+            await server.gemini_pool.preload()
+            result["first_chat_load"] = time.perf_counter() - loading
+            result["rss_after_load_mb"] = rss_bytes() / 2**20
+    print(json.dumps(result))
+
+
+def run(mode: str) -> dict:
+    env = {**os.environ, **MODES[mode]}
+    out = subprocess.run([sys.executable, __file__, "--child", mode], env=env,
+                         capture_output=True, text=True, check=True).stdout
+    return json.loads(out.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--modes", default=",".join(MODES))
+    parser.add_argument("--child", default=None, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.child:
+        asyncio.run(child(args.child))
+        return
+
+    for mode in args.modes.split(","):
+        runs = [run(mode) for _ in range(args.runs)]
+
+        def median(key):
+            return statistics.median(r[key] for r in runs)
+
+        line = (f"{mode:9} import {median('import') * 1000:6.0f} ms  lifespan {median('lifespan') * 1000:5.0f} ms  "
+                f"RSS {median('rss_mb'):6.1f} MB  SDK imported at startup: {runs[0]['sdk_imported']}")
+        if mode == "lazy":
+            line += (f"\n{'':9} first chat loads the SDK in {median('first_chat_load') * 1000:.0f} ms, "
+                     f"RSS then {median('rss_after_load_mb'):.1f} MB")
+        if mode == "degraded":
+            line += f"\n{'':9} GET /api/ -> {runs[0]['root']!r}, POST /api/chat -> {runs[0]['chat_status']}"
+        print(line)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,63 @@
+"""Vitals ingestion throughput: POST /api/vitals per reading vs. POST /api/vitals/batch.
+
+    cd app/backend
+    python benchmarks/bench_vitals_ingest.py --readings 1000 --batch-size 200
+    python benchmarks/bench_vitals_ingest.py --mongo-url mongodb://localhost:27017
+"""
+import argparse
+import asyncio
+import random
+import time
+
+from harness import client, create_user, load_app
+
+
+def reading(i: int) -> dict:
+    return {
+        "heart_rate": random.randint(55, 110),
+        "blood_pressure_systolic": random.randint(105, 150),
+        "blood_pressure_diastolic": random.randint(65, 95),
+        "temperature": round(random.uniform(36.0, 38.0), 1),
+        "oxygen_saturation": random.randint(92, 100),
+        "sleep_hours": round(random.uniform(4, 9), 1),
+        "activity_minutes": random.randint(0, 90),
+        "notes": f"reading {i}",
+    }
+
+
+async def bench(args):
+    server = load_app(args.mongo_url)
+    readings = [reading(i) for i in range(args.readings)]
+    async with client(server) as http:
+        single = await create_user(server)
+        started = time.perf_counter()
+        for r in readings:
+            resp = await http.post("/api/vitals", json=r, headers=single["headers"])
+            resp.raise_for_status()
+        single_elapsed = time.perf_counter() - started
+
+        batched = await create_user(server)
+        started = time.perf_counter()
+        for i in range(0, len(readings), args.batch_size):
+            resp = await http.post("/api/vitals/batch", json={"items": readings[i:i + args.batch_size]},
+                                   headers=batched["headers"])
+            resp.raise_for_status()
+        batch_elapsed = time.perf_counter() - started
+
+    backend = args.mongo_url or "mongomock (in-memory)"
+    print(f"backend={backend} readings={args.readings} batch_size={args.batch_size}")
+    print(f"single  {single_elapsed:8.3f}s  {args.readings / single_elapsed:10.1f} readings/s")
+    print(f"batch   {batch_elapsed:8.3f}s  {args.readings / batch_elapsed:10.1f} readings/s")
+    print(f"speedup {single_elapsed / batch_elapsed:.1f}x")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--readings", type=int, default=1000)
+    parser.add_argument("--batch-size", type=int, default=200)
+    parser.add_argument("--mongo-url", default=None, help="real MongoDB; defaults to mongomock-motor")
+    asyncio.run(bench(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+"""Chart payloads: raw vitals vs. rollup buckets vs. LTTB downsampling.
+
+Seeds one patient with ``--days`` of readings every ``--every-minutes``.
+It backfills the daily rollups and checks them against a straight Python
+computation. Then it logs one more reading through POST /api/vitals and
+checks that today's bucket picked it up. Finally it reports response
+size and latency for each chart query.
+
+    cd app/backend
+    python benchmarks/bench_vitals_rollup.py --days 365 --every-minutes 30
+"""
+import argparse
+import asyncio
+import random
+import time
+import uuid
+from collections import defaultdict
+from datetime import datetime, timedelta, timezone
+
+from harness import client, create_user, load_app
+
+
+async def timed(http, path, params, headers):
+    started = time.perf_counter()
+    response = await http.get(path, params=params, headers=headers)
+    response.raise_for_status()
+    return response, (time.perf_counter() - started) * 1000
+
+
+async def bench(args):
+    server = load_app(args.mongo_url)
+    patient = await create_user(server)
+    user_id = patient["user"]["id"]
+    end = datetime.now(timezone.utc).replace(minute=0, second=0, microsecond=0)
+    start = end - timedelta(days=args.days)
+    docs, t = [], start
+    while t < end:
+        docs.append({
+            "id": str(uuid.uuid4()),
+            "user_id": user_id,
+            "heart_rate": random.randint(55, 110) if random.random() > 0.1 else None,
+            "temperature": round(random.uniform(36.0, 38.0), 1),
+            "timestamp": t,
+        })
+        t += timedelta(minutes=args.every_minutes)
+    for i in range(0, len(docs), 10000):
+        await server.db.vitals.insert_many(docs[i:i + 10000])
+    print(f"seeded {len(docs)} readings over {args.days} days")
+
+    started = time.perf_counter()
+    await server.rollups.rebuild([user_id])
+    print(f"rollup backfill: {time.perf_counter() - started:.2f}s")
+
+    expected = defaultdict(list)
+    for d in docs:
+        if d["heart_rate"] is not None:
+            expected[d["timestamp"].strftime("%Y-%m-%d")].append(d["heart_rate"])
+    stored = {r["day"]: r["metrics"]["heart_rate"] for r in await server.db.vital_rollups.find({"user_id": user_id}).to_list(None)}
+    mismatches = sum(
+        1 for day, values in expected.items()
+        if (stored[day]["min"], stored[day]["max"], stored[day]["count"]) != (min(values), max(values), len(values))
+    )
+    print(f"daily heart_rate rollups checked against Python: {len(expected)} days, {mismatches} mismatches")
+
+    async with client(server) as http:
+        headers = patient["headers"]
+        response = await http.post("/api/vitals", json={"heart_rate": 200}, headers=headers)
+        response.raise_for_status()
+        response = await http.get("/api/vitals/rollup", params={"bucket": "day", "metrics": "heart_rate",
+                                                                "start": (end - timedelta(days=1)).isoformat(),
+                                                                "end": (datetime.now(timezone.utc) + timedelta(minutes=1)).isoformat()},
+                                  headers=headers)
+        today = response.json()["metrics"]["heart_rate"][-1]
+        print(f"after POST /api/vitals: today's bucket max={today['max']} last={today['last']} (expected 200)")
+
+        raw_bytes, raw_ms, pages, cursor = 0, 0.0, 0, None
+        while True:
+            params = {"limit": 500, **({"cursor": cursor} if cursor else {})}
+            r, ms = await timed(http, "/api/vitals", params, headers)
+            raw_bytes += len(r.content)
+            raw_ms += ms
+            pages += 1
+            cursor = r.headers.get("x-next-cursor")
+            if not cursor:
+                break
+        print(f"raw pages:          {raw_bytes / 1024:9.1f} KB in {pages} requests, {raw_ms:8.1f} ms total")
+        queries = [
+            ("rollup day", "/api/vitals/rollup", {"bucket": "day", "metrics": "heart_rate,temperature",
+                                                  "start": start.isoformat()}),
+            ("rollup week", "/api/vitals/rollup", {"bucket": "week", "metrics": "heart_rate,temperature",
+                                                   "start": start.isoformat()}),
+            ("rollup hour 7d", "/api/vitals/rollup", {"bucket": "hour", "metrics": "heart_rate,temperature"}),
+            ("lttb 500", "/api/vitals/downsample", {"metric": "heart_rate", "points": 500, "start": start.isoformat()}),
+        ]
+        for label, path, params in queries:
+            r, ms = await timed(http, path, params, headers)
+            print(f"{label:19} {len(r.content) / 1024:9.1f} KB in 1 request,  {ms:8.1f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--days", type=int, default=365)
+    parser.add_argument("--every-minutes", type=int, default=60)
+    parser.add_argument("--mongo-url", default=None, help="real MongoDB; defaults to mongomock-motor")
+    args = parser.parse_args()
+    asyncio.run(bench(args))
+
+
+if __name__ == "__main__":
+    main()
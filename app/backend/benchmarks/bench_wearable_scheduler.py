@@ -0,0 +1,67 @@
+"""Background wearable sync against the local mock Fit server.
+
+Creates N connected users and runs one scheduler pass, then a second pass
+straight after (every user should be throttled by their ``fit_next_sync_at``
+claim). A second scheduler, standing in for another uvicorn worker, tries to
+run alongside the first pass and should stand by.
+Reports users/sec, upstream calls and the observed call rate against the
+configured quota. On mongomock every upsert is a collection scan, so the
+backfill defaults to a few days; use --mongo-url and a 30-day backfill to
+measure the production shape.
+
+    cd app/backend
+    python benchmarks/bench_wearable_scheduler.py --users 200 --concurrency 16 --quota-per-minute 6000
+"""
+import argparse
+import asyncio
+import os
+import time
+
+from harness import create_user, load_app
+from mock_fit_server import MockFitServer
+
+
+async def bench(args, fit: MockFitServer):
+    server = load_app(args.mongo_url)
+    from services.wearableSchedulerService import WearableSyncScheduler
+
+    server.fit_sync.backfill_days = args.backfill_days
+    for i in range(args.users):
+        await create_user(server, google_access_token=f"token-{i}")
+    scheduler = WearableSyncScheduler(
+        server.db, server.fit_sync, after_write=server.refresh_after_sync,
+        concurrency=args.concurrency, user_min_interval=600, quota_per_minute=args.quota_per_minute,
+        # Back-to-back passes, so the second one shows the per-user claims
+        interval=0,
+    )
+    other_worker = WearableSyncScheduler(server.db, server.fit_sync, interval=0)
+
+    started = time.perf_counter()
+    _, other_ran = await asyncio.gather(scheduler.run_once(), other_worker.run_once())
+    elapsed = time.perf_counter() - started
+    calls = fit.stats["aggregate_requests"]
+    print(f"pass 1: {args.users} users in {elapsed:.2f}s ({args.users / elapsed:.1f} users/s), "
+          f"{calls} aggregate calls, {calls / elapsed * 60:.0f} calls/min (quota {args.quota_per_minute:.0f})")
+    print(f"        vitals written {scheduler.stats['vitals_written']}, failed {scheduler.stats['failed']}, "
+          f"vitals docs {await server.db.vitals.count_documents({})}, second worker ran a pass: {other_ran}")
+
+    await scheduler.run_once()
+    print(f"pass 2: throttled {scheduler.stats['throttled']}, extra calls {fit.stats['aggregate_requests'] - calls}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--quota-per-minute", type=float, default=6000)
+    parser.add_argument("--backfill-days", type=int, default=3)
+    parser.add_argument("--latency-ms", type=float, default=20)
+    parser.add_argument("--mongo-url", default=None, help="real MongoDB; defaults to mongomock-motor")
+    args = parser.parse_args()
+    with MockFitServer(latency_ms=args.latency_ms) as fit:
+        os.environ["GOOGLE_FIT_BASE_URL"] = fit.fit_url
+        asyncio.run(bench(args, fit))
+
+
+if __name__ == "__main__":
+    main()
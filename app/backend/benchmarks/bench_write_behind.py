@@ -0,0 +1,139 @@
+"""Write-behind ingestion: request latency and Mongo write calls, then durability across an outage.
+
+Part 1 sends ``--requests`` POST /api/vitals (``--concurrency`` at a time)
+twice: once writing straight through and once with the write-behind queue
+on. It reports p50/p99 latency, how many insert calls reached Mongo and
+how long the final flush took (with write-behind on, that is where the
+rollup, panel and risk updates run).
+``--mongo-latency-ms`` adds that much delay to every insert, standing in
+for the network round trip that mongomock (or a local mongod) doesn't
+have.
+
+Part 2 turns write-behind on and makes every insert fail, as in a Mongo
+outage, while ``--outage-requests`` more readings come in. It then shuts
+the queue down so the rest is spilled to disk and checks the spill file
+holds every document. Then it brings Mongo back,
+restarts the queue (which replays the spill) and checks each reading
+landed exactly once.
+
+    cd app/backend
+    python benchmarks/bench_write_behind.py --requests 2000 --mongo-latency-ms 2
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import tempfile
+import time
+
+from harness import client, create_user, load_app
+
+CALLS = {"insert_one": 0, "insert_many": 0}
+STATE = {"latency": 0.0, "outage": False}
+
+
+def instrument(collection_type):
+    # Wraps the driver's insert methods: counts round trips, adds latency, simulates an outage
+    from pymongo.errors import AutoReconnect
+
+    for name in CALLS:
+        original = getattr(collection_type, name)
+
+        def make(original, name):
+            async def wrapper(self, *args, **kwargs):
+                CALLS[name] += 1
+                if STATE["latency"]:
+                    await asyncio.sleep(STATE["latency"])
+                if STATE["outage"]:
+                    raise AutoReconnect("simulated outage")
+                return await original(self, *args, **kwargs)
+            return wrapper
+
+        setattr(collection_type, name, make(original, name))
+
+
+async def run_load(http, patients, requests, concurrency):
+    latencies = []
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one(i):
+        async with semaphore:
+            started = time.perf_counter()
+            response = await http.post("/api/vitals", json={"heart_rate": 60 + i % 50, "oxygen_saturation": 97},
+                                       headers=patients[i % len(patients)]["headers"])
+            latencies.append((time.perf_counter() - started) * 1000)
+            response.raise_for_status()
+
+    await asyncio.gather(*(one(i) for i in range(requests)))
+    latencies.sort()
+    return latencies
+
+
+async def bench(args):
+    os.environ.setdefault("FIT_SCHEDULER_ENABLED", "false")
+    server = load_app(args.mongo_url)
+    instrument(type(server.db.vitals))
+    writes = server.writes
+    writes.spill_path = os.path.join(tempfile.mkdtemp(), "spill.ndjson")
+    patients = [await create_user(server) for _ in range(args.patients)]
+    STATE["latency"] = args.mongo_latency_ms / 1000
+
+    async with client(server) as http:
+        for label, enabled in (("direct", False), ("write-behind", True)):
+            writes.enabled = enabled
+            await writes.start()
+            before = await server.db.vitals.count_documents({})
+            CALLS.update(insert_one=0, insert_many=0)
+            started = time.perf_counter()
+            latencies = await run_load(http, patients, args.requests, args.concurrency)
+            elapsed = time.perf_counter() - started
+            # Generous drain so nothing from this part is left for the spill file. Under write-behind the
+            # rollups, panel and risk updates run here, in the flush hook, rather than in the requests
+            draining = time.perf_counter()
+            await writes.stop(timeout=300)
+            drained = time.perf_counter() - draining
+            stored = await server.db.vitals.count_documents({}) - before
+            print(f"{label:13} p50 {statistics.median(latencies):7.2f} ms  p99 {latencies[int(len(latencies) * 0.99)]:7.2f} ms  "
+                  f"{args.requests / elapsed:7.0f} req/s  insert_one {CALLS['insert_one']:6d}  "
+                  f"insert_many {CALLS['insert_many']:5d}  vitals stored {stored}  drain {drained * 1000:.0f} ms")
+
+        # --- Outage: everything ends up in the spill file, then back in Mongo exactly once ---
+        STATE["latency"] = 0
+        writes.enabled = True
+        writes.write_timeout = 1
+        await writes.start()
+        before = await server.db.vitals.count_documents({})
+        STATE["outage"] = True
+        for i in range(args.outage_requests):
+            response = await http.post("/api/vitals", json={"heart_rate": 70, "notes": f"outage-{i}"},
+                                       headers=patients[i % len(patients)]["headers"])
+            response.raise_for_status()
+        await writes.stop()
+        with open(writes.spill_path) as f:
+            spilled = sum(1 for line in f if '"vitals"' in line)
+        print(f"outage: {args.outage_requests} readings accepted, {spilled} vitals in the spill file, "
+              f"stats {writes.stats()}")
+
+        STATE["outage"] = False
+        await writes.start()
+        await writes.stop()
+        notes = await server.db.vitals.distinct("notes", {"notes": {"$regex": "^outage-"}})
+        stored = await server.db.vitals.count_documents({}) - before
+        print(f"after replay: {stored} vitals stored, {len(notes)} distinct outage readings, "
+              f"spill file left={os.path.exists(writes.spill_path)}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--patients", type=int, default=50)
+    parser.add_argument("--mongo-latency-ms", type=float, default=2.0)
+    parser.add_argument("--outage-requests", type=int, default=300)
+    parser.add_argument("--mongo-url", default=None, help="real MongoDB; defaults to mongomock-motor")
+    args = parser.parse_args()
+    asyncio.run(bench(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,50 @@
+"""Shared setup for the API benchmarks.
+
+``load_app`` imports ``server`` against either a real MongoDB (``mongo_url``)
+or an in-memory mongomock-motor stand-in, and ``client`` returns an httpx
+client that talks to the ASGI app in-process.
+"""
+import os
+import sys
+import uuid
+from datetime import datetime, timezone
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+
+def load_app(mongo_url: str = None, db_name: str = "carecompanion_bench"):
+    os.environ.setdefault("GEMINI_API_KEY", "benchmark")
+    os.environ["DB_NAME"] = db_name
+    if mongo_url:
+        os.environ["MONGO_URL"] = mongo_url
+    else:
+        # Swap the driver before server.py builds its client so every module shares the stand-in
+        import motor.motor_asyncio
+        from mongomock_motor import AsyncMongoMockClient
+        motor.motor_asyncio.AsyncIOMotorClient = AsyncMongoMockClient
+    import server
+    return server
+
+
+def client(server):
+    import httpx
+    return httpx.AsyncClient(transport=httpx.ASGITransport(app=server.app), base_url="http://bench")
+
+
+async def create_user(server, role: str = "patient", **fields) -> dict:
+    # Written straight to the db so benchmarks don't pay for bcrypt unless they mean to
+    user = {
+        "id": str(uuid.uuid4()),
+        "email": f"{uuid.uuid4().hex[:12]}@bench.local",
+        "password": "",
+        "full_name": f"Bench {role.title()}",
+        "role": role,
+        "age": None,
+        "specialization": None,
+        "created_at": datetime.now(timezone.utc),
+        **fields,
+    }
+    await server.db.users.insert_one(dict(user))
+    token = server.create_access_token({"user_id": user["id"], "role": role})
+    return {"user": user, "headers": {"Authorization": f"Bearer {token}"}}
@@ -0,0 +1,398 @@
+"""Repeatable load test of the API, with JSON baselines to compare commits against.
+
+It runs the app in-process (through httpx's ASGI transport, with the
+startup/shutdown hooks) against mongomock-motor, or a real MongoDB with
+``--mongo-url``. Google Fit is served by the local mock Fit server, and
+Gemini by a stub model that blocks for ``--gemini-latency-ms`` like the SDK
+does.
+
+Every run seeds the same data from ``--seed``: doctors, patients booked
+with them, vitals history and bcrypt accounts. It then drives each
+scenario with ``--users`` virtual users in a closed loop. Each virtual
+user picks its next request from the scenario's weighted mix:
+
+    login        login storm: POST /api/auth/login (bcrypt verify)
+    ingest       POST /api/vitals and /api/vitals/batch
+    dashboard    a patient's home screen: vitals, latest risk, day rollups,
+                 appointments, wearable data
+    panel        doctors: GET /api/doctor/panel and a patient's vitals
+    chat         POST /api/chat and /api/chat/stream against the stub model
+    mixed        all of the above, weighted like production traffic
+
+For each endpoint it reports requests/s and p50/p95/p99 latency.
+``--save`` writes them to JSON together with the commit and settings.
+``--compare`` diffs the run against a saved baseline. It exits with
+status 1 if any endpoint's p95 grew, or a scenario's throughput fell, by
+more than ``--max-regression`` percent. Latency changes under
+``--noise-floor-ms`` are ignored.
+
+    cd app/backend
+    python benchmarks/loadtest.py --save benchmarks/baselines/$(git rev-parse --short HEAD).json
+    python benchmarks/loadtest.py --compare benchmarks/baselines/<older>.json
+
+Only compare runs on the same machine with the same arguments. The
+comparison refuses baselines recorded with different settings.
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import time
+import uuid
+from collections import defaultdict
+from datetime import datetime, timedelta, timezone
+from types import SimpleNamespace
+
+from harness import client, create_user, load_app
+from mock_fit_server import MockFitServer
+
+LOGIN_PASSWORD = "load-test-password"
+CHAT_TOPICS = ["my blood pressure", "sleep", "my heart rate this morning", "walking after surgery",
+               "feeling dizzy", "my medication timing", "oxygen levels", "stress", "headaches", "diet"]
+
+
+class StubGeminiModel:
+    """Stands in for genai.GenerativeModel: blocks the worker thread like the SDK does, then answers."""
+
+    def __init__(self, latency_ms: float, chunks: int = 8):
+        self.latency = latency_ms / 1000
+        self.chunks = chunks
+        self.calls = 0
+
+    def generate_content(self, prompt: str, stream: bool = False):
+        self.calls += 1
+        words = f"Here is some general guidance about {prompt[-40:]!r}; please check with your doctor.".split()
+        if not stream:
+            time.sleep(self.latency)
+            return SimpleNamespace(text=" ".join(words))
+        return self._stream(words)
+
+    def _stream(self, words):
+        per_chunk = max(1, len(words) // self.chunks)
+        for i in range(0, len(words), per_chunk):
+            time.sleep(self.latency / self.chunks)
+            yield SimpleNamespace(text=" ".join(words[i:i + per_chunk]) + " ")
+
+
+# --- Seeded data ---
+async def seed(server, args, rng: random.Random) -> dict:
+    from services.passwordService import hash_password_sync
+
+    doctors = [await create_user(server, role="doctor", full_name=f"Dr. Load {i}") for i in range(args.doctors)]
+    patients = [await create_user(server, full_name=f"Patient {i:04d}", age=rng.randint(25, 85),
+                                  google_access_token=f"fit-token-{i}") for i in range(args.patients)]
+    hashed = await asyncio.to_thread(hash_password_sync, LOGIN_PASSWORD)
+    accounts = []
+    for i in range(args.accounts):
+        email = f"load{i}@example.com"
+        await create_user(server, email=email, password=hashed)
+        accounts.append(email)
+
+    now = datetime.now(timezone.utc)
+    panels = defaultdict(list)
+    async with client(server) as http:
+        for i, patient in enumerate(patients):
+            doctor = doctors[i % len(doctors)]
+            panels[doctor["user"]["id"]].append(patient["user"]["id"])
+            response = await http.post("/api/appointments", headers=doctor["headers"], json={
+                "patient_id": patient["user"]["id"], "doctor_id": doctor["user"]["id"],
+                # Distinct 30-minute slots, since a doctor can't be double-booked
+                "scheduled_time": (now + timedelta(days=1, minutes=30 * i)).isoformat(), "reason": "follow-up",
+            })
+            response.raise_for_status()
+            items = [reading(rng, now - timedelta(minutes=rng.randint(1, 14 * 24 * 60))) for _ in range(args.history)]
+            response = await http.post("/api/vitals/batch", headers=patient["headers"], json={"items": items})
+            response.raise_for_status()
+            # Fill the wearable bucket cache, so dashboard reads measure the steady state rather than backfills
+            response = await http.get(f"/api/vitals/wearable?days={args.fit_backfill_days}", headers=patient["headers"])
+            response.raise_for_status()
+    return {"doctors": doctors, "patients": patients, "accounts": accounts, "panels": panels}
+
+
+def reading(rng: random.Random, taken_at: datetime = None) -> dict:
+    item = {
+        "heart_rate": rng.randint(55, 125),
+        "blood_pressure_systolic": rng.randint(105, 165),
+        "blood_pressure_diastolic": rng.randint(65, 100),
+        "temperature": round(rng.uniform(36.2, 38.6), 1),
+        "oxygen_saturation": rng.randint(89, 100),
+    }
+    if taken_at is not None:
+        item["timestamp"] = taken_at.isoformat()
+    return item
+
+
+# --- Requests; each returns (endpoint label, response) ---
+async def login(http, data, rng):
+    email = rng.choice(data["accounts"])
+    return "POST /api/auth/login", await http.post("/api/auth/login", json={"email": email, "password": LOGIN_PASSWORD})
+
+
+async def post_vital(http, data, rng):
+    patient = rng.choice(data["patients"])
+    return "POST /api/vitals", await http.post("/api/vitals", headers=patient["headers"], json=reading(rng))
+
+
+async def post_vitals_batch(http, data, rng):
+    patient = rng.choice(data["patients"])
+    now = datetime.now(timezone.utc)
+    items = [reading(rng, now - timedelta(seconds=30 * i)) for i in range(20)]
+    return "POST /api/vitals/batch", await http.post("/api/vitals/batch", headers=patient["headers"], json={"items": items})
+
+
+async def get_vitals(http, data, rng):
+    patient = rng.choice(data["patients"])
+    return "GET /api/vitals", await http.get("/api/vitals?limit=50", headers=patient["headers"])
+
+
+async def get_risk(http, data, rng):
+    patient = rng.choice(data["patients"])
+    return "GET /api/risk-score/latest", await http.get("/api/risk-score/latest", headers=patient["headers"])
+
+
+async def get_rollup(http, data, rng):
+    patient = rng.choice(data["patients"])
+    return "GET /api/vitals/rollup", await http.get("/api/vitals/rollup?bucket=day", headers=patient["headers"])
+
+
+async def get_appointments(http, data, rng):
+    patient = rng.choice(data["patients"])
+    return "GET /api/appointments", await http.get("/api/appointments?limit=20", headers=patient["headers"])
+
+
+async def get_wearable(http, data, rng):
+    patient = rng.choice(data["patients"])
+    return "GET /api/vitals/wearable", await http.get("/api/vitals/wearable?days=1", headers=patient["headers"])
+
+
+async def get_panel(http, data, rng):
+    doctor = rng.choice(data["doctors"])
+    return "GET /api/doctor/panel", await http.get("/api/doctor/panel?limit=50", headers=doctor["headers"])
+
+
+async def get_patient_vitals(http, data, rng):
+    doctor = rng.choice(data["doctors"])
+    patient_id = rng.choice(data["panels"][doctor["user"]["id"]])
+    return ("GET /api/doctor/patients/{patient_id}/vitals",
+            await http.get(f"/api/doctor/patients/{patient_id}/vitals?limit=100", headers=doctor["headers"]))
+
+
+def chat_message(rng: random.Random) -> str:
+    # A third repeat a common question (response cache), the rest are unique
+    if rng.random() < 0.33:
+        return f"What should I know about {rng.choice(CHAT_TOPICS)}?"
+    return f"Question {uuid.UUID(int=rng.getrandbits(128)).hex[:8]} about {rng.choice(CHAT_TOPICS)}"
+
+
+async def chat(http, data, rng):
+    patient = rng.choice(data["patients"])
+    return "POST /api/chat", await http.post("/api/chat", headers=patient["headers"], json={"message": chat_message(rng)})
+
+
+async def chat_stream(http, data, rng):
+    patient = rng.choice(data["patients"])
+    return ("POST /api/chat/stream",
+            await http.post("/api/chat/stream", headers=patient["headers"], json={"message": chat_message(rng)}))
+
+
+SCENARIOS = {
+    "login": [(1, login)],
+    "ingest": [(9, post_vital), (1, post_vitals_batch)],
+    "dashboard": [(3, get_vitals), (2, get_risk), (2, get_rollup), (2, get_appointments), (1, get_wearable)],
+    "panel": [(3, get_panel), (2, get_patient_vitals)],
+    "chat": [(1, chat), (1, chat_stream)],
+}
+SCENARIOS["mixed"] = [
+    (2, login), (20, post_vital), (2, post_vitals_batch),
+    (10, get_vitals), (6, get_risk), (5, get_rollup), (4, get_appointments), (3, get_wearable),
+    (5, get_panel), (4, get_patient_vitals), (2, chat), (2, chat_stream),
+]
+
+
+# --- Running and reporting ---
+def percentile(sorted_values, q: float) -> float:
+    return sorted_values[min(len(sorted_values) - 1, int(len(sorted_values) * q))]
+
+
+def summarize(samples: dict, errors: dict, elapsed: float) -> dict:
+    endpoints = {}
+    for label in sorted(set(samples) | set(errors)):
+        values = sorted(samples.get(label, []))
+        endpoints[label] = {
+            "requests": len(values),
+            "errors": errors.get(label, 0),
+            "rps": round(len(values) / elapsed, 2),
+            **({f"p{q}_ms": round(percentile(values, q / 100) * 1000, 3) for q in (50, 95, 99)} if values else {}),
+        }
+    total = sum(e["requests"] for e in endpoints.values())
+    return {"seconds": round(elapsed, 2), "requests": total, "rps": round(total / elapsed, 2), "endpoints": endpoints}
+
+
+async def run_scenario(server, data, name: str, args) -> dict:
+    weights, ops = zip(*((w, op) for w, op in SCENARIOS[name]))
+    samples, errors = defaultdict(list), defaultdict(int)
+    recording = False
+
+    async def virtual_user(index: int, http, deadline: float):
+        rng = random.Random(f"{args.seed}:{name}:{index}")
+        while time.perf_counter() < deadline:
+            op = rng.choices(ops, weights)[0]
+            started = time.perf_counter()
+            try:
+                label, response = await op(http, data, rng)
+                failed = response.status_code >= 400 or "event: error" in response.text[:2000]
+            except Exception:
+                label, failed = op.__name__, True
+            if recording:
+                if failed:
+                    errors[label] += 1
+                else:
+                    samples[label].append(time.perf_counter() - started)
+            if args.think_ms:
+                await asyncio.sleep(rng.expovariate(1000 / args.think_ms))
+
+    async with client(server) as http:
+        if args.warmup:
+            deadline = time.perf_counter() + args.warmup
+            await asyncio.gather(*(virtual_user(i, http, deadline) for i in range(args.users)))
+        recording = True
+        started = time.perf_counter()
+        deadline = started + args.duration
+        await asyncio.gather(*(virtual_user(i, http, deadline) for i in range(args.users)))
+        elapsed = time.perf_counter() - started
+    return summarize(samples, errors, elapsed)
+
+
+def print_report(name: str, result: dict):
+    print(f"\n{name}: {result['requests']} requests in {result['seconds']}s, {result['rps']:.1f} req/s")
+    print(f"  {'endpoint':46} {'req/s':>8} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'errors':>7}")
+    for label, e in result["endpoints"].items():
+        print(f"  {label:46} {e['rps']:8.1f} {e.get('p50_ms', 0):9.2f} {e.get('p95_ms', 0):9.2f} "
+              f"{e.get('p99_ms', 0):9.2f} {e['errors']:7d}")
+
+
+SETTINGS = ("users", "duration", "warmup", "think_ms", "seed", "doctors", "patients", "accounts", "history",
+            "gemini_latency_ms", "fit_latency_ms", "fit_backfill_days")
+
+
+def compare(current: dict, baseline: dict, args) -> bool:
+    """Print the differences; True when something regressed beyond --max-regression."""
+    mismatched = [k for k in SETTINGS if baseline["settings"].get(k) != current["settings"].get(k)]
+    if mismatched or baseline["meta"]["mongo"] != current["meta"]["mongo"]:
+        raise SystemExit(f"Baseline was recorded with different settings ({', '.join(mismatched) or 'mongo'}); "
+                         f"rerun with the same arguments")
+    limit = args.max_regression / 100
+    regressed = False
+    print(f"\nagainst baseline {baseline['meta']['commit']} ({baseline['meta']['recorded_at']}):")
+    for name, result in current["scenarios"].items():
+        before = baseline["scenarios"].get(name)
+        if before is None:
+            continue
+        change = result["rps"] / before["rps"] - 1 if before["rps"] else 0.0
+        flag = change < -limit
+        regressed |= flag
+        print(f"  {name:10} throughput {before['rps']:8.1f} -> {result['rps']:8.1f} req/s ({change * 100:+6.1f}%)"
+              f"{'  REGRESSION' if flag else ''}")
+        for label, e in result["endpoints"].items():
+            b = before["endpoints"].get(label)
+            if not b or "p95_ms" not in b or "p95_ms" not in e:
+                continue
+            delta = e["p95_ms"] - b["p95_ms"]
+            change = delta / b["p95_ms"] if b["p95_ms"] else 0.0
+            flag = change > limit and delta > args.noise_floor_ms
+            regressed |= flag
+            print(f"    {label:46} p95 {b['p95_ms']:8.2f} -> {e['p95_ms']:8.2f} ms ({change * 100:+6.1f}%)"
+                  f"{'  REGRESSION' if flag else ''}")
+    return regressed
+
+
+def git_commit() -> str:
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True)
+        dirty = subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"], capture_output=True, text=True)
+        return commit.stdout.strip() + ("-dirty" if dirty.stdout.strip() else "")
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+async def bench(args, fit: MockFitServer) -> dict:
+    os.environ["GOOGLE_FIT_BASE_URL"] = fit.fit_url
+    os.environ.setdefault("FIT_SCHEDULER_ENABLED", "false")
+    server = load_app(args.mongo_url, db_name=f"carecompanion_load_{uuid.uuid4().hex[:8]}")
+    server.gemini_pool.model = StubGeminiModel(args.gemini_latency_ms)
+    server.fit_sync.backfill_days = args.fit_backfill_days
+    async with server.app.router.lifespan_context(server.app):
+        try:
+            rng = random.Random(args.seed)
+            seeded = time.perf_counter()
+            data = await seed(server, args, rng)
+            print(f"seeded {args.doctors} doctors, {args.patients} patients, {args.accounts} accounts "
+                  f"in {time.perf_counter() - seeded:.1f}s")
+            names = list(SCENARIOS) if args.scenario == "all" else args.scenario.split(",")
+            results = {}
+            for name in names:
+                results[name] = await run_scenario(server, data, name, args)
+                print_report(name, results[name])
+        finally:
+            if args.mongo_url:
+                await server.client_db.drop_database(server.db.name)
+    return {
+        "meta": {
+            "commit": git_commit(),
+            "recorded_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "machine": f"{platform.system()} {platform.machine()}, {os.cpu_count()} CPUs",
+            "mongo": "real" if args.mongo_url else "mongomock",
+        },
+        "settings": {k: getattr(args, k) for k in SETTINGS},
+        "scenarios": results,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scenario", default="all", help=f"all, or a comma list of: {', '.join(SCENARIOS)}")
+    parser.add_argument("--users", type=int, default=20, help="concurrent virtual users")
+    parser.add_argument("--duration", type=float, default=15, help="measured seconds per scenario")
+    parser.add_argument("--warmup", type=float, default=2, help="unmeasured seconds before each scenario")
+    parser.add_argument("--think-ms", type=float, default=0, help="mean pause between a user's requests")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--doctors", type=int, default=5)
+    parser.add_argument("--patients", type=int, default=200)
+    parser.add_argument("--accounts", type=int, default=50, help="bcrypt accounts for the login storm")
+    parser.add_argument("--history", type=int, default=50, help="seeded readings per patient")
+    parser.add_argument("--gemini-latency-ms", type=float, default=800)
+    parser.add_argument("--fit-latency-ms", type=float, default=40)
+    parser.add_argument("--fit-backfill-days", type=int, default=3,
+                        help="Google Fit history a first sync pulls; mongomock upserts are scans, so keep it small there")
+    parser.add_argument("--save", help="write the results to this JSON file")
+    parser.add_argument("--compare", help="baseline JSON to compare against")
+    parser.add_argument("--max-regression", type=float, default=25, help="percent; mongomock runs vary by about 20%%")
+    parser.add_argument("--noise-floor-ms", type=float, default=1.0)
+    parser.add_argument("--mongo-url", default=None, help="real MongoDB (a scratch database is created and dropped)")
+    args = parser.parse_args()
+    unknown = [s for s in args.scenario.split(",") if s != "all" and s not in SCENARIOS]
+    if unknown:
+        parser.error(f"unknown scenario: {', '.join(unknown)}")
+
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+    with MockFitServer(latency_ms=args.fit_latency_ms) as fit:
+        current = asyncio.run(bench(args, fit))
+    if args.save:
+        os.makedirs(os.path.dirname(os.path.abspath(args.save)), exist_ok=True)
+        with open(args.save, "w") as f:
+            json.dump(current, f, indent=2)
+        print(f"\nsaved {args.save}")
+    if baseline is not None and compare(current, baseline, args):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
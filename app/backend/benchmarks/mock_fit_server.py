@@ -0,0 +1,162 @@
+"""Local stand-in for the Google Fit REST API and Google's OAuth token endpoint.
+
+Answers ``POST /fitness/v1/users/me/dataset:aggregate`` with deterministic
+buckets shaped like Google's responses (one dataset per ``aggregateBy``
+entry), and ``POST /token`` for code exchange and refresh grants. It can
+inject latency and 429/503 failures and counts requests and TCP
+connections so benchmarks can compare client behaviour.
+
+    python benchmarks/mock_fit_server.py --port 8765 --latency-ms 40
+"""
+import argparse
+import asyncio
+import hashlib
+import random
+import socket
+import threading
+import time
+import uuid
+
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
+
+VALUE_RANGES = {
+    "com.google.step_count.delta": ("intVal", 2000, 12000),
+    "com.google.heart_rate.bpm": ("fpVal", 55, 110),
+    "com.google.sleep.segment": ("intVal", 1, 4),
+    "com.google.oxygen_saturation": ("fpVal", 91, 100),
+    "com.google.active_minutes": ("intVal", 0, 120),
+}
+
+
+def _value(token: str, data_type: str, start_ms: int):
+    # Same inputs always give the same reading, so cached and fresh fetches can be compared
+    kind, low, high = VALUE_RANGES.get(data_type, ("fpVal", 0, 100))
+    seed = int(hashlib.sha1(f"{token}:{data_type}:{start_ms}".encode()).hexdigest()[:8], 16)
+    value = low + (seed % 10000) / 10000 * (high - low)
+    return {kind: int(value)} if kind == "intVal" else {kind: round(value, 1)}
+
+
+def aggregate_response(token: str, body: dict) -> dict:
+    start = int(body["startTimeMillis"])
+    end = int(body["endTimeMillis"])
+    step = int(body.get("bucketByTime", {}).get("durationMillis", end - start + 1))
+    buckets = []
+    for bucket_start in range(start, end + 1, step):
+        bucket_end = min(bucket_start + step - 1, end)
+        datasets = []
+        for agg in body["aggregateBy"]:
+            data_type = agg["dataTypeName"]
+            datasets.append({
+                "dataSourceId": f"derived:{data_type}:mock",
+                "point": [{
+                    "startTimeNanos": str(bucket_start * 1_000_000),
+                    "endTimeNanos": str(bucket_end * 1_000_000),
+                    "dataTypeName": data_type,
+                    "value": [_value(token, data_type, bucket_start)],
+                }],
+            })
+        buckets.append({"startTimeMillis": str(bucket_start), "endTimeMillis": str(bucket_end), "dataset": datasets})
+    return {"bucket": buckets}
+
+
+def create_mock_fit_app(latency_ms: float = 0, fail_rate: float = 0.0, token_ttl: int = 3600) -> FastAPI:
+    app = FastAPI()
+    app.state.stats = {"requests": 0, "aggregate_requests": 0, "token_requests": 0, "failures": 0,
+                       "connections": set(), "aggregate_by_token": {}}
+    app.state.latency_ms = latency_ms
+    app.state.fail_rate = fail_rate
+
+    @app.middleware("http")
+    async def track(request: Request, call_next):
+        stats = app.state.stats
+        stats["requests"] += 1
+        if request.client:
+            stats["connections"].add((request.client.host, request.client.port))
+        if app.state.latency_ms:
+            await asyncio.sleep(app.state.latency_ms / 1000)
+        if app.state.fail_rate and random.random() < app.state.fail_rate and not request.url.path.startswith("/_"):
+            stats["failures"] += 1
+            status = random.choice([429, 503])
+            return JSONResponse({"error": {"code": status}}, status_code=status, headers={"Retry-After": "0"})
+        return await call_next(request)
+
+    @app.post("/fitness/v1/users/me/dataset:aggregate")
+    async def aggregate(request: Request):
+        auth = request.headers.get("authorization", "")
+        if not auth.startswith("Bearer ") or auth == "Bearer expired":
+            return JSONResponse({"error": {"code": 401, "message": "Invalid Credentials"}}, status_code=401)
+        token = auth[len("Bearer "):]
+        stats = app.state.stats
+        stats["aggregate_requests"] += 1
+        stats["aggregate_by_token"][token] = stats["aggregate_by_token"].get(token, 0) + 1
+        return aggregate_response(token, await request.json())
+
+    @app.post("/token")
+    async def token(request: Request):
+        form = await request.form()
+        app.state.stats["token_requests"] += 1
+        grant = form.get("grant_type")
+        if grant == "authorization_code" and form.get("code"):
+            return {"access_token": f"at-{uuid.uuid4().hex}", "refresh_token": f"rt-{uuid.uuid4().hex}",
+                    "expires_in": token_ttl, "token_type": "Bearer",
+                    "scope": "https://www.googleapis.com/auth/fitness.activity.read"}
+        if grant == "refresh_token" and form.get("refresh_token"):
+            return {"access_token": f"at-{uuid.uuid4().hex}", "expires_in": token_ttl, "token_type": "Bearer"}
+        return JSONResponse({"error": "invalid_grant"}, status_code=400)
+
+    @app.get("/_stats")
+    async def stats():
+        s = app.state.stats
+        return {**{k: v for k, v in s.items() if k != "connections"}, "connections": len(s["connections"])}
+
+    return app
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+class MockFitServer:
+    """Runs the mock app with uvicorn on a background thread."""
+
+    def __init__(self, port: int = None, **app_options):
+        self.port = port or free_port()
+        self.app = create_mock_fit_app(**app_options)
+        self.server = uvicorn.Server(uvicorn.Config(self.app, host="127.0.0.1", port=self.port,
+                                                    log_level="warning", timeout_keep_alive=30))
+        self.thread = threading.Thread(target=self.server.run, daemon=True)
+
+    @property
+    def base_url(self) -> str:
+        return f"http://127.0.0.1:{self.port}"
+
+    @property
+    def fit_url(self) -> str:
+        return f"{self.base_url}/fitness/v1/users/me"
+
+    @property
+    def stats(self) -> dict:
+        return self.app.state.stats
+
+    def __enter__(self):
+        self.thread.start()
+        while not self.server.started:
+            time.sleep(0.01)
+        return self
+
+    def __exit__(self, *exc):
+        self.server.should_exit = True
+        self.thread.join(timeout=5)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency-ms", type=float, default=0)
+    parser.add_argument("--fail-rate", type=float, default=0.0)
+    args = parser.parse_args()
+    uvicorn.run(create_mock_fit_app(args.latency_ms, args.fail_rate), host="127.0.0.1", port=args.port)
@@ -0,0 +1,106 @@
+"""Scoring time: incremental RiskEngine vs. the original calculate_risk_score.
+
+Feeds random vital streams (including missing fields, zeros and
+out-of-order device timestamps) through both implementations and reports
+the time per scoring for each. Parity itself is checked by
+tests/test_risk_engine.py; mismatches seen here are only counted.
+
+    cd app/backend
+    python benchmarks/risk_engine_parity.py --users 50 --vitals 40
+    python benchmarks/risk_engine_parity.py --mongo-url mongodb://localhost:27017
+"""
+import argparse
+import asyncio
+import os
+import random
+import sys
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+
+from harness import BACKEND_DIR
+
+sys.path.insert(0, os.path.join(BACKEND_DIR, "tests"))
+from legacy_risk import legacy_calculate_risk_score  # noqa: E402
+from services.riskEngineService import RiskEngine  # noqa: E402
+
+
+def maybe(value, p_missing=0.15):
+    roll = random.random()
+    if roll < p_missing:
+        return None
+    if roll < p_missing + 0.03:
+        return 0
+    return value
+
+
+def random_vital(user_id: str, when: datetime) -> dict:
+    return {
+        "id": str(uuid.uuid4()),
+        "user_id": user_id,
+        "heart_rate": maybe(random.randint(45, 125)),
+        "blood_pressure_systolic": maybe(random.randint(95, 170)),
+        "blood_pressure_diastolic": maybe(random.randint(55, 105)),
+        "temperature": maybe(round(random.uniform(35.5, 39.0), 1)),
+        "oxygen_saturation": maybe(random.randint(88, 100)),
+        "sleep_hours": maybe(round(random.uniform(3, 10), 1)),
+        "activity_minutes": maybe(random.randint(0, 120)),
+        "notes": None,
+        "timestamp": when,
+    }
+
+
+async def bench(args):
+    if args.mongo_url:
+        from motor.motor_asyncio import AsyncIOMotorClient
+        client = AsyncIOMotorClient(args.mongo_url, tz_aware=True)
+    else:
+        from mongomock_motor import AsyncMongoMockClient
+        client = AsyncMongoMockClient(tz_aware=True)
+    db = client[f"risk_parity_{uuid.uuid4().hex[:8]}"]
+    engine = RiskEngine(db)
+    random.seed(args.seed)
+    legacy_time = engine_time = 0.0
+    checked = mismatches = 0
+
+    for _ in range(args.users):
+        user_id = str(uuid.uuid4())
+        clock = datetime(2026, 1, 1, tzinfo=timezone.utc)
+        # Some users already have history before the engine first sees them
+        for _ in range(random.choice([0, 0, 3, 12])):
+            clock += timedelta(minutes=random.randint(1, 600))
+            await db.vitals.insert_one(random_vital(user_id, clock))
+
+        for _ in range(args.vitals):
+            clock += timedelta(minutes=random.randint(1, 600))
+            # Occasionally a device uploads a reading older than the newest one
+            when = clock - timedelta(hours=random.randint(1, 48)) if random.random() < 0.1 else clock
+            # Distinct timestamps: with exact ties "latest" is arbitrary in Mongo's sort
+            batch = [random_vital(user_id, when + timedelta(seconds=i)) for i in range(random.choice([1, 1, 1, 5]))]
+            await db.vitals.insert_many([dict(v) for v in batch])
+
+            started = time.perf_counter()
+            expected = await legacy_calculate_risk_score(db, user_id)
+            legacy_time += time.perf_counter() - started
+            started = time.perf_counter()
+            actual = await engine.observe(user_id, batch)
+            engine_time += time.perf_counter() - started
+            checked += 1
+            mismatches += actual != expected
+
+    await client.drop_database(db.name)
+    print(f"{checked} scorings across {args.users} users ({mismatches} mismatches; run pytest tests/ for parity)")
+    print(f"legacy {legacy_time / checked * 1000:.3f} ms/scoring   engine {engine_time / checked * 1000:.3f} ms/scoring")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=50)
+    parser.add_argument("--vitals", type=int, default=40)
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--mongo-url", default=None, help="real MongoDB; defaults to mongomock-motor")
+    asyncio.run(bench(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -4,26 +4,28 @@ import httpx
 import os
 import urllib.parse
 import logging
+from typing import Optional
 
 api_router = APIRouter()
 
 GOOGLE_REDIRECT_URI = "http://localhost:8000/auth/oauth2callback"
+GOOGLE_SCOPES = "openid email profile https://www.googleapis.com/auth/fitness.activity.read"
 
-@api_router.get("/google")
-async def auth_google():
+
+def build_authorization_url(state: Optional[str] = None) -> str:
     base_url = "https://accounts.google.com/o/oauth2/v2/auth"
     params = {
         "client_id": os.getenv("GOOGLE_CLIENT_ID"),
         "response_type": "code",
-        "scope": "openid email profile https://www.googleapis.com/auth/fitness.activity.read",
+        "scope": GOOGLE_SCOPES,
         "redirect_uri": GOOGLE_REDIRECT_URI,
+        # offline + consent makes Google issue a refresh token
         "access_type": "offline",
         "prompt": "consent",
     }
-
-    url = f"{base_url}?{urllib.parse.urlencode(params)}"
-    logging.info(f"Redirecting to Google OAuth URL: {url}")
-    return RedirectResponse(url)
+    if state:
+        params["state"] = state
+    return f"{base_url}?{urllib.parse.urlencode(params)}"
 
 
 @api_router.get("/oauth2callback", response_class=HTMLResponse)
@@ -32,31 +34,20 @@ async def oauth2callback(request: Request):
     if not code:
         return HTMLResponse("Missing authorization code", status_code=400)
 
-    token_endpoint = "https://oauth2.googleapis.com/token"
-    data = {
-        "code": code,
-        "client_id": os.getenv("GOOGLE_CLIENT_ID"),
-        "client_secret": os.getenv("GOOGLE_CLIENT_SECRET"),
-        "redirect_uri": GOOGLE_REDIRECT_URI,
-        "grant_type": "authorization_code",
-    }
+    # The flow is started from POST /api/google/connect, which ties the state to the logged-in user
+    google_tokens = request.app.state.google_tokens
+    user_id = await google_tokens.consume_state(request.query_params.get("state", ""))
+    if not user_id:
+        return HTMLResponse("Unknown or expired OAuth state, please connect Google Fit again", status_code=400)
+
+    try:
+        token_data = await google_tokens.exchange_code(code, GOOGLE_REDIRECT_URI)
+    except httpx.HTTPError as e:
+        logging.error(f"Token exchange failed: {e}")
+        return HTMLResponse(f"Token exchange failed: {str(e)}", status_code=500)
+
+    await google_tokens.save(user_id, token_data)
+    logging.info(f"Stored Google tokens for {user_id} (refresh token: {'yes' if token_data.get('refresh_token') else 'no'})")
 
-    async with httpx.AsyncClient() as client:
-        try:
-            resp = await client.post(
-                token_endpoint,
-                data=data,
-                headers={"Content-Type": "application/x-www-form-urlencoded"}
-            )
-            resp.raise_for_status()
-            token_data = resp.json()
-            logging.info(f"Google token response: {token_data}")
-
-        except httpx.HTTPError as e:
-            logging.error(f"Token exchange failed: {e}")
-            return HTMLResponse(f"Token exchange failed: {str(e)}", status_code=500)
-
-    # TODO: Save token_data in DB with logged in user ID
-    
     # Redirect to your frontend success screen
     return RedirectResponse("http://localhost:3000/google-success")
@@ -1,60 +1,59 @@
+import time
+# Startup report: how long importing this module (and everything below) took
+_import_started = time.perf_counter()
+
 from fastapi import FastAPI, APIRouter, HTTPException, Depends, status
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from dotenv import load_dotenv
 from starlette.middleware.cors import CORSMiddleware
 from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import ReturnDocument
+from pymongo.errors import PyMongoError, BulkWriteError, DuplicateKeyError
 import os
+import asyncio
 import logging
 import httpx
+from contextlib import asynccontextmanager
 from pathlib import Path
-from pydantic import BaseModel, EmailStr
+from pydantic import BaseModel, EmailStr, ValidationError
 from typing import List, Optional, Dict, Any
 import uuid
 from datetime import datetime, timezone, timedelta
 import jwt
-from passlib.context import CryptContext
-from fastapi.responses import HTMLResponse
-from fastapi import FastAPI, APIRouter,Request
-from services.googleFitService import fetch_steps, fetch_heart_rate, fetch_sleep, fetch_oxygen
-from fastapi import FastAPI
-from routes.google_oauth import api_router as google_oauth_router
-
-app = FastAPI()
-app.include_router(google_oauth_router, prefix="/auth")
-
-
-security = HTTPBearer()
-JWT_SECRET = os.getenv("JWT_SECRET", "your_jwt_secret")
-JWT_ALGORITHM = os.getenv("JWT_ALGORITHM", "HS256")
-
-async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security)) -> dict:
-    try:
-        token = credentials.credentials
-        payload = jwt.decode(token, JWT_SECRET, algorithms=[JWT_ALGORITHM])
-        user_id = payload.get("user_id")
-        if not user_id:
-            raise HTTPException(status_code=401, detail="Invalid token payload")
-
-        # Fetch the user document from your database (MongoDB in your case)
-        user = await db.users.find_one({"id": user_id}, {"_id": 0})
-        if not user:
-            raise HTTPException(status_code=401, detail="User not found")
-
-        # user now contains user info including Google OAuth tokens if stored
-        return user
-
-    except jwt.ExpiredSignatureError:
-        raise HTTPException(status_code=401, detail="Token expired")
-    except Exception as e:
-        raise HTTPException(status_code=401, detail="Invalid or expired token")
-    
-# Google Gemini client
-import google.generativeai as genai
+from fastapi.responses import StreamingResponse, JSONResponse, Response
+from fastapi import FastAPI, APIRouter,Request, Query, WebSocket
 
 # --- Load .env Variables ---
+# Loaded before the service imports below, which read their settings at import time
 ROOT_DIR = Path(__file__).parent
 load_dotenv(ROOT_DIR / ".env")
 
+from services.googleFitService import fetch_steps, fetch_heart_rate, fetch_sleep, fetch_oxygen, WEARABLE_METRICS
+from services.fitSyncService import FitSync, FIT_SYNC_BACKFILL_DAYS
+from services.wearableSchedulerService import WearableSyncScheduler, FIT_SCHEDULER_ENABLED
+from services.httpClientService import close_http_client
+from services.geminiService import (GeminiWorkerPool, GeminiBusyError, GeminiTimeoutError, GeminiUnavailable,
+                                    GEMINI_PRELOAD, GEMINI_RETRY_AFTER_SECONDS)
+from services.conversationService import ConversationStore, ResponseCache
+from services.userCacheService import UserCache, AUTH_TRUST_TOKEN_CLAIMS
+from services.passwordService import PasswordHasher, PasswordBusyError
+from services.riskEngineService import RiskEngine
+from services.riskRescoreService import rescore_population
+from services.paginationService import fetch_page, parse_fields, PAGE_SIZE_DEFAULT, PAGE_SIZE_MAX
+from services.exportService import export_stream, ExportUnavailable, EXPORT_FORMATS, EXPORT_DATASETS
+from services.rollupService import VitalRollups, BUCKETS, ROLLUP_MAX_BUCKETS, DOWNSAMPLE_MAX_POINTS
+from services.dateService import utcnow, as_utc, dates_to_iso
+from services.panelService import PatientPanel, PANEL_SORTS
+from services.alertService import AlertHub, AlertHubFull
+from services.writeBehindService import WriteBehindQueue
+from services.schedulingService import AppointmentScheduler, ParticipantNotFound, SlotTaken, APPOINTMENT_AVAILABILITY_MAX_DAYS, APPOINTMENT_SLOT_MINUTES
+from services.metricsService import MetricsMiddleware, LoopLagMonitor, mongo_listeners, render as render_metrics, record_startup, rss_bytes, timed, METRICS_ENABLED, METRICS_TOKEN
+from services.indexService import ensure_indexes, verify_query_plans, MONGO_AUTO_INDEX, MONGO_INDEX_DIAGNOSTICS
+import json
+from services.googleTokenService import GoogleTokenStore, GoogleAuthError
+from routes.google_oauth import api_router as google_oauth_router, build_authorization_url
+
+
 # --- Set Up Logging ---
 logging.basicConfig(
     level=logging.INFO, format="%(asctime)s - %(name)s - %(levelname)s - %(message)s"
@@ -63,92 +62,42 @@ logger = logging.getLogger(__name__)
 
 # --- MongoDB ---
 mongo_url = os.environ.get('MONGO_URL', "mongodb://localhost:27017")
-client_db = AsyncIOMotorClient(mongo_url)
+# tz_aware: stored dates come back as UTC-aware datetimes, comparable with utcnow()
+# event_listeners: per-command timings for /metrics
+client_db = AsyncIOMotorClient(mongo_url, tz_aware=True, event_listeners=mongo_listeners())
 db = client_db[os.environ.get('DB_NAME', 'carecompanion_db')]
+user_cache = UserCache(db)
+risk_engine = RiskEngine(db)
+fit_sync = FitSync(db)
+rollups = VitalRollups(db)
+panel = PatientPanel(db)
+alert_hub = AlertHub(db)
+# Inserts for vitals, risk scores and chat turns; queued and batched when WRITE_BEHIND_ENABLED.
+# The chat context and GET /risk-score/latest also read the caller's own still-queued documents
+writes = WriteBehindQueue(db)
+scheduler = AppointmentScheduler(db)
+# Renames reach the panel summaries along with the appointments' copied names
+scheduler.on_renamed(panel.on_profile)
+google_tokens = GoogleTokenStore(db, user_cache)
 
 # --- Security ---
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+password_hasher = PasswordHasher()
 security = HTTPBearer()
 JWT_SECRET = os.environ.get("JWT_SECRET", "carecompanion_jwt_secret_key_2024_secure_random")
 JWT_ALGORITHM = os.environ.get("JWT_ALGORITHM", "HS256")
 JWT_EXPIRATION_MINUTES = int(os.environ.get("JWT_EXPIRATION_MINUTES", 1440))
 
-# --- Gemini ---
-GEMINI_API_KEY = os.environ.get("GEMINI_API_KEY")
-GEMINI_MODEL = os.environ.get("GEMINI_MODEL", "gemini-pro")
-if not GEMINI_API_KEY:
-    raise Exception("❌ GEMINI_API_KEY missing in .env — add GEMINI_API_KEY=<your-key>")
-genai.configure(api_key=GEMINI_API_KEY)
-gemini_model = genai.GenerativeModel(GEMINI_MODEL)
-
-# --- FastAPI & Router ---
-app = FastAPI()
-api_router = APIRouter(prefix="/api")
-app.include_router(api_router)
-
-@api_router.get("/oauth2callback", response_class=HTMLResponse)
-async def oauth2callback(request: Request):
-    code = request.query_params.get("code")
-    if not code:
-        return HTMLResponse(content="Missing authorization code", status_code=400)
-
-    token_endpoint = "https://oauth2.googleapis.com/token"
-
-    
-    async with httpx.AsyncClient() as client:
-        try:
-            response = await client.post(token_endpoint, data=data, headers={"Content-Type": "application/x-www-form-urlencoded"})
-            response.raise_for_status()
-        except httpx.HTTPError as e:
-            logging.error(f"Token exchange failed: {e}")
-            return HTMLResponse(content=f"Token exchange failed: {str(e)}", status_code=500)
-
-    token_data = response.json()
-    access_token = token_data.get("access_token")
-    refresh_token = token_data.get("refresh_token")
-    expires_in = token_data.get("expires_in")
-
-    # TODO: Save access_token and refresh_token securely in your DB associated with logged-in user
-
-    return HTMLResponse(content="Google Fit connected! You can close this window.")
-
-@api_router.get("/vitals/steps")
-async def get_steps(current_user: dict = Depends(get_current_user)):
-    # Assume current_user from JWT + DB contains Google tokens saved as fields
-    access_token = current_user.get("google_access_token")
-    if not access_token:
-        raise HTTPException(status_code=401, detail="Missing Google access token")
-
-    data = await fetch_steps(access_token)
-    return {"steps": data}
-
-@api_router.get("/vitals/heartrate")
-async def get_heart_rate(current_user: dict = Depends(get_current_user)):
-    access_token = current_user.get("google_access_token")
-    if not access_token:
-        raise HTTPException(status_code=401, detail="Missing Google access token")
-
-    data = await fetch_heart_rate(access_token)
-    return {"heartRate": data}
-
-@api_router.get("/vitals/sleep")
-async def get_sleep(current_user: dict = Depends(get_current_user)):
-    access_token = current_user.get("google_access_token")
-    if not access_token:
-        raise HTTPException(status_code=401, detail="Missing Google access token")
-
-    data = await fetch_sleep(access_token)
-    return {"sleep": data}
+# --- Ingestion ---
+VITALS_BATCH_MAX = int(os.environ.get("VITALS_BATCH_MAX", 1000))
 
-@api_router.get("/vitals/oxygen")
-async def get_oxygen(current_user: dict = Depends(get_current_user)):
-    access_token = current_user.get("google_access_token")
-    if not access_token:
-        raise HTTPException(status_code=401, detail="Missing Google access token")
-
-    data = await fetch_oxygen(access_token)
-    return {"oxygen": data}
+# --- Gemini ---
+# The SDK is imported on first use; without GEMINI_API_KEY the API boots with chat disabled
+gemini_pool = GeminiWorkerPool()
 
+# --- Routers (mounted by create_app at the bottom) ---
+api_router = APIRouter(prefix="/api")
+# Endpoints outside /api, e.g. the Prometheus scrape target
+ops_router = APIRouter()
 
 # --- Models ---
 class UserCreate(BaseModel):
@@ -159,6 +108,11 @@ class UserCreate(BaseModel):
     age: Optional[int] = None
     specialization: Optional[str] = None
 
+class UserUpdate(BaseModel):
+    full_name: Optional[str] = None
+    age: Optional[int] = None
+    specialization: Optional[str] = None
+
 class UserLogin(BaseModel):
     email: EmailStr
     password: str
@@ -187,6 +141,19 @@ class VitalCreate(BaseModel):
     activity_minutes: Optional[int] = None
     notes: Optional[str] = None
 
+class VitalBatchItem(VitalCreate):
+    # When the reading was taken on the device; defaults to the time of upload
+    timestamp: Optional[datetime] = None
+
+class VitalBatch(BaseModel):
+    items: List[Dict[str, Any]]
+
+class VitalBatchItemResult(BaseModel):
+    index: int
+    status: str
+    id: Optional[str] = None
+    error: Optional[str] = None
+
 class Vital(BaseModel):
     id: str
     user_id: str
@@ -209,8 +176,15 @@ class RiskScore(BaseModel):
     recommendations: List[str]
     timestamp: str
 
+class VitalBatchResult(BaseModel):
+    inserted: int
+    failed: int
+    results: List[VitalBatchItemResult]
+    risk_score: Optional[RiskScore] = None
+
 class ChatMessage(BaseModel):
     message: str
+    session_id: Optional[str] = None
 
 class ChatResponse(BaseModel):
     response: str
@@ -219,7 +193,8 @@ class ChatResponse(BaseModel):
 class AppointmentCreate(BaseModel):
     patient_id: str
     doctor_id: str
-    scheduled_time: str
+    # ISO-8601; stored as a native date (naive times are taken as UTC)
+    scheduled_time: datetime
     reason: str
 
 class Appointment(BaseModel):
@@ -233,12 +208,29 @@ class Appointment(BaseModel):
     status: str
     created_at: str
 
+class PatientSummary(BaseModel):
+    id: str
+    full_name: Optional[str] = None
+    email: Optional[str] = None
+    age: Optional[int] = None
+    risk_level: Optional[str] = None
+    latest_risk: Optional[RiskScore] = None
+    latest_vitals: Optional[Vital] = None
+    next_appointment: Optional[Appointment] = None
+    updated_at: Optional[str] = None
+
 # --- Helpers ---
-def hash_password(password: str) -> str:
-    return pwd_context.hash(password)
+async def hash_password(password: str) -> str:
+    try:
+        return await password_hasher.hash(password)
+    except PasswordBusyError as e:
+        raise HTTPException(status_code=503, detail=str(e))
 
-def verify_password(plain_password: str, hashed_password: str) -> bool:
-    return pwd_context.verify(plain_password, hashed_password)
+async def verify_password(plain_password: str, hashed_password: str) -> bool:
+    try:
+        return await password_hasher.verify(plain_password, hashed_password)
+    except PasswordBusyError as e:
+        raise HTTPException(status_code=503, detail=str(e))
 
 def create_access_token(data: dict) -> str:
     to_encode = data.copy()
@@ -246,72 +238,63 @@ def create_access_token(data: dict) -> str:
     to_encode.update({"exp": expire})
     return jwt.encode(to_encode, JWT_SECRET, algorithm=JWT_ALGORITHM)
 
-async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security)) -> dict:
+def decode_token(credentials: HTTPAuthorizationCredentials) -> dict:
     try:
-        token = credentials.credentials
-        payload = jwt.decode(token, JWT_SECRET, algorithms=[JWT_ALGORITHM])
-        user_id = payload.get("user_id")
-        if not user_id:
-            raise HTTPException(status_code=401, detail="Invalid token payload")
-        user = await db.users.find_one({"id": user_id}, {"_id": 0})
-        if not user:
-            raise HTTPException(status_code=401, detail="User not found")
-        return user
+        payload = jwt.decode(credentials.credentials, JWT_SECRET, algorithms=[JWT_ALGORITHM])
     except jwt.ExpiredSignatureError:
         raise HTTPException(status_code=401, detail="Token expired")
     except Exception:
         raise HTTPException(status_code=401, detail="Invalid or expired token")
+    if not payload.get("user_id"):
+        raise HTTPException(status_code=401, detail="Invalid token payload")
+    return payload
 
-async def calculate_risk_score(user_id: str) -> Dict[str, Any]:
-    vitals = await db.vitals.find({"user_id": user_id}, {"_id": 0}).sort("timestamp", -1).limit(7).to_list(7)
-    if not vitals:
-        return {
-            "score": 0.0,
-            "risk_level": "low",
-            "factors": ["No vitals data available"],
-            "recommendations": ["Please log your vitals regularly for accurate monitoring"]
-        }
-
-    score = 0
-    factors: List[str] = []
-    latest_vital = vitals[0]
-    hr = latest_vital.get("heart_rate")
-    if hr and (hr < 60 or hr > 100):
-        factors.append(f"Abnormal heart rate: {hr} bpm")
-        score += 15
-    sys_bp = latest_vital.get("blood_pressure_systolic")
-    dia_bp = latest_vital.get("blood_pressure_diastolic")
-    if sys_bp and dia_bp and (sys_bp > 140 or dia_bp > 90):
-        factors.append(f"Elevated blood pressure: {sys_bp}/{dia_bp}")
-        score += 20
-    temp = latest_vital.get("temperature")
-    if temp and (temp < 36.1 or temp > 37.8):
-        factors.append(f"Abnormal temperature: {temp}°C")
-        score += 25
-    o2 = latest_vital.get("oxygen_saturation")
-    if o2 and o2 < 95:
-        factors.append(f"Low oxygen saturation: {o2}%")
-        score += 30
-    sleep = latest_vital.get("sleep_hours")
-    if sleep and sleep < 6:
-        factors.append(f"Insufficient sleep: {sleep} hours")
-        score += 10
-
-    if score >= 50: risk_level = "high"
-    elif score >= 25: risk_level = "medium"
-    else: risk_level = "low"
-
-    recommendations = []
-    if risk_level == "high":
-        recommendations = ["Schedule urgent doctor consultation", "Monitor vitals closely"]
-    elif risk_level == "medium":
-        recommendations = ["Schedule check-up in 24-48 hours", "Rest and monitor symptoms"]
-    else:
-        recommendations = ["Continue regular monitoring", "Maintain healthy lifestyle"]
-    if not factors:
-        factors.append("All vitals within normal range")
+async def load_user(user_id: str) -> dict:
+    user = await user_cache.get(user_id)
+    if not user:
+        raise HTTPException(status_code=401, detail="User not found")
+    return user
+
+async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security)) -> dict:
+    with timed("auth", "get_current_user"):
+        payload = decode_token(credentials)
+        # Handlers behind this dependency only need id and role, which the token already carries
+        if AUTH_TRUST_TOKEN_CLAIMS and payload.get("role"):
+            return {"id": payload["user_id"], "role": payload["role"]}
+        return await load_user(payload["user_id"])
 
-    return {"score": round(score, 2), "risk_level": risk_level, "factors": factors, "recommendations": recommendations}
+async def calculate_risk_score(user_id: str) -> Dict[str, Any]:
+    return await risk_engine.score_user(user_id)
+
+async def record_risk(user_id: str, risk_data: Dict[str, Any]) -> dict:
+    # Every new score also lands on the patient's panel summary and, if the level changed, on doctors' alert streams
+    risk_doc = {"id": str(uuid.uuid4()), "user_id": user_id, **risk_data, "timestamp": utcnow()}
+    await writes.insert("risk_scores", risk_doc)
+    before = await panel.on_risk(risk_doc)
+    if before is not None:
+        alert_hub.risk_recorded(risk_doc, before.get("risk_level"))
+    return risk_doc
+
+def date_range(field: str, start: Optional[datetime], end: Optional[datetime]) -> dict:
+    # [start, end) on a native date field; served by the same compound indexes as the sort
+    bounds = {}
+    if start:
+        bounds["$gte"] = as_utc(start)
+    if end:
+        bounds["$lt"] = as_utc(end)
+    return {field: bounds} if bounds else {}
+
+async def paged_response(collection, query: dict, sort_field: str, model, limit: int, cursor: Optional[str],
+                         fields: Optional[str], descending: bool = True) -> JSONResponse:
+    # Keyset page of plain dicts; the next page's cursor goes in X-Next-Cursor so the body stays a list.
+    # Projected in Mongo to the model's fields (or the requested subset), so nothing else leaves the db.
+    try:
+        projection = parse_fields(fields or ",".join(model.model_fields), model.model_fields, ("id", sort_field))
+        docs, next_cursor = await fetch_page(collection, query, sort_field, limit, cursor, projection, descending)
+    except ValueError as e:  # includes CursorError
+        raise HTTPException(status_code=400, detail=str(e))
+    headers = {"X-Next-Cursor": next_cursor} if next_cursor else {}
+    return JSONResponse(content=dates_to_iso(docs), headers=headers)
 
 # --- Auth Routes ---
 @api_router.post("/auth/register", response_model=TokenResponse)
@@ -324,29 +307,75 @@ async def register(user_data: UserCreate):
     user_doc = {
         "id": user_id,
         "email": user_data.email,
-        "password": hash_password(user_data.password),
+        "password": await hash_password(user_data.password),
         "full_name": user_data.full_name,
         "role": user_data.role,
         "age": user_data.age,
         "specialization": user_data.specialization,
-        "created_at": datetime.now(timezone.utc).isoformat()
+        "created_at": utcnow()
     }
-    await db.users.insert_one(user_doc)
+    try:
+        await db.users.insert_one(user_doc)
+    except DuplicateKeyError:
+        # A concurrent registration with the same email won; users_email_unique rejected this one
+        raise HTTPException(status_code=400, detail="Email already registered")
+    user_cache.put(user_doc)
     token = create_access_token({"user_id": user_id, "role": user_data.role})
-    user_out = {k: v for k, v in user_doc.items() if k != "password"}
+    user_out = dates_to_iso({k: v for k, v in user_doc.items() if k != "password"})
     return TokenResponse(access_token=token, token_type="bearer", user=User(**user_out))
 
 @api_router.post("/auth/login", response_model=TokenResponse)
 async def login(credentials: UserLogin):
     logging.info(f"Login called for {credentials.email}")
     user = await db.users.find_one({"email": credentials.email})
-    if not user or not verify_password(credentials.password, user.get("password", "")):
+    if not user or not await verify_password(credentials.password, user.get("password", "")):
         raise HTTPException(status_code=401, detail="Invalid email or password")
+    user_cache.put(user)
     token = create_access_token({"user_id": user["id"], "role": user["role"]})
-    user_out = {k: v for k, v in user.items() if k != "password"}
+    user_out = dates_to_iso({k: v for k, v in user.items() if k != "password"})
     return TokenResponse(access_token=token, token_type="bearer", user=User(**user_out))
 
+@api_router.patch("/users/me", response_model=User)
+async def update_profile(update: UserUpdate, current_user: dict = Depends(get_current_user)):
+    changes = update.model_dump(exclude_unset=True)
+    if "full_name" in changes and not (changes["full_name"] or "").strip():
+        raise HTTPException(status_code=400, detail="full_name cannot be empty")
+    projection = {"_id": 0, "password": 0}
+    if changes:
+        user = await db.users.find_one_and_update({"id": current_user["id"]}, {"$set": changes},
+                                                  projection=projection, return_document=ReturnDocument.AFTER)
+    else:
+        user = await db.users.find_one({"id": current_user["id"]}, projection)
+    if not user:
+        raise HTTPException(status_code=404, detail="User not found")
+    user_cache.invalidate(current_user["id"])
+    if changes:
+        # Copies of the name on appointments and panel summaries are rewritten in the background
+        scheduler.names_changed(current_user["id"])
+    return User(**dates_to_iso(user))
+
 # --- Vitals ---
+async def vitals_recorded(user_id: str, docs: List[dict]) -> dict:
+    # Everything derived from stored readings: day rollups, the doctor panel, live alerts and the risk score
+    await rollups.refresh(user_id, docs)
+    await panel.on_vitals(user_id, docs)
+    alert_hub.vitals_written(user_id, docs)
+    return await record_risk(user_id, await risk_engine.observe(user_id, docs))
+
+async def vitals_flushed(docs: List[dict]):
+    # Runs once the readings are in Mongo: inline without write-behind, per flushed batch with it,
+    # so POST /vitals itself only enqueues. One risk score per user and batch
+    by_user: Dict[str, List[dict]] = {}
+    for doc in docs:
+        by_user.setdefault(doc["user_id"], []).append(doc)
+    for user_id, user_docs in by_user.items():
+        try:
+            await vitals_recorded(user_id, user_docs)
+        except Exception as e:
+            logging.error(f"Updating derived data for {user_id} after {len(user_docs)} vitals failed: {e}", exc_info=True)
+
+writes.on_flushed("vitals", vitals_flushed)
+
 @api_router.post("/vitals", response_model=Vital)
 async def create_vital(vital_data: VitalCreate, current_user: dict = Depends(get_current_user)):
     logging.info(f"Log Vitals for user {current_user['id']}")
@@ -355,128 +384,633 @@ async def create_vital(vital_data: VitalCreate, current_user: dict = Depends(get
         "id": vital_id,
         "user_id": current_user["id"],
         **vital_data.model_dump(),
-        "timestamp": datetime.now(timezone.utc).isoformat()
+        "timestamp": utcnow()
     }
-    await db.vitals.insert_one(vital_doc)
-    risk_data = await calculate_risk_score(current_user["id"])
-    risk_doc = {"id": str(uuid.uuid4()), "user_id": current_user["id"], **risk_data, "timestamp": datetime.now(timezone.utc).isoformat()}
-    await db.risk_scores.insert_one(risk_doc)
-    return Vital(**vital_doc)
+    await writes.insert("vitals", vital_doc)
+    return Vital(**dates_to_iso(vital_doc))
+
+@api_router.post("/vitals/batch", response_model=VitalBatchResult)
+async def create_vitals_batch(batch: VitalBatch, current_user: dict = Depends(get_current_user)):
+    if len(batch.items) > VITALS_BATCH_MAX:
+        raise HTTPException(status_code=413, detail=f"Batch exceeds {VITALS_BATCH_MAX} items")
+    logging.info(f"Log {len(batch.items)} batched vitals for user {current_user['id']}")
+    now = utcnow()
+    results: List[VitalBatchItemResult] = []
+    docs: List[dict] = []
+    doc_indexes: List[int] = []
+    for index, raw in enumerate(batch.items):
+        try:
+            item = VitalBatchItem.model_validate(raw)
+        except ValidationError as e:
+            results.append(VitalBatchItemResult(index=index, status="invalid", error=str(e.errors()[0]["msg"])))
+            continue
+        taken_at = as_utc(item.timestamp) or now
+        docs.append({
+            "id": str(uuid.uuid4()),
+            "user_id": current_user["id"],
+            **item.model_dump(exclude={"timestamp"}),
+            "timestamp": taken_at
+        })
+        doc_indexes.append(index)
+        results.append(VitalBatchItemResult(index=index, status="inserted", id=docs[-1]["id"]))
+
+    if docs:
+        try:
+            await db.vitals.insert_many(docs, ordered=False)
+        except BulkWriteError as e:
+            # ordered=False keeps going past bad documents; mark only the ones that failed
+            by_index = {r.index: r for r in results}
+            for err in e.details.get("writeErrors", []):
+                failed = by_index[doc_indexes[err["index"]]]
+                failed.status, failed.id, failed.error = "failed", None, err.get("errmsg")
+
+    inserted = sum(1 for r in results if r.status == "inserted")
+    risk = None
+    if inserted:
+        # One risk recompute for the whole batch instead of one per reading
+        inserted_ids = {r.id for r in results if r.status == "inserted"}
+        inserted_docs = [d for d in docs if d["id"] in inserted_ids]
+        risk = await vitals_recorded(current_user["id"], inserted_docs)
+    return VitalBatchResult(
+        inserted=inserted,
+        failed=len(results) - inserted,
+        results=results,
+        risk_score=RiskScore(**dates_to_iso(risk)) if risk else None,
+    )
 
 @api_router.get("/vitals", response_model=List[Vital])
-async def get_vitals(current_user: dict = Depends(get_current_user)):
-    vitals = await db.vitals.find({"user_id": current_user["id"]}, {"_id": 0}).sort("timestamp", -1).limit(50).to_list(50)
-    return [Vital(**v) for v in vitals]
+async def get_vitals(limit: int = Query(PAGE_SIZE_DEFAULT, ge=1, le=PAGE_SIZE_MAX), cursor: Optional[str] = None,
+                     fields: Optional[str] = None, start: Optional[datetime] = None, end: Optional[datetime] = None,
+                     current_user: dict = Depends(get_current_user)):
+    query = {"user_id": current_user["id"], **date_range("timestamp", start, end)}
+    return await paged_response(db.vitals, query, "timestamp", Vital, limit, cursor, fields)
+
+# --- Vitals charts ---
+def resolve_patient(current_user: dict, patient_id: Optional[str]) -> str:
+    # Patients chart their own vitals; doctors may pass any patient's id
+    if not patient_id or patient_id == current_user["id"]:
+        return current_user["id"]
+    if current_user.get("role") != "doctor":
+        raise HTTPException(status_code=403, detail="Only doctors can view other patients' vitals")
+    return patient_id
+
+def chart_range(start: Optional[datetime], end: Optional[datetime], default: timedelta):
+    end = end or datetime.now(timezone.utc)
+    start = start or end - default
+    start, end = as_utc(start), as_utc(end)
+    if start >= end:
+        raise HTTPException(status_code=400, detail="start must be before end")
+    return start, end
+
+@api_router.get("/vitals/rollup")
+async def get_vitals_rollup(bucket: str = "day", metrics: Optional[str] = None, start: Optional[datetime] = None,
+                            end: Optional[datetime] = None, patient_id: Optional[str] = None,
+                            current_user: dict = Depends(get_current_user)):
+    if bucket not in BUCKETS:
+        raise HTTPException(status_code=400, detail=f"bucket must be one of: {', '.join(BUCKETS)}")
+    requested = [m.strip() for m in metrics.split(",") if m.strip()] if metrics else list(rollups.metrics)
+    unknown = [m for m in requested if m not in rollups.metrics]
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown metrics: {', '.join(unknown)}")
+    start, end = chart_range(start, end, BUCKETS[bucket] * 90 if bucket != "hour" else timedelta(days=7))
+    if (end - start) / BUCKETS[bucket] > ROLLUP_MAX_BUCKETS:
+        raise HTTPException(status_code=400, detail=f"Range spans more than {ROLLUP_MAX_BUCKETS} {bucket} buckets")
+    user_id = resolve_patient(current_user, patient_id)
+    # Hour buckets come from a pipeline over the raw vitals; day/week from the precomputed daily rollups
+    data = await rollups.buckets(user_id, bucket, start, end, list(dict.fromkeys(requested)))
+    return {"bucket": bucket, "start": start.isoformat(), "end": end.isoformat(), "metrics": data}
+
+@api_router.get("/vitals/downsample")
+async def get_vitals_downsample(metric: str = "heart_rate", points: int = Query(500, ge=3, le=DOWNSAMPLE_MAX_POINTS),
+                                start: Optional[datetime] = None, end: Optional[datetime] = None,
+                                patient_id: Optional[str] = None, current_user: dict = Depends(get_current_user)):
+    if metric not in rollups.metrics:
+        raise HTTPException(status_code=400, detail=f"Unknown metric: {metric}")
+    start, end = chart_range(start, end, timedelta(days=30))
+    user_id = resolve_patient(current_user, patient_id)
+    # LTTB keeps the shape of the series (peaks included) in at most `points` raw readings
+    data, total = await rollups.downsample(user_id, metric, start, end, points)
+    return {"metric": metric, "start": start.isoformat(), "end": end.isoformat(), "source_points": total, "points": data}
+
+# --- Google Fit vitals ---
+async def google_access_token(current_user: dict) -> str:
+    # Cached access token, refreshed shortly before it expires
+    try:
+        return await google_tokens.get_access_token(current_user["id"], current_user)
+    except GoogleAuthError as e:
+        raise HTTPException(status_code=401, detail=str(e))
+    except httpx.HTTPError as e:
+        logging.error(f"Google token refresh failed for {current_user['id']}: {e}")
+        raise HTTPException(status_code=502, detail="Could not refresh Google access token")
+
+@asynccontextmanager
+async def google_fit_errors(user_id: str):
+    # Google's own failures shouldn't surface as 500s; a 401 means the cached token was revoked early
+    try:
+        yield
+    except httpx.HTTPStatusError as e:
+        if e.response.status_code == 401:
+            await google_tokens.invalidate(user_id)
+            raise HTTPException(status_code=401, detail="Google Fit rejected the access token, please retry")
+        logging.warning(f"Google Fit returned {e.response.status_code} for {user_id}")
+        raise HTTPException(status_code=502, detail=f"Google Fit request failed ({e.response.status_code})")
+    except httpx.HTTPError as e:
+        logging.warning(f"Google Fit request for {user_id} failed: {e!r}")
+        raise HTTPException(status_code=502, detail="Google Fit request failed")
+
+@api_router.post("/google/connect")
+async def connect_google(current_user: dict = Depends(get_current_user)):
+    # The frontend sends the browser to this URL; the callback uses the state to find the user
+    state = await google_tokens.create_state(current_user["id"])
+    return {"url": build_authorization_url(state)}
+
+@api_router.get("/vitals/wearable")
+async def get_wearable_vitals(metrics: Optional[str] = None, days: int = 7, refresh: bool = False,
+                              current_user: dict = Depends(get_current_user)):
+    # One request for any subset of steps/heartrate/sleep/oxygen instead of four round trips
+    requested = [m.strip() for m in metrics.split(",") if m.strip()] if metrics else list(WEARABLE_METRICS)
+    unknown = [m for m in requested if m not in WEARABLE_METRICS]
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown metrics: {', '.join(unknown)}")
+    access_token = await google_access_token(current_user)
+
+    if not 1 <= days <= FIT_SYNC_BACKFILL_DAYS:
+        raise HTTPException(status_code=400, detail=f"days must be between 1 and {FIT_SYNC_BACKFILL_DAYS}")
+
+    # Served from the local bucket cache; Google is only asked for buckets since the last sync
+    async with google_fit_errors(current_user["id"]):
+        data = await fit_sync.get(current_user["id"], access_token, list(dict.fromkeys(requested)), days=days, refresh=refresh)
+    return {"metrics": data}
+
+@api_router.get("/vitals/steps")
+async def get_steps(current_user: dict = Depends(get_current_user)):
+    access_token = await google_access_token(current_user)
+
+    async with google_fit_errors(current_user["id"]):
+        data = await fetch_steps(access_token)
+    return {"steps": data}
+
+@api_router.get("/vitals/heartrate")
+async def get_heart_rate(current_user: dict = Depends(get_current_user)):
+    access_token = await google_access_token(current_user)
+
+    async with google_fit_errors(current_user["id"]):
+        data = await fetch_heart_rate(access_token)
+    return {"heartRate": data}
+
+@api_router.get("/vitals/sleep")
+async def get_sleep(current_user: dict = Depends(get_current_user)):
+    access_token = await google_access_token(current_user)
+
+    async with google_fit_errors(current_user["id"]):
+        data = await fetch_sleep(access_token)
+    return {"sleep": data}
+
+@api_router.get("/vitals/oxygen")
+async def get_oxygen(current_user: dict = Depends(get_current_user)):
+    access_token = await google_access_token(current_user)
+
+    async with google_fit_errors(current_user["id"]):
+        data = await fetch_oxygen(access_token)
+    return {"oxygen": data}
+
+async def refresh_after_sync(user_id: str, docs: List[dict]):
+    await rollups.refresh(user_id, docs)
+    await panel.on_vitals(user_id, docs)
+    alert_hub.vitals_written(user_id, docs)
+    # No risk update: wearable aggregates are left out of risk scoring (see riskEngineService.UNSCORED_SOURCES)
+
+wearable_scheduler = WearableSyncScheduler(db, fit_sync, tokens=google_tokens, after_write=refresh_after_sync)
 
 # --- Risk Score ---
 @api_router.get("/risk-score/latest", response_model=RiskScore)
 async def get_latest_risk(current_user: dict = Depends(get_current_user)):
+    queued_vitals = writes.pending("vitals", current_user["id"])
+    if queued_vitals:
+        # The flush hook hasn't scored these readings yet; show the score it will record, without recording it
+        preview = await risk_engine.preview(current_user["id"], queued_vitals)
+        return RiskScore(**dates_to_iso({"id": str(uuid.uuid4()), "user_id": current_user["id"], **preview,
+                                         "timestamp": utcnow()}))
     risk = await db.risk_scores.find_one({"user_id": current_user["id"]}, {"_id": 0}, sort=[("timestamp", -1)])
+    queued = writes.pending("risk_scores", current_user["id"])
+    if queued and (not risk or as_utc(queued[-1]["timestamp"]) >= as_utc(risk["timestamp"])):
+        risk = queued[-1]
     if not risk:
-        risk_data = await calculate_risk_score(current_user["id"])
-        risk = {"id": str(uuid.uuid4()), "user_id": current_user["id"], **risk_data, "timestamp": datetime.now(timezone.utc).isoformat()}
-        await db.risk_scores.insert_one(risk)
-    return RiskScore(**risk)
+        risk = await record_risk(current_user["id"], await calculate_risk_score(current_user["id"]))
+    return RiskScore(**dates_to_iso(risk))
 
 # --- Doctor endpoints ---
 @api_router.get("/doctor/patients", response_model=List[User])
-async def get_patients_for_doctor(current_user: dict = Depends(get_current_user)):
+async def get_patients_for_doctor(limit: int = Query(PAGE_SIZE_DEFAULT, ge=1, le=PAGE_SIZE_MAX),
+                                  cursor: Optional[str] = None, fields: Optional[str] = None,
+                                  current_user: dict = Depends(get_current_user)):
+    if current_user.get("role") != "doctor":
+        raise HTTPException(status_code=403, detail="Only doctors can access this endpoint")
+    return await paged_response(db.users, {"role": "patient"}, "full_name", User, limit, cursor, fields,
+                                descending=False)
+
+@api_router.get("/doctor/panel", response_model=List[PatientSummary])
+async def get_doctor_panel(sort: str = "risk", risk_level: Optional[str] = None,
+                           limit: int = Query(PAGE_SIZE_DEFAULT, ge=1, le=PAGE_SIZE_MAX), cursor: Optional[str] = None,
+                           fields: Optional[str] = None, current_user: dict = Depends(get_current_user)):
+    # The doctor's patients (anyone who has booked with them) with latest vitals, latest risk and next
+    # appointment, read from the maintained patient_summaries in one indexed query
     if current_user.get("role") != "doctor":
         raise HTTPException(status_code=403, detail="Only doctors can access this endpoint")
-    patients_cursor = db.users.find({"role": "patient"}, {"_id": 0})
-    patients = await patients_cursor.to_list(100)
-    return [User(**p) for p in patients]
+    if sort not in PANEL_SORTS:
+        raise HTTPException(status_code=400, detail=f"sort must be one of: {', '.join(PANEL_SORTS)}")
+    sort_field, descending = PANEL_SORTS[sort]
+    query = {"doctor_ids": current_user["id"]}
+    if risk_level:
+        query["risk_level"] = risk_level
+    await panel.refresh_due(current_user["id"])
+    try:
+        projection = parse_fields(fields or ",".join(PatientSummary.model_fields), PatientSummary.model_fields, ("id",))
+        projection[sort_field] = 1
+        docs, next_cursor = await fetch_page(db.patient_summaries, query, sort_field, limit, cursor, projection, descending)
+    except ValueError as e:  # includes CursorError
+        raise HTTPException(status_code=400, detail=str(e))
+    for doc in docs:
+        doc.pop("risk_sort", None)
+    headers = {"X-Next-Cursor": next_cursor} if next_cursor else {}
+    return JSONResponse(content=dates_to_iso(docs), headers=headers)
 
 @api_router.get("/doctor/patients/{patient_id}/vitals", response_model=List[Vital])
-async def get_patient_vitals(patient_id: str, current_user: dict = Depends(get_current_user)):
+async def get_patient_vitals(patient_id: str, limit: int = Query(PAGE_SIZE_DEFAULT, ge=1, le=PAGE_SIZE_MAX),
+                             cursor: Optional[str] = None, fields: Optional[str] = None,
+                             start: Optional[datetime] = None, end: Optional[datetime] = None,
+                             current_user: dict = Depends(get_current_user)):
+    if current_user.get("role") != "doctor":
+        raise HTTPException(status_code=403, detail="Only doctors can access this endpoint")
+    query = {"user_id": patient_id, **date_range("timestamp", start, end)}
+    return await paged_response(db.vitals, query, "timestamp", Vital, limit, cursor, fields)
+
+@api_router.get("/doctor/patients/{patient_id}/export")
+async def export_patient_history(patient_id: str, format: str = "ndjson", dataset: str = "all",
+                                 current_user: dict = Depends(get_current_user)):
+    if current_user.get("role") != "doctor":
+        raise HTTPException(status_code=403, detail="Only doctors can access this endpoint")
+    if format not in EXPORT_FORMATS:
+        raise HTTPException(status_code=400, detail=f"format must be one of: {', '.join(EXPORT_FORMATS)}")
+    if dataset not in EXPORT_DATASETS:
+        raise HTTPException(status_code=400, detail=f"dataset must be one of: {', '.join(EXPORT_DATASETS)}")
+    if not await db.users.find_one({"id": patient_id, "role": "patient"}, {"_id": 1}):
+        raise HTTPException(status_code=404, detail="Patient not found")
+    try:
+        media_type, extension, body = export_stream(db, patient_id, format, dataset)
+    except ExportUnavailable as e:
+        raise HTTPException(status_code=501, detail=str(e))
+    # Streamed from the Motor cursors in batches; the full history is never held in memory
+    filename = f"patient-{patient_id}-{dataset}.{extension}"
+    return StreamingResponse(body, media_type=media_type,
+                             headers={"Content-Disposition": f'attachment; filename="{filename}"'})
+
+rescore_job: Dict[str, Any] = {"task": None, "started_at": None, "result": None, "error": None}
+
+async def run_rescore_job():
+    try:
+        rescore_job["result"] = await rescore_population(db, rules=risk_engine.rules, on_recorded=alert_hub.risk_recorded)
+    except Exception as e:
+        logging.error(f"Risk re-scoring failed: {e}", exc_info=True)
+        rescore_job["error"] = str(e)
+
+@api_router.post("/doctor/risk-scores/rescore", status_code=202)
+async def start_rescore(current_user: dict = Depends(get_current_user)):
+    if current_user.get("role") != "doctor":
+        raise HTTPException(status_code=403, detail="Only doctors can access this endpoint")
+    task = rescore_job["task"]
+    if task is None or task.done():
+        rescore_job.update(
+            task=asyncio.create_task(run_rescore_job()),
+            started_at=datetime.now(timezone.utc).isoformat(),
+            result=None,
+            error=None,
+        )
+    return await get_rescore_status(current_user)
+
+@api_router.get("/doctor/risk-scores/rescore")
+async def get_rescore_status(current_user: dict = Depends(get_current_user)):
     if current_user.get("role") != "doctor":
         raise HTTPException(status_code=403, detail="Only doctors can access this endpoint")
-    vitals = await db.vitals.find({"user_id": patient_id}, {"_id": 0}).sort("timestamp", -1).limit(50).to_list(50)
-    return [Vital(**v) for v in vitals]
+    task = rescore_job["task"]
+    return {
+        "running": bool(task and not task.done()),
+        "started_at": rescore_job["started_at"],
+        "result": rescore_job["result"],
+        "error": rescore_job["error"],
+    }
+
+# --- Risk alerts ---
+# Doctors subscribe once and get risk-level transitions and new vitals for their panel pushed to them,
+# instead of polling the vitals and risk endpoints
+@api_router.get("/alerts/stream")
+async def stream_alerts(current_user: dict = Depends(get_current_user)):
+    if current_user.get("role") != "doctor":
+        raise HTTPException(status_code=403, detail="Only doctors can access this endpoint")
+    try:
+        sub = await alert_hub.subscribe(current_user["id"])
+    except AlertHubFull as e:
+        raise HTTPException(status_code=503, detail=str(e))
+
+    async def event_stream():
+        try:
+            async for kind, data in sub.events():
+                yield ": ping\n\n" if kind == "ping" else f"event: {kind}\ndata: {data}\n\n"
+        finally:
+            alert_hub.unsubscribe(sub)
+
+    return StreamingResponse(event_stream(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+@api_router.websocket("/ws/alerts")
+async def websocket_alerts(websocket: WebSocket, token: str = Query(...)):
+    # Browsers can't set headers on a WebSocket handshake, so the JWT comes as ?token=
+    try:
+        payload = decode_token(HTTPAuthorizationCredentials(scheme="Bearer", credentials=token))
+        if AUTH_TRUST_TOKEN_CLAIMS and payload.get("role"):
+            user = {"id": payload["user_id"], "role": payload["role"]}
+        else:
+            user = await load_user(payload["user_id"])
+    except HTTPException:
+        await websocket.close(code=status.WS_1008_POLICY_VIOLATION)
+        return
+    if user.get("role") != "doctor":
+        await websocket.close(code=status.WS_1008_POLICY_VIOLATION)
+        return
+    try:
+        sub = await alert_hub.subscribe(user["id"])
+    except AlertHubFull:
+        await websocket.close(code=status.WS_1013_TRY_AGAIN_LATER)
+        return
+    await websocket.accept()
+
+    async def send_events():
+        async for kind, data in sub.events():
+            await websocket.send_text(data)
+
+    async def wait_for_close():
+        # Clients don't send anything; reading just notices the disconnect without waiting for the next event
+        while True:
+            await websocket.receive_text()
+
+    tasks = [asyncio.create_task(send_events()), asyncio.create_task(wait_for_close())]
+    try:
+        await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+    finally:
+        # Unsubscribe before awaiting anything: if the connection was cancelled, the awaits below can be too
+        alert_hub.unsubscribe(sub)
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+    if sub.close_reason not in (None, "unsubscribed"):
+        try:
+            await websocket.close()
+        except RuntimeError:
+            pass
 
 # --- Appointments ---
 @api_router.post("/appointments", response_model=Appointment)
 async def create_appointment(appt_data: AppointmentCreate, current_user: dict = Depends(get_current_user)):
-    patient = await db.users.find_one({"id": appt_data.patient_id})
-    doctor = await db.users.find_one({"id": appt_data.doctor_id})
-    if not patient or not doctor:
-        raise HTTPException(status_code=404, detail="Patient or doctor not found")
-    appt_doc = {
-        "id": str(uuid.uuid4()),
-        "patient_id": appt_data.patient_id,
-        "patient_name": patient["full_name"],
-        "doctor_id": appt_data.doctor_id,
-        "doctor_name": doctor["full_name"],
-        "scheduled_time": appt_data.scheduled_time,
-        "reason": appt_data.reason,
-        "status": "scheduled",
-        "created_at": datetime.now(timezone.utc).isoformat()
-    }
-    await db.appointments.insert_one(appt_doc)
-    return Appointment(**appt_doc)
+    # Conflicts are caught by the unique slot claim, so two concurrent bookings can't both succeed
+    try:
+        appt_doc, patient = await scheduler.book(appt_data.patient_id, appt_data.doctor_id,
+                                                 appt_data.scheduled_time, appt_data.reason)
+    except ParticipantNotFound as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except SlotTaken as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    await panel.on_appointment(appt_doc, patient)
+    alert_hub.follow(appt_data.doctor_id, appt_data.patient_id)
+    return Appointment(**dates_to_iso(appt_doc))
+
+@api_router.get("/doctors/{doctor_id}/availability")
+async def get_doctor_availability(doctor_id: str, start: Optional[datetime] = None, end: Optional[datetime] = None,
+                                  current_user: dict = Depends(get_current_user)):
+    # Free working-hour slots for booking, read off the (doctor_id, slot) claim index
+    start = as_utc(start) or utcnow()
+    end = as_utc(end) or start + timedelta(days=7)
+    if end <= start:
+        raise HTTPException(status_code=400, detail="start must be before end")
+    if end - start > timedelta(days=APPOINTMENT_AVAILABILITY_MAX_DAYS):
+        raise HTTPException(status_code=400, detail=f"Range spans more than {APPOINTMENT_AVAILABILITY_MAX_DAYS} days")
+    if not await db.users.find_one({"id": doctor_id, "role": "doctor"}, {"_id": 1}):
+        raise HTTPException(status_code=404, detail="Doctor not found")
+    free, booked = await scheduler.availability(doctor_id, start, end)
+    return {"doctor_id": doctor_id, "slot_minutes": APPOINTMENT_SLOT_MINUTES, "start": start.isoformat(),
+            "end": end.isoformat(), "booked": booked, "free": [slot.isoformat() for slot in free]}
 
 @api_router.get("/appointments", response_model=List[Appointment])
-async def get_appointments(current_user: dict = Depends(get_current_user)):
+async def get_appointments(limit: int = Query(PAGE_SIZE_DEFAULT, ge=1, le=PAGE_SIZE_MAX), cursor: Optional[str] = None,
+                           fields: Optional[str] = None, start: Optional[datetime] = None, end: Optional[datetime] = None,
+                           current_user: dict = Depends(get_current_user)):
     if current_user.get("role") == "patient":
         query = {"patient_id": current_user["id"]}
     elif current_user.get("role") == "doctor":
         query = {"doctor_id": current_user["id"]}
     else:
         query = {}
-    appts = await db.appointments.find(query, {"_id": 0}).sort("scheduled_time", -1).to_list(50)
-    return [Appointment(**a) for a in appts]
+    query.update(date_range("scheduled_time", start, end))
+    return await paged_response(db.appointments, query, "scheduled_time", Appointment, limit, cursor, fields)
 
 # --- Chat with Gemini Robust ---
-@api_router.post("/chat", response_model=ChatResponse)
-async def chat_with_ai(chat_msg: ChatMessage, current_user: dict = Depends(get_current_user)):
-    try:
-        logging.info(f"POST /api/chat by {current_user['id']}")
-        session_id = f"{current_user['id']}_chat"
-        system_prompt = """
+CHAT_SYSTEM_PROMPT = """
 You are CareCompanion — an empathetic AI for discharged patients.
 - Give medical guidance, diet tips, mental support.
 - Explain simply, like a caring nurse.
 - If emergency signs exist, clearly advise immediate medical attention.
 """
-        final_prompt = system_prompt + "\nUser: " + chat_msg.message
-        response = gemini_model.generate_content(final_prompt)
 
-        reply_text = getattr(response, "text", None)
+conversations = ConversationStore(db, pending=lambda user_id: writes.pending("chats", user_id))
+response_cache = ResponseCache()
+
+async def save_chat(user_id: str, session_id: str, message: str, reply_text: str):
+    chat_doc = {
+        "id": str(uuid.uuid4()),
+        "user_id": user_id,
+        "session_id": session_id,
+        "message": message,
+        "response": reply_text,
+        "timestamp": utcnow()
+    }
+    await writes.insert("chats", chat_doc)
+
+async def prepare_chat(chat_msg: ChatMessage, current_user: dict):
+    session_id = chat_msg.session_id or f"{current_user['id']}_chat"
+    context = await conversations.load_context(current_user["id"], session_id)
+    final_prompt = ConversationStore.build_prompt(CHAT_SYSTEM_PROMPT, context, chat_msg.message)
+    standalone = not context["summary"] and not context["turns"]
+    return session_id, final_prompt, standalone
+
+@api_router.post("/chat", response_model=ChatResponse)
+async def chat_with_ai(chat_msg: ChatMessage, current_user: dict = Depends(get_current_user)):
+    try:
+        logging.info(f"POST /api/chat by {current_user['id']}")
+        session_id, final_prompt, standalone = await prepare_chat(chat_msg, current_user)
+        # Only a first turn may reuse (or seed) the shared cache; a follow-up like "yes" depends on this conversation
+        reply_text = response_cache.get(chat_msg.message) if standalone else None
         if reply_text is None:
-            if hasattr(response, "candidates") and response.candidates:
-                reply_text = response.candidates[0].text
-            elif hasattr(response, "content"):
-                reply_text = response.content
-            else:
-                reply_text = str(response)
-        reply_text = reply_text.strip() if reply_text else "Sorry, no response generated."
-        chat_doc = {
-            "id": str(uuid.uuid4()),
-            "user_id": current_user["id"],
-            "message": chat_msg.message,
-            "response": reply_text,
-            "timestamp": datetime.now(timezone.utc).isoformat()
-        }
-        await db.chats.insert_one(chat_doc)
+            reply_text = await gemini_pool.generate(final_prompt)
+            if reply_text and standalone:
+                response_cache.put(chat_msg.message, reply_text)
+        reply_text = reply_text or "Sorry, no response generated."
+        await save_chat(current_user["id"], session_id, chat_msg.message, reply_text)
         return ChatResponse(response=reply_text, session_id=session_id)
+    except GeminiBusyError as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": str(GEMINI_RETRY_AFTER_SECONDS)})
+    except GeminiTimeoutError as e:
+        raise HTTPException(status_code=504, detail=f"{e}, please retry shortly",
+                            headers={"Retry-After": str(GEMINI_RETRY_AFTER_SECONDS)})
+    except GeminiUnavailable as e:
+        raise HTTPException(status_code=503, detail=str(e))
     except Exception as e:
         logging.error(f"Chat Error: {e}", exc_info=True)
         raise HTTPException(status_code=500, detail=f"Chat processing failed: {e}")
 
-# --- Root and Middleware Registration ---
+@api_router.post("/chat/stream")
+async def chat_with_ai_stream(chat_msg: ChatMessage, current_user: dict = Depends(get_current_user)):
+    logging.info(f"POST /api/chat/stream by {current_user['id']}")
+    session_id, final_prompt, standalone = await prepare_chat(chat_msg, current_user)
+    cached = response_cache.get(chat_msg.message) if standalone else None
+    # Reject up front so a full queue or missing model is a 503 rather than a broken stream
+    if cached is None and not gemini_pool.available:
+        raise HTTPException(status_code=503, detail="Chat is unavailable, please retry later")
+    if cached is None and gemini_pool.stats()["waiting"] >= gemini_pool.max_queue:
+        raise HTTPException(status_code=503, detail="Chat service is busy, please retry shortly",
+                            headers={"Retry-After": str(GEMINI_RETRY_AFTER_SECONDS)})
+
+    async def event_stream():
+        parts: List[str] = []
+        if cached is not None:
+            parts.append(cached)
+            yield f"data: {json.dumps({'delta': cached})}\n\n"
+        else:
+            try:
+                async for delta in gemini_pool.stream(final_prompt):
+                    parts.append(delta)
+                    yield f"data: {json.dumps({'delta': delta})}\n\n"
+            except (GeminiBusyError, GeminiTimeoutError, GeminiUnavailable) as e:
+                yield f"event: error\ndata: {json.dumps({'detail': str(e)})}\n\n"
+                return
+            except Exception as e:
+                logging.error(f"Chat stream error: {e}", exc_info=True)
+                yield f"event: error\ndata: {json.dumps({'detail': f'Chat processing failed: {e}'})}\n\n"
+                return
+        reply_text = "".join(parts).strip()
+        if reply_text and standalone and cached is None:
+            response_cache.put(chat_msg.message, reply_text)
+        reply_text = reply_text or "Sorry, no response generated."
+        await save_chat(current_user["id"], session_id, chat_msg.message, reply_text)
+        yield f"event: done\ndata: {json.dumps({'session_id': session_id})}\n\n"
+
+    return StreamingResponse(event_stream(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+# --- Cache stats ---
+@api_router.get("/cache-stats")
+async def cache_stats(current_user: dict = Depends(get_current_user)):
+    if current_user.get("role") != "doctor":
+        raise HTTPException(status_code=403, detail="Only doctors can access this endpoint")
+    return {
+        "user_cache": user_cache.stats(),
+        "chat_response_cache": {"hits": response_cache.hits, "misses": response_cache.misses},
+        "gemini_pool": gemini_pool.stats(),
+        "password_hasher": password_hasher.stats(),
+        "wearable_scheduler": wearable_scheduler.stats,
+        "google_tokens": google_tokens.stats(),
+        "alerts": alert_hub.stats(),
+        "write_behind": writes.stats(),
+        "scheduling": scheduler.stats(),
+        "process": {**startup_report, "pid": os.getpid(), "rss_mb": round(rss_bytes() / 2**20, 1)},
+    }
+
+# --- Metrics ---
+loop_lag = LoopLagMonitor()
+
+@ops_router.get("/metrics", include_in_schema=False)
+async def metrics(request: Request):
+    # Prometheus scrape target; outside /api so it isn't behind the app's JWT auth
+    if not METRICS_ENABLED:
+        raise HTTPException(status_code=404, detail="Metrics are disabled")
+    if METRICS_TOKEN and request.headers.get("authorization") != f"Bearer {METRICS_TOKEN}":
+        raise HTTPException(status_code=401, detail="Invalid metrics token")
+    body, content_type = render_metrics()
+    return Response(content=body, media_type=content_type)
+
+# --- Root ---
 @api_router.get("/")
 async def root():
-    return {"message": "CareCompanion API live ✅ (Gemini Enabled)"}
-
-app.include_router(api_router)
-app.add_middleware(
-    CORSMiddleware,
-    allow_origins=["*"],  # update for production
-    allow_credentials=True,
-    allow_methods=["*"],
-    allow_headers=["*"],
-)
+    if gemini_pool.available:
+        return {"message": "CareCompanion API live ✅ (Gemini Enabled)"}
+    return {"message": "CareCompanion API live ✅ (degraded: chat unavailable)"}
 
-@app.on_event("shutdown")
-async def shutdown_db_client():
+# --- App factory & lifespan ---
+startup_report: Dict[str, Any] = {}
+background_tasks: List[asyncio.Task] = []
+
+async def bootstrap_indexes():
+    try:
+        if MONGO_AUTO_INDEX:
+            await ensure_indexes(db)
+        if MONGO_INDEX_DIAGNOSTICS:
+            await verify_query_plans(db)
+    except PyMongoError as e:
+        # Don't refuse to boot over indexes; queries still work, just slower
+        logging.error(f"MongoDB index bootstrap failed: {e}")
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    started = time.perf_counter()
+    # Awaited, not backgrounded: the appointment slot index is what prevents double bookings
+    await bootstrap_indexes()
+    if FIT_SCHEDULER_ENABLED:
+        wearable_scheduler.start()
+    loop_lag.start()
+    alert_hub.start()
+    # Also replays anything spilled to disk by a previous run
+    await writes.start()
+    if not gemini_pool.available:
+        logging.warning("GEMINI_API_KEY is not set: starting in degraded mode, chat endpoints return 503")
+    elif GEMINI_PRELOAD:
+        background_tasks.append(asyncio.create_task(gemini_pool.preload()))
+    startup_report.update(record_startup(import_seconds, time.perf_counter() - started))
+    startup_report["gemini"] = "available" if gemini_pool.available else "degraded"
+    logging.info(f"Worker {os.getpid()} ready: import {startup_report['import_seconds'] * 1000:.0f} ms, "
+                 f"startup {startup_report['startup_seconds'] * 1000:.0f} ms, RSS {startup_report['rss_mb']:.0f} MB")
+    yield
+    for task in background_tasks:
+        task.cancel()
+    await asyncio.gather(*background_tasks, return_exceptions=True)
+    background_tasks.clear()
+    await loop_lag.stop()
+    await alert_hub.stop()
+    await scheduler.stop()
+    await wearable_scheduler.stop()
+    # Flush queued writes while the client is still open; leftovers go to the spill file
+    await writes.stop()
     client_db.close()
+    gemini_pool.shutdown()
+    password_hasher.shutdown()
+    await close_http_client()
+
+def create_app() -> FastAPI:
+    application = FastAPI(lifespan=lifespan)
+    application.include_router(api_router)
+    application.include_router(ops_router)
+    # Google OAuth callback (the flow starts at POST /api/google/connect); it stores tokens through app.state.google_tokens
+    application.include_router(google_oauth_router, prefix="/auth")
+    application.state.google_tokens = google_tokens
+    application.add_middleware(
+        CORSMiddleware,
+        allow_origins=["*"],  # update for production
+        allow_credentials=True,
+        allow_methods=["*"],
+        allow_headers=["*"],
+        expose_headers=["X-Next-Cursor"],
+    )
+    if METRICS_ENABLED:
+        # Added last so it is outermost and times CORS handling too
+        application.add_middleware(MetricsMiddleware)
+    return application
+
+app = create_app()
+import_seconds = time.perf_counter() - _import_started
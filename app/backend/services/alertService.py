@@ -0,0 +1,255 @@
+import asyncio
+import json
+import logging
+import os
+from collections import defaultdict
+from typing import AsyncIterator, Dict, Iterable, List, Optional, Set, Tuple
+
+from cachetools import LRUCache
+from pymongo.errors import PyMongoError
+
+from services.dateService import as_utc, dates_to_iso, to_iso
+
+ALERT_QUEUE_SIZE = int(os.environ.get("ALERT_QUEUE_SIZE", 256))
+ALERT_MAX_SUBSCRIBERS = int(os.environ.get("ALERT_MAX_SUBSCRIBERS", 10000))
+ALERT_HEARTBEAT_SECONDS = float(os.environ.get("ALERT_HEARTBEAT_SECONDS", 20))
+# A subscriber that has had this many events dropped is disconnected and must reload the panel
+ALERT_SLOW_CONSUMER_DROPS = int(os.environ.get("ALERT_SLOW_CONSUMER_DROPS", 1024))
+# "local": publish from the write paths in this process; "changestream": follow Mongo inserts so
+# every API worker sees writes made by any of them (needs a replica set)
+ALERT_SOURCE = os.environ.get("ALERT_SOURCE", "local").lower()
+ALERT_LEVEL_CACHE_SIZE = int(os.environ.get("ALERT_LEVEL_CACHE_SIZE", 100000))
+
+_CLOSED = ("closed", None)
+
+
+class AlertHubFull(Exception):
+    """Raised when the hub already has ALERT_MAX_SUBSCRIBERS connections."""
+
+
+def _encode(kind: str, payload: dict) -> Tuple[str, str]:
+    # Serialized once per event, however many subscribers receive it
+    return kind, json.dumps({"type": kind, **payload}, default=to_iso)
+
+
+class Subscription:
+    """One connected doctor: the patients they follow and a bounded queue of encoded events.
+
+    ``offer`` never blocks the publisher. When the queue is full the oldest
+    event is dropped and counted; the next event the client reads is
+    preceded by a ``resync`` telling it how many it missed. A consumer
+    that keeps falling behind is closed.
+    """
+
+    def __init__(self, doctor_id: str, patient_ids: Iterable[str], maxsize: int = ALERT_QUEUE_SIZE,
+                 max_drops: int = ALERT_SLOW_CONSUMER_DROPS):
+        self.doctor_id = doctor_id
+        self.patient_ids: Set[str] = set(patient_ids)
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=maxsize)
+        self.max_drops = max_drops
+        self.missed = 0
+        self.dropped = 0
+        self.delivered = 0
+        self.closed = False
+        self.close_reason: Optional[str] = None
+
+    def _put(self, item):
+        try:
+            self.queue.put_nowait(item)
+        except asyncio.QueueFull:
+            # Keep the newest: the doctor cares about the current state, not a stale backlog
+            self.queue.get_nowait()
+            self.missed += 1
+            self.dropped += 1
+            self.queue.put_nowait(item)
+
+    def offer(self, event: Tuple[str, str]):
+        if self.closed:
+            return
+        self._put(event)
+        if self.dropped >= self.max_drops:
+            self.close("slow consumer")
+
+    def close(self, reason: str = "closed"):
+        if not self.closed:
+            self.closed = True
+            self.close_reason = reason
+            self._put(_CLOSED)
+
+    async def events(self, heartbeat: float = ALERT_HEARTBEAT_SECONDS) -> AsyncIterator[Tuple[str, str]]:
+        """(event type, JSON text) pairs, with a ``ping`` whenever nothing arrived for ``heartbeat`` seconds."""
+        while True:
+            try:
+                item = await asyncio.wait_for(self.queue.get(), heartbeat)
+            except asyncio.TimeoutError:
+                yield _encode("ping", {})
+                continue
+            if self.missed:
+                yield _encode("resync", {"missed": self.missed})
+                self.missed = 0
+            if item is _CLOSED:
+                yield _encode("closed", {"reason": self.close_reason})
+                return
+            self.delivered += 1
+            yield item
+
+
+class AlertHub:
+    """In-process pub/sub for risk-level transitions and new vitals, fanned out to doctors.
+
+    Subscribers are indexed by patient id, so publishing costs one dict
+    lookup plus one queue put per doctor following that patient. Events
+    come either from the write paths in this process (``vitals_written`` /
+    ``risk_recorded``) or, with ``source="changestream"``, from a Mongo
+    change stream on vitals and risk_scores inserts.
+    """
+
+    def __init__(self, db, source: str = ALERT_SOURCE, queue_size: int = ALERT_QUEUE_SIZE,
+                 max_subscribers: int = ALERT_MAX_SUBSCRIBERS):
+        self.db = db
+        self.source = source
+        self.queue_size = queue_size
+        self.max_subscribers = max_subscribers
+        self._by_patient: Dict[str, Set[Subscription]] = defaultdict(set)
+        self._by_doctor: Dict[str, Set[Subscription]] = defaultdict(set)
+        self._levels: LRUCache = LRUCache(maxsize=ALERT_LEVEL_CACHE_SIZE)
+        self._task: Optional[asyncio.Task] = None
+        self._resume_token = None
+        self.subscribers = 0
+        self.published = 0
+        self.slow_disconnects = 0
+
+    # --- Subscribers ---
+    async def subscribe(self, doctor_id: str) -> Subscription:
+        if self.subscribers >= self.max_subscribers:
+            raise AlertHubFull("Too many alert subscribers, please retry shortly")
+        docs = await self.db.patient_summaries.find({"doctor_ids": doctor_id}, {"_id": 0, "id": 1}).to_list(None)
+        return self.add(Subscription(doctor_id, [d["id"] for d in docs], self.queue_size))
+
+    def add(self, sub: Subscription) -> Subscription:
+        for patient_id in sub.patient_ids:
+            self._by_patient[patient_id].add(sub)
+        self._by_doctor[sub.doctor_id].add(sub)
+        self.subscribers += 1
+        return sub
+
+    def unsubscribe(self, sub: Subscription):
+        if sub.close_reason == "slow consumer":
+            self.slow_disconnects += 1
+        sub.close("unsubscribed")
+        for patient_id in sub.patient_ids:
+            subs = self._by_patient.get(patient_id)
+            if subs is not None:
+                subs.discard(sub)
+                if not subs:
+                    del self._by_patient[patient_id]
+        subs = self._by_doctor.get(sub.doctor_id)
+        if subs is not None and sub in subs:
+            subs.discard(sub)
+            self.subscribers -= 1
+            if not subs:
+                del self._by_doctor[sub.doctor_id]
+
+    def follow(self, doctor_id: str, patient_id: str):
+        # A patient who just booked with this doctor joins the doctor's open streams
+        for sub in self._by_doctor.get(doctor_id, ()):
+            if patient_id not in sub.patient_ids:
+                sub.patient_ids.add(patient_id)
+                self._by_patient[patient_id].add(sub)
+
+    # --- Publishing ---
+    def publish(self, patient_id: str, event: Tuple[str, str]) -> int:
+        subs = self._by_patient.get(patient_id)
+        if not subs:
+            return 0
+        self.published += 1
+        for sub in list(subs):
+            sub.offer(event)
+        return len(subs)
+
+    def _publish_vitals(self, patient_id: str, docs: List[dict]) -> int:
+        if patient_id not in self._by_patient or not docs:
+            return 0
+        latest = max(docs, key=lambda d: as_utc(d["timestamp"]))
+        payload = {"patient_id": patient_id, "count": len(docs), "latest": dates_to_iso({k: v for k, v in latest.items() if k != "_id"})}
+        return self.publish(patient_id, _encode("vitals", payload))
+
+    def _publish_risk(self, risk_doc: dict, previous_level: Optional[str]) -> int:
+        patient_id = risk_doc["user_id"]
+        level = risk_doc["risk_level"]
+        self._levels[patient_id] = level
+        # A first score only matters if it isn't "low"
+        if level == (previous_level or "low") or patient_id not in self._by_patient:
+            return 0
+        payload = {
+            "patient_id": patient_id,
+            "from": previous_level,
+            "to": level,
+            "score": risk_doc.get("score"),
+            "factors": risk_doc.get("factors", []),
+            "timestamp": risk_doc.get("timestamp"),
+        }
+        return self.publish(patient_id, _encode("risk_transition", payload))
+
+    def vitals_written(self, patient_id: str, docs: List[dict]):
+        if self.source == "local":
+            self._publish_vitals(patient_id, docs)
+
+    def risk_recorded(self, risk_doc: dict, previous_level: Optional[str]):
+        if self.source == "local":
+            self._publish_risk(risk_doc, previous_level)
+
+    # --- Change stream source ---
+    async def _previous_level(self, risk_doc: dict) -> Optional[str]:
+        patient_id = risk_doc["user_id"]
+        if patient_id in self._levels:
+            return self._levels[patient_id]
+        before = await self.db.risk_scores.find_one(
+            {"user_id": patient_id, "timestamp": {"$lt": risk_doc["timestamp"]}},
+            {"_id": 0, "risk_level": 1}, sort=[("timestamp", -1)],
+        )
+        return before["risk_level"] if before else None
+
+    async def _watch(self):
+        pipeline = [{"$match": {"operationType": "insert", "ns.coll": {"$in": ["vitals", "risk_scores"]}}}]
+        while True:
+            try:
+                async with self.db.watch(pipeline, resume_after=self._resume_token) as stream:
+                    logging.info("Alert hub following vitals and risk_scores change stream")
+                    async for change in stream:
+                        self._resume_token = change["_id"]
+                        doc = change["fullDocument"]
+                        if change["ns"]["coll"] == "vitals":
+                            self._publish_vitals(doc["user_id"], [doc])
+                        else:
+                            self._publish_risk(doc, await self._previous_level(doc))
+            except asyncio.CancelledError:
+                raise
+            except PyMongoError as e:
+                logging.error(f"Alert change stream failed, retrying: {e}")
+                await asyncio.sleep(5)
+
+    def start(self):
+        if self.source == "changestream" and (self._task is None or self._task.done()):
+            self._task = asyncio.create_task(self._watch())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        for subs in list(self._by_doctor.values()):
+            for sub in list(subs):
+                sub.close("server shutting down")
+
+    def stats(self) -> dict:
+        return {
+            "source": self.source,
+            "subscribers": self.subscribers,
+            "patients_followed": len(self._by_patient),
+            "published": self.published,
+            "slow_disconnects": self.slow_disconnects,
+        }
@@ -0,0 +1,145 @@
+import os
+import re
+from typing import Callable, Dict, List, Optional
+
+from cachetools import TTLCache
+
+CHAT_CONTEXT_TOKENS = int(os.environ.get("CHAT_CONTEXT_TOKENS", 1500))
+CHAT_SUMMARY_TOKENS = int(os.environ.get("CHAT_SUMMARY_TOKENS", 400))
+CHAT_HISTORY_MAX_TURNS = int(os.environ.get("CHAT_HISTORY_MAX_TURNS", 40))
+CHAT_CACHE_SIZE = int(os.environ.get("CHAT_CACHE_SIZE", 512))
+CHAT_CACHE_TTL_SECONDS = int(os.environ.get("CHAT_CACHE_TTL_SECONDS", 3600))
+
+
+def estimate_tokens(text: str) -> int:
+    # Rough heuristic (~4 chars per token); good enough for budgeting a prompt
+    return max(1, len(text) // 4) if text else 0
+
+
+def normalize_prompt(message: str) -> str:
+    text = re.sub(r"[^\w\s]", " ", message.lower())
+    return " ".join(text.split())
+
+
+def _first_sentence(text: str, limit: int = 160) -> str:
+    sentence = re.split(r"(?<=[.!?])\s", text.strip(), maxsplit=1)[0]
+    return sentence if len(sentence) <= limit else sentence[:limit].rstrip() + "…"
+
+
+def _trim_to_tokens(text: str, max_tokens: int) -> str:
+    # Keep the newest part of the summary when it outgrows its budget
+    max_chars = max_tokens * 4
+    return text if len(text) <= max_chars else "…" + text[-max_chars:]
+
+
+class ConversationStore:
+    """Rolling chat context per session, backed by db.chats and db.chat_sessions.
+
+    The newest turns that fit in ``context_tokens`` (at most ``max_turns``)
+    go into the prompt as-is. Turns that fall out of that window are folded
+    into a short extractive summary kept on the session document, so older
+    context costs a bounded number of tokens instead of growing with the
+    conversation.
+
+    ``pending(user_id)``, when given, returns turns saved but not yet in
+    db.chats (write-behind), so the next turn still sees them.
+    """
+
+    def __init__(self, db, context_tokens: int = CHAT_CONTEXT_TOKENS,
+                 summary_tokens: int = CHAT_SUMMARY_TOKENS, max_turns: int = CHAT_HISTORY_MAX_TURNS,
+                 pending: Optional[Callable[[str], List[dict]]] = None):
+        self.db = db
+        self.pending = pending
+        self.context_tokens = context_tokens
+        self.summary_tokens = summary_tokens
+        self.max_turns = max_turns
+
+    async def load_context(self, user_id: str, session_id: str) -> Dict:
+        session = await self.db.chat_sessions.find_one(
+            {"session_id": session_id, "user_id": user_id}, {"_id": 0}
+        ) or {}
+        summary = session.get("summary", "")
+        query = {"user_id": user_id, "session_id": session_id}
+        if session.get("summarized_until"):
+            query["timestamp"] = {"$gt": session["summarized_until"]}
+        # One past the cap tells us whether anything older than the window is left unsummarized
+        recent = await self.db.chats.find(query, {"_id": 0}).sort("timestamp", -1).limit(self.max_turns + 1).to_list(self.max_turns + 1)
+        stored = len(recent)
+        if self.pending:
+            seen = {t["id"] for t in recent}
+            since = session.get("summarized_until")
+            queued = [t for t in self.pending(user_id) if t["session_id"] == session_id and t["id"] not in seen
+                      and (not since or t["timestamp"] > since)]
+            if queued:
+                recent = sorted(recent + queued, key=lambda t: t["timestamp"], reverse=True)
+
+        window: List[dict] = []
+        used = 0
+        cut = self.max_turns if len(recent) > self.max_turns else None
+        for i, turn in enumerate(recent[:self.max_turns]):
+            cost = estimate_tokens(turn["message"]) + estimate_tokens(turn["response"])
+            if window and used + cost > self.context_tokens:
+                cut = i
+                break
+            window.append(turn)
+            used += cost
+        if cut is not None:
+            # Every turn older than the window, including those past max_turns, goes into the summary
+            overflow = recent[cut:]
+            if stored > self.max_turns:
+                overflow += await self.db.chats.find(query, {"_id": 0}).sort("timestamp", -1).skip(stored).to_list(None)
+            summary = await self._fold(user_id, session_id, summary, overflow)
+        window.reverse()
+        return {"summary": summary, "turns": window}
+
+    async def _fold(self, user_id: str, session_id: str, summary: str, overflow: List[dict]) -> str:
+        # overflow is newest-first; fold oldest-first so the summary reads in order
+        lines = [
+            f"User asked: {_first_sentence(t['message'])} Assistant: {_first_sentence(t['response'])}"
+            for t in reversed(overflow)
+        ]
+        summary = _trim_to_tokens(" ".join(filter(None, [summary, *lines])), self.summary_tokens)
+        await self.db.chat_sessions.update_one(
+            {"session_id": session_id, "user_id": user_id},
+            {"$set": {"summary": summary, "summarized_until": overflow[0]["timestamp"]}},
+            upsert=True,
+        )
+        return summary
+
+    @staticmethod
+    def build_prompt(system_prompt: str, context: Dict, message: str) -> str:
+        parts = [system_prompt]
+        if context["summary"]:
+            parts.append("Summary of earlier conversation: " + context["summary"])
+        for turn in context["turns"]:
+            parts.append("User: " + turn["message"])
+            parts.append("CareCompanion: " + turn["response"])
+        parts.append("User: " + message)
+        return "\n".join(parts)
+
+
+class ResponseCache:
+    """TTL + LRU cache of replies keyed by the normalized question text.
+
+    Only replies generated without prior conversation context are stored, and
+    only first turns look them up: a follow-up such as "yes" means something
+    different in every conversation.
+    """
+
+    def __init__(self, maxsize: int = CHAT_CACHE_SIZE, ttl: int = CHAT_CACHE_TTL_SECONDS):
+        self._cache = TTLCache(maxsize=maxsize, ttl=ttl)
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, message: str) -> Optional[str]:
+        reply = self._cache.get(normalize_prompt(message))
+        if reply is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return reply
+
+    def put(self, message: str, reply: str):
+        key = normalize_prompt(message)
+        if key:
+            self._cache[key] = reply
@@ -0,0 +1,128 @@
+import asyncio
+import logging
+import os
+from typing import Dict, List
+
+from pymongo import UpdateOne
+
+from services.dateService import as_utc
+
+MIGRATION_BATCH_SIZE = int(os.environ.get("MIGRATION_BATCH_SIZE", 1000))
+MIGRATION_PAUSE_MS = int(os.environ.get("MIGRATION_PAUSE_MS", 50))
+
+# Fields that used to be written as isoformat() strings (scheduled_time was whatever the client sent)
+DATE_FIELDS: Dict[str, List[str]] = {
+    "users": ["created_at"],
+    "vitals": ["timestamp"],
+    "risk_scores": ["timestamp"],
+    "chats": ["timestamp"],
+    "chat_sessions": ["summarized_until"],
+    "appointments": ["created_at", "scheduled_time"],
+    # Bookkeeping fields the first pass of this migration missed
+    "risk_state": ["updated_at"],
+    "fit_buckets": ["synced_at"],
+    "fit_sync_state": ["synced_at"],
+    "vital_rollups": ["updated_at"],
+}
+
+
+async def migrate_collection(db, name: str, fields: List[str], batch_size: int = MIGRATION_BATCH_SIZE,
+                             pause_ms: int = MIGRATION_PAUSE_MS, dry_run: bool = False) -> dict:
+    """Convert string date fields to native dates, one _id-ordered batch at a time.
+
+    Safe to run against a live database: each update is guarded on the
+    string value it read, so a document rewritten in the meantime is left
+    alone, and the pause between batches keeps it from hogging the
+    primary. Strings that aren't ISO dates are logged and skipped.
+    Re-running picks up whatever is still a string.
+    """
+    collection = db[name]
+    pending = {"$or": [{f: {"$type": "string"}} for f in fields]}
+    stats = {"scanned": 0, "converted": 0, "unparseable": 0}
+    last_id = None
+    while True:
+        query = pending if last_id is None else {"$and": [pending, {"_id": {"$gt": last_id}}]}
+        batch = await collection.find(query, {f: 1 for f in fields}).sort("_id", 1).limit(batch_size).to_list(batch_size)
+        if not batch:
+            break
+        ops = []
+        for doc in batch:
+            guard, update = {"_id": doc["_id"]}, {}
+            for field in fields:
+                value = doc.get(field)
+                if not isinstance(value, str):
+                    continue
+                try:
+                    update[field] = as_utc(value)
+                    guard[field] = value
+                except ValueError:
+                    stats["unparseable"] += 1
+                    logging.warning(f"{name} {doc['_id']}: {field}={value!r} is not an ISO date, left as is")
+            if update:
+                ops.append(UpdateOne(guard, {"$set": update}))
+        stats["scanned"] += len(batch)
+        if ops and not dry_run:
+            result = await collection.bulk_write(ops, ordered=False)
+            stats["converted"] += result.modified_count
+        elif dry_run:
+            stats["converted"] += len(ops)
+        last_id = batch[-1]["_id"]
+        await asyncio.sleep(pause_ms / 1000)
+    logging.info(f"Date migration {name}: {stats}")
+    return stats
+
+
+async def migrate_risk_windows(db, batch_size: int = MIGRATION_BATCH_SIZE, dry_run: bool = False) -> dict:
+    # risk_state windows embed vitals timestamps; a mix of strings and dates would break their $sort
+    stats = {"scanned": 0, "converted": 0}
+    cursor = db.risk_state.find({"window.timestamp": {"$type": "string"}}, {"_id": 1, "window": 1}).batch_size(batch_size)
+    async for doc in cursor:
+        stats["scanned"] += 1
+        try:
+            window = [{**entry, "timestamp": as_utc(entry.get("timestamp"))} for entry in doc["window"]]
+        except ValueError:
+            # Dropping the state makes the engine rebuild it from db.vitals
+            window = None
+        if dry_run:
+            stats["converted"] += 1
+            continue
+        if window is None:
+            result = await db.risk_state.delete_one({"_id": doc["_id"], "window": doc["window"]})
+            stats["converted"] += result.deleted_count
+        else:
+            result = await db.risk_state.update_one({"_id": doc["_id"], "window": doc["window"]}, {"$set": {"window": window}})
+            stats["converted"] += result.modified_count
+    logging.info(f"Date migration risk_state: {stats}")
+    return stats
+
+
+async def migrate_all(db, batch_size: int = MIGRATION_BATCH_SIZE, pause_ms: int = MIGRATION_PAUSE_MS,
+                      dry_run: bool = False) -> Dict[str, dict]:
+    results = {}
+    for name, fields in DATE_FIELDS.items():
+        results[name] = await migrate_collection(db, name, fields, batch_size, pause_ms, dry_run)
+    results["risk_state.window"] = await migrate_risk_windows(db, batch_size, dry_run)
+    if not dry_run:
+        # Daily rollups keep last_at per metric; rebuild them from the converted vitals
+        from services.rollupService import VitalRollups
+        await VitalRollups(db).rebuild()
+    return results
+
+
+if __name__ == "__main__":
+    # python -m services.dateMigrationService [--dry-run]
+    import sys
+    from pathlib import Path
+    from dotenv import load_dotenv
+    from motor.motor_asyncio import AsyncIOMotorClient
+
+    load_dotenv(Path(__file__).parent.parent / ".env")
+    logging.basicConfig(level=logging.INFO)
+
+    async def _main():
+        client = AsyncIOMotorClient(os.environ.get("MONGO_URL", "mongodb://localhost:27017"), tz_aware=True)
+        db = client[os.environ.get("DB_NAME", "carecompanion_db")]
+        print(await migrate_all(db, dry_run="--dry-run" in sys.argv))
+        client.close()
+
+    asyncio.run(_main())
@@ -0,0 +1,38 @@
+from datetime import date, datetime, timezone
+from typing import Any, Optional
+
+
+def utcnow() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+def as_utc(value) -> Optional[datetime]:
+    """Aware UTC datetime from a datetime (naive means UTC) or an ISO-8601 string.
+
+    Raises ValueError for strings that aren't ISO dates.
+    """
+    if value is None:
+        return None
+    if isinstance(value, str):
+        value = datetime.fromisoformat(value.strip())
+    elif isinstance(value, date) and not isinstance(value, datetime):
+        value = datetime(value.year, value.month, value.day)
+    if value.tzinfo is None:
+        return value.replace(tzinfo=timezone.utc)
+    return value.astimezone(timezone.utc)
+
+
+def to_iso(value: Any) -> Any:
+    # The API has always returned datetime.isoformat() strings with a +00:00 offset
+    if isinstance(value, datetime):
+        return as_utc(value).isoformat()
+    return value
+
+
+def dates_to_iso(value: Any) -> Any:
+    """Copy of a stored document (or list of them) with every datetime rendered as an ISO string."""
+    if isinstance(value, dict):
+        return {k: dates_to_iso(v) for k, v in value.items()}
+    if isinstance(value, list):
+        return [dates_to_iso(v) for v in value]
+    return to_iso(value)
@@ -0,0 +1,184 @@
+import asyncio
+import csv
+import io
+import json
+import os
+from typing import AsyncIterator, Dict, List, Tuple
+
+from services.dateService import as_utc, to_iso
+
+EXPORT_BATCH_SIZE = int(os.environ.get("EXPORT_BATCH_SIZE", 1000))
+EXPORT_CHUNK_BYTES = int(os.environ.get("EXPORT_CHUNK_BYTES", 64 * 1024))
+EXPORT_PARQUET_ROW_GROUP = int(os.environ.get("EXPORT_PARQUET_ROW_GROUP", 50000))
+
+EXPORT_FORMATS = {
+    "ndjson": ("application/x-ndjson", "ndjson"),
+    "csv": ("text/csv", "csv"),
+    "parquet": ("application/vnd.apache.parquet", "parquet"),
+}
+EXPORT_DATASETS = ("all", "vitals", "risk_scores")
+
+# One flat schema for both collections so CSV and Parquet get a single table; "record" says which it came from
+EXPORT_COLUMNS = [
+    ("record", "string"),
+    ("id", "string"),
+    ("user_id", "string"),
+    ("timestamp", "timestamp"),
+    ("heart_rate", "int64"),
+    ("blood_pressure_systolic", "int64"),
+    ("blood_pressure_diastolic", "int64"),
+    ("temperature", "float64"),
+    ("oxygen_saturation", "int64"),
+    ("sleep_hours", "float64"),
+    ("activity_minutes", "int64"),
+    ("notes", "string"),
+    ("source", "string"),
+    ("score", "float64"),
+    ("risk_level", "string"),
+    ("factors", "list<string>"),
+    ("recommendations", "list<string>"),
+]
+COLUMN_NAMES = [name for name, _ in EXPORT_COLUMNS]
+PROJECTION = {"_id": 0, **{name: 1 for name in COLUMN_NAMES if name != "record"}}
+
+
+class ExportUnavailable(Exception):
+    """The requested format needs an optional dependency that isn't installed."""
+
+
+async def iter_history(db, user_id: str, dataset: str = "all",
+                       batch_size: int = EXPORT_BATCH_SIZE) -> AsyncIterator[dict]:
+    """Vitals then risk scores for one user, oldest first, straight off the cursors.
+
+    Motor fetches ``batch_size`` documents per round trip, so memory stays
+    flat however long the history is.
+    """
+    sources = [("vital", db.vitals), ("risk_score", db.risk_scores)]
+    if dataset == "vitals":
+        sources = sources[:1]
+    elif dataset == "risk_scores":
+        sources = sources[1:]
+    for record, collection in sources:
+        cursor = collection.find({"user_id": user_id}, PROJECTION).sort([("timestamp", 1), ("id", 1)]).batch_size(batch_size)
+        async for doc in cursor:
+            doc["record"] = record
+            yield doc
+
+
+async def _chunked(pieces: AsyncIterator[bytes], chunk_bytes: int = EXPORT_CHUNK_BYTES) -> AsyncIterator[bytes]:
+    # Few larger writes beat one tiny write per row on the socket
+    buffer, size = [], 0
+    async for piece in pieces:
+        buffer.append(piece)
+        size += len(piece)
+        if size >= chunk_bytes:
+            yield b"".join(buffer)
+            buffer, size = [], 0
+    if buffer:
+        yield b"".join(buffer)
+
+
+async def encode_ndjson(rows: AsyncIterator[dict]) -> AsyncIterator[bytes]:
+    async def lines():
+        async for row in rows:
+            yield (json.dumps(row, default=to_iso) + "\n").encode()
+    async for chunk in _chunked(lines()):
+        yield chunk
+
+
+async def encode_csv(rows: AsyncIterator[dict]) -> AsyncIterator[bytes]:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+
+    def take() -> bytes:
+        data = buffer.getvalue().encode()
+        buffer.seek(0)
+        buffer.truncate()
+        return data
+
+    async def lines():
+        writer.writerow(COLUMN_NAMES)
+        yield take()
+        async for row in rows:
+            writer.writerow([
+                "; ".join(v) if isinstance(v, list) else ("" if v is None else to_iso(v))
+                for v in (row.get(name) for name in COLUMN_NAMES)
+            ])
+            yield take()
+    async for chunk in _chunked(lines()):
+        yield chunk
+
+
+class _ChunkSink(io.RawIOBase):
+    # File-like target for ParquetWriter that hands back whatever was written since the last drain
+    def __init__(self):
+        self._chunks: List[bytes] = []
+        self._position = 0
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data) -> int:
+        data = bytes(data)
+        self._chunks.append(data)
+        self._position += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self._position
+
+    def drain(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks = []
+        return data
+
+
+def _arrow_schema():
+    try:
+        import pyarrow as pa
+    except ImportError as e:
+        raise ExportUnavailable("Parquet export requires pyarrow") from e
+    types = {"string": pa.string(), "int64": pa.int64(), "float64": pa.float64(), "list<string>": pa.list_(pa.string()),
+             "timestamp": pa.timestamp("ms", tz="UTC")}
+    return pa.schema([(name, types[kind]) for name, kind in EXPORT_COLUMNS])
+
+
+async def encode_parquet(rows: AsyncIterator[dict], row_group_size: int = EXPORT_PARQUET_ROW_GROUP) -> AsyncIterator[bytes]:
+    """Parquet written one row group at a time; only the current group is held in memory."""
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    schema = _arrow_schema()
+    sink = _ChunkSink()
+    writer = pq.ParquetWriter(sink, schema, compression="snappy")
+
+    def flush(columns: Dict[str, list]) -> bytes:
+        # Columnar encoding + compression is CPU work, so it runs off the event loop
+        writer.write_table(pa.Table.from_pydict(columns, schema=schema), row_group_size=row_group_size)
+        return sink.drain()
+
+    columns: Dict[str, list] = {name: [] for name in COLUMN_NAMES}
+    count = 0
+    async for row in rows:
+        for name in COLUMN_NAMES:
+            columns[name].append(row.get(name))
+        # Native timestamp column; as_utc also covers rows still holding legacy ISO strings
+        columns["timestamp"][-1] = as_utc(columns["timestamp"][-1])
+        count += 1
+        if count >= row_group_size:
+            yield await asyncio.to_thread(flush, columns)
+            columns = {name: [] for name in COLUMN_NAMES}
+            count = 0
+    if count:
+        yield await asyncio.to_thread(flush, columns)
+    writer.close()
+    yield sink.drain()
+
+
+def export_stream(db, user_id: str, fmt: str, dataset: str = "all") -> Tuple[str, str, AsyncIterator[bytes]]:
+    """(media type, file extension, body iterator) for a patient history export."""
+    media_type, extension = EXPORT_FORMATS[fmt]
+    if fmt == "parquet":
+        _arrow_schema()  # fail before the response starts if pyarrow is missing
+    encoder = {"ndjson": encode_ndjson, "csv": encode_csv, "parquet": encode_parquet}[fmt]
+    return media_type, extension, encoder(iter_history(db, user_id, dataset))
@@ -0,0 +1,128 @@
+import asyncio
+import logging
+import os
+import time
+from datetime import datetime, timezone
+from typing import Dict, List, Optional
+
+from pymongo import UpdateOne
+
+from services.dateService import utcnow
+from services.googleFitService import fetch_wearable_buckets
+
+DAY_MS = 86400000
+FIT_SYNC_BACKFILL_DAYS = int(os.environ.get("FIT_SYNC_BACKFILL_DAYS", 30))
+FIT_SYNC_MAX_AGE_SECONDS = int(os.environ.get("FIT_SYNC_MAX_AGE_SECONDS", 300))
+
+
+def _now_ms() -> int:
+    return int(time.time() * 1000)
+
+
+def _ms_to_iso(ms: int) -> str:
+    return datetime.fromtimestamp(ms / 1000, tz=timezone.utc).isoformat()
+
+
+def bucket_floor(ms: int, bucket_ms: int = DAY_MS) -> int:
+    return ms - ms % bucket_ms
+
+
+class FitSync:
+    """Local store of daily Google Fit aggregates with incremental sync.
+
+    Buckets live in ``fit_buckets`` (one document per user/metric/day) and
+    ``fit_sync_state`` remembers a high-water mark per user and metric. A
+    sync only asks Google for buckets from the last (possibly partial) day
+    onward, so a repeat load costs one small aggregate call, or none at all
+    while the data is younger than ``max_age`` seconds.
+    """
+
+    def __init__(self, db, backfill_days: int = FIT_SYNC_BACKFILL_DAYS, max_age: int = FIT_SYNC_MAX_AGE_SECONDS,
+                 bucket_ms: int = DAY_MS):
+        self.db = db
+        self.backfill_days = backfill_days
+        self.max_age = max_age
+        self.bucket_ms = bucket_ms
+        self._inflight: Dict[tuple, asyncio.Task] = {}
+
+    async def _sync_state(self, user_id: str, metrics: List[str]) -> Dict[str, dict]:
+        rows = await self.db.fit_sync_state.find(
+            {"user_id": user_id, "metric": {"$in": metrics}}, {"_id": 0}
+        ).to_list(len(metrics))
+        return {r["metric"]: r for r in rows}
+
+    async def sync(self, user_id: str, access_token: str, metrics: List[str], quota=None) -> List[tuple]:
+        """Fetch buckets newer than each metric's high-water mark.
+
+        Returns the (metric, start_ms, end_ms, value) rows that were written.
+        ``quota`` (e.g. the scheduler's TokenBucket) is charged per aggregate call.
+        """
+        now = _now_ms()
+        state = await self._sync_state(user_id, metrics)
+        backfill_start = bucket_floor(now - self.backfill_days * DAY_MS, self.bucket_ms)
+
+        # Metrics with the same resume point share one aggregate call
+        by_start: Dict[int, List[str]] = {}
+        for metric in metrics:
+            high_water = state.get(metric, {}).get("high_water_ms")
+            # Re-fetch the bucket the mark falls in: it was still filling up at the last sync
+            start = bucket_floor(high_water, self.bucket_ms) if high_water else backfill_start
+            by_start.setdefault(max(start, backfill_start), []).append(metric)
+
+        results = await asyncio.gather(*(
+            fetch_wearable_buckets(access_token, names, start, now, self.bucket_ms, quota=quota)
+            for start, names in by_start.items()
+        ))
+        rows = [row for result in results for row in result]
+        synced_at = utcnow()
+        if rows:
+            await self.db.fit_buckets.bulk_write([
+                UpdateOne(
+                    {"user_id": user_id, "metric": metric, "start_ms": start},
+                    {"$set": {"end_ms": end, "value": value, "synced_at": synced_at}},
+                    upsert=True,
+                )
+                for metric, start, end, value in rows
+            ], ordered=False)
+        await self.db.fit_sync_state.bulk_write([
+            UpdateOne(
+                {"user_id": user_id, "metric": metric},
+                {"$set": {"high_water_ms": now, "synced_at": synced_at, "synced_at_ms": now}},
+                upsert=True,
+            )
+            for metric in metrics
+        ], ordered=False)
+        logging.info(f"Fit sync for {user_id}: {len(rows)} buckets across {len(by_start)} calls")
+        return rows
+
+    async def sync_once(self, user_id: str, access_token: str, metrics: List[str], quota=None) -> List[tuple]:
+        # Single-flight: concurrent dashboard loads for one user share the same sync
+        key = (user_id, tuple(sorted(metrics)))
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(self.sync(user_id, access_token, metrics, quota=quota))
+            self._inflight[key] = task
+            task.add_done_callback(lambda _: self._inflight.pop(key, None))
+        return await asyncio.shield(task)
+
+    async def is_fresh(self, user_id: str, metrics: List[str]) -> bool:
+        state = await self._sync_state(user_id, metrics)
+        cutoff = _now_ms() - self.max_age * 1000
+        return all(state.get(m, {}).get("synced_at_ms", 0) >= cutoff for m in metrics)
+
+    async def read(self, user_id: str, metrics: List[str], start_ms: int, end_ms: Optional[int] = None) -> Dict[str, list]:
+        query = {"user_id": user_id, "metric": {"$in": metrics}, "start_ms": {"$gte": start_ms}}
+        if end_ms is not None:
+            query["start_ms"]["$lte"] = end_ms
+        docs = await self.db.fit_buckets.find(query, {"_id": 0}).sort("start_ms", 1).to_list(None)
+        out = {m: [] for m in metrics}
+        for d in docs:
+            out[d["metric"]].append({"start": _ms_to_iso(d["start_ms"]), "end": _ms_to_iso(d["end_ms"]), **d["value"]})
+        return out
+
+    async def get(self, user_id: str, access_token: str, metrics: List[str], days: int = 7,
+                  refresh: bool = False) -> Dict[str, list]:
+        if refresh or not await self.is_fresh(user_id, metrics):
+            await self.sync_once(user_id, access_token, metrics)
+        start = bucket_floor(_now_ms() - (days - 1) * DAY_MS, self.bucket_ms)
+        return await self.read(user_id, metrics, start)
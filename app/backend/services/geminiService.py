@@ -0,0 +1,205 @@
+import asyncio
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import AsyncIterator, Optional
+
+from services.metricsService import timed
+
+GEMINI_MAX_CONCURRENCY = int(os.environ.get("GEMINI_MAX_CONCURRENCY", 4))
+GEMINI_MAX_QUEUE = int(os.environ.get("GEMINI_MAX_QUEUE", 32))
+GEMINI_TIMEOUT_SECONDS = float(os.environ.get("GEMINI_TIMEOUT_SECONDS", 60))
+# Sent as Retry-After when chat is refused for back-pressure (busy or timed out)
+GEMINI_RETRY_AFTER_SECONDS = int(os.environ.get("GEMINI_RETRY_AFTER_SECONDS", 5))
+GEMINI_API_KEY = os.environ.get("GEMINI_API_KEY")
+GEMINI_MODEL = os.environ.get("GEMINI_MODEL", "gemini-pro")
+# The SDK (and its grpc stack) is imported on the first chat; "true" loads it in the background at startup instead
+GEMINI_PRELOAD = os.environ.get("GEMINI_PRELOAD", "false").lower() in ("1", "true", "yes")
+
+
+class GeminiBusyError(Exception):
+    """Raised when the wait queue for Gemini workers is full."""
+
+
+class GeminiTimeoutError(Exception):
+    """Raised when a Gemini call doesn't answer within the pool's timeout."""
+
+
+class GeminiUnavailable(Exception):
+    """Raised when chat can't be served: no API key configured, or the SDK failed to load."""
+
+
+def extract_text(response) -> Optional[str]:
+    # The SDK has returned text in a few different shapes across versions
+    try:
+        reply_text = getattr(response, "text", None)
+    except ValueError:
+        # .text raises when a chunk/candidate has no text parts (e.g. safety block)
+        reply_text = None
+    if reply_text is None:
+        if hasattr(response, "candidates") and response.candidates:
+            reply_text = getattr(response.candidates[0], "text", None)
+        elif hasattr(response, "content"):
+            reply_text = response.content
+        else:
+            reply_text = str(response)
+    return reply_text
+
+
+class GeminiWorkerPool:
+    """Runs the blocking Gemini SDK calls on a bounded thread pool.
+
+    At most ``max_concurrency`` calls run at once; up to ``max_queue`` more
+    wait for a slot and anything beyond that is rejected with GeminiBusyError
+    so a chat burst can't pile up unbounded work behind the event loop.
+
+    Without a ``model``, the SDK is imported and configured on first use,
+    off the event loop. With no ``api_key``, the pool runs degraded: every
+    call raises GeminiUnavailable and the rest of the API works as usual.
+    """
+
+    def __init__(self, model=None, max_concurrency: int = GEMINI_MAX_CONCURRENCY,
+                 max_queue: int = GEMINI_MAX_QUEUE, timeout: float = GEMINI_TIMEOUT_SECONDS,
+                 api_key: Optional[str] = GEMINI_API_KEY, model_name: str = GEMINI_MODEL):
+        self.model = model
+        self.api_key = api_key
+        self.model_name = model_name
+        self._loading: Optional[asyncio.Future] = None
+        self.load_error: Optional[str] = None
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.timeout = timeout
+        self._executor = ThreadPoolExecutor(max_workers=max_concurrency, thread_name_prefix="gemini")
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._waiting = 0
+        self._active = 0
+
+    @property
+    def available(self) -> bool:
+        return self.model is not None or (bool(self.api_key) and self.load_error is None)
+
+    def _load(self):
+        import google.generativeai as genai
+
+        genai.configure(api_key=self.api_key)
+        return genai.GenerativeModel(self.model_name)
+
+    async def _model(self):
+        if self.model is not None:
+            return self.model
+        if not self.available:
+            raise GeminiUnavailable(f"Chat is unavailable: {self.load_error or 'GEMINI_API_KEY is not configured'}")
+        if self._loading is None:
+            self._loading = asyncio.ensure_future(asyncio.to_thread(self._load))
+        try:
+            self.model = await asyncio.shield(self._loading)
+        except Exception as e:
+            self.load_error = f"Gemini SDK failed to load ({e})"
+            logging.error(self.load_error, exc_info=True)
+            raise GeminiUnavailable(f"Chat is unavailable: {self.load_error}") from e
+        return self.model
+
+    async def preload(self):
+        # Swallowed here; the next chat request reports it
+        try:
+            await self._model()
+            logging.info(f"Gemini model {self.model_name} loaded")
+        except GeminiUnavailable:
+            pass
+
+    def _slots(self) -> asyncio.Semaphore:
+        # Created lazily so the semaphore binds to the running loop
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        return self._semaphore
+
+    async def _acquire(self):
+        slots = self._slots()
+        if slots.locked() and self._waiting >= self.max_queue:
+            raise GeminiBusyError("Chat service is busy, please retry shortly")
+        self._waiting += 1
+        try:
+            await slots.acquire()
+        finally:
+            self._waiting -= 1
+        self._active += 1
+
+    def _release(self):
+        self._active -= 1
+        self._slots().release()
+
+    def _finished(self, future: asyncio.Future):
+        self._release()
+        # Nobody awaits a call that outlived its timeout; fetch its error so it isn't logged as unretrieved
+        if not future.cancelled():
+            future.exception()
+
+    def stats(self) -> dict:
+        return {"available": self.available, "loaded": self.model is not None, "active": self._active,
+                "waiting": self._waiting, "max_concurrency": self.max_concurrency, "max_queue": self.max_queue}
+
+    async def generate(self, prompt: str) -> str:
+        model = await self._model()
+        await self._acquire()
+        loop = asyncio.get_running_loop()
+        try:
+            future = loop.run_in_executor(self._executor, model.generate_content, prompt)
+        except BaseException:
+            self._release()
+            raise
+        # The permit goes back when the worker thread is done, not when we stop waiting:
+        # a timed-out call keeps running, and must keep counting against max_concurrency
+        future.add_done_callback(self._finished)
+        with timed("gemini", "generate"):
+            # shield: a timeout or cancelled request must not mark the future done while the thread still runs
+            try:
+                response = await asyncio.wait_for(asyncio.shield(future), timeout=self.timeout)
+            except asyncio.TimeoutError:
+                raise GeminiTimeoutError(f"Chat model did not answer within {self.timeout:g}s") from None
+        reply_text = extract_text(response)
+        return reply_text.strip() if reply_text else ""
+
+    async def stream(self, prompt: str) -> AsyncIterator[str]:
+        model = await self._model()
+        await self._acquire()
+        loop = asyncio.get_running_loop()
+        queue: asyncio.Queue = asyncio.Queue()
+        stop = threading.Event()
+        done = object()
+
+        def produce():
+            try:
+                for chunk in model.generate_content(prompt, stream=True):
+                    if stop.is_set():
+                        break
+                    text = extract_text(chunk)
+                    if text:
+                        loop.call_soon_threadsafe(queue.put_nowait, text)
+            except Exception as e:
+                loop.call_soon_threadsafe(queue.put_nowait, e)
+            finally:
+                loop.call_soon_threadsafe(queue.put_nowait, done)
+
+        future = loop.run_in_executor(self._executor, produce)
+        # Covers the whole stream, not just the first chunk
+        with timed("gemini", "stream"):
+            try:
+                while True:
+                    try:
+                        item = await asyncio.wait_for(queue.get(), timeout=self.timeout)
+                    except asyncio.TimeoutError:
+                        raise GeminiTimeoutError(f"Chat model did not answer within {self.timeout:g}s") from None
+                    if item is done:
+                        break
+                    if isinstance(item, Exception):
+                        raise item
+                    yield item
+            finally:
+                # Client went away or we finished: tell the worker to stop pulling chunks
+                stop.set()
+                future.add_done_callback(lambda _: self._release())
+
+    def shutdown(self):
+        logging.info("Shutting down Gemini worker pool")
+        self._executor.shutdown(wait=False, cancel_futures=True)
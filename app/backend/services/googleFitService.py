@@ -1,4 +1,12 @@
-import httpx
+import asyncio
+import os
+from datetime import datetime, timezone
+from typing import Dict, List
+
+from services.httpClientService import request_with_retry
+from services.metricsService import timed
+
+GOOGLE_FIT_BASE_URL = os.environ.get("GOOGLE_FIT_BASE_URL", "https://www.googleapis.com/fitness/v1/users/me")
 
 # Example JSON body templates for aggregation - replace with your actual request body structures as per Google Fit API docs
 STEPS_AGGREGATE_BODY = {
@@ -37,35 +45,129 @@ OXYGEN_AGGREGATE_BODY = {
   "endTimeMillis": 1762646399999
 }
 
-async def fetch_steps(access_token: str):
-    url = "https://www.googleapis.com/fitness/v1/users/me/dataset:aggregate"
+async def fetch_aggregate(access_token: str, body: dict):
+    url = f"{GOOGLE_FIT_BASE_URL}/dataset:aggregate"
     headers = {"Authorization": f"Bearer {access_token}"}
-    async with httpx.AsyncClient() as client:
-        response = await client.post(url, json=STEPS_AGGREGATE_BODY, headers=headers)
+    with timed("google_fit", "aggregate"):
+        response = await request_with_retry("POST", url, json=body, headers=headers)
         response.raise_for_status()
-        return response.json()
+    return response.json()
+
+async def fetch_steps(access_token: str):
+    return await fetch_aggregate(access_token, STEPS_AGGREGATE_BODY)
 
 async def fetch_heart_rate(access_token: str):
-    url = "https://www.googleapis.com/fitness/v1/users/me/dataset:aggregate"
-    headers = {"Authorization": f"Bearer {access_token}"}
-    async with httpx.AsyncClient() as client:
-        response = await client.post(url, json=HEART_RATE_AGGREGATE_BODY, headers=headers)
-        response.raise_for_status()
-        return response.json()
+    return await fetch_aggregate(access_token, HEART_RATE_AGGREGATE_BODY)
 
 async def fetch_sleep(access_token: str):
-    url = "https://www.googleapis.com/fitness/v1/users/me/dataset:aggregate"
-    headers = {"Authorization": f"Bearer {access_token}"}
-    async with httpx.AsyncClient() as client:
-        response = await client.post(url, json=SLEEP_AGGREGATE_BODY, headers=headers)
-        response.raise_for_status()
-        return response.json()
+    return await fetch_aggregate(access_token, SLEEP_AGGREGATE_BODY)
 
 async def fetch_oxygen(access_token: str):
-    url = "https://www.googleapis.com/fitness/v1/users/me/dataset:aggregate"
-    headers = {"Authorization": f"Bearer {access_token}"}
-    async with httpx.AsyncClient() as client:
-        response = await client.post(url, json=OXYGEN_AGGREGATE_BODY, headers=headers)
-        response.raise_for_status()
-        return response.json()
+    return await fetch_aggregate(access_token, OXYGEN_AGGREGATE_BODY)
+
+# --- Combined wearable fetch ---
+WEARABLE_METRICS = {
+    "steps": STEPS_AGGREGATE_BODY,
+    "heartrate": HEART_RATE_AGGREGATE_BODY,
+    "sleep": SLEEP_AGGREGATE_BODY,
+    "oxygen": OXYGEN_AGGREGATE_BODY,
+}
+
+SLEEP_AWAKE_STAGES = {1, 3}  # awake, out of bed
+
+def _ms_to_iso(ms) -> str:
+    return datetime.fromtimestamp(int(ms) / 1000, tz=timezone.utc).isoformat()
+
+def _point_values(points: List[dict]) -> List[List[float]]:
+    return [[v.get("intVal", v.get("fpVal")) for v in p.get("value", [])] for p in points]
+
+def _normalize_total(points: List[dict]):
+    values = [v[0] for v in _point_values(points) if v and v[0] is not None]
+    return {"value": sum(values)} if values else None
+
+def _normalize_summary(points: List[dict]):
+    # Aggregated heart rate / SpO2 points carry [average, max, min]
+    values = [v for v in _point_values(points) if v and v[0] is not None]
+    if not values:
+        return None
+    avgs = [v[0] for v in values]
+    return {
+        "avg": round(sum(avgs) / len(avgs), 1),
+        "max": max(v[1] if len(v) >= 3 else v[0] for v in values),
+        "min": min(v[2] if len(v) >= 3 else v[0] for v in values),
+    }
+
+def _normalize_sleep(points: List[dict]):
+    asleep_ns = sum(
+        int(p["endTimeNanos"]) - int(p["startTimeNanos"])
+        for p in points
+        if p.get("value") and p["value"][0].get("intVal") not in SLEEP_AWAKE_STAGES
+    )
+    return {"minutes": round(asleep_ns / 60e9)} if points else None
+
+NORMALIZERS = {
+    "steps": _normalize_total,
+    "heartrate": _normalize_summary,
+    "sleep": _normalize_sleep,
+    "oxygen": _normalize_summary,
+}
+
+def iter_buckets(names: List[str], payload: dict):
+    # datasets in each bucket line up with the aggregateBy entries of the request
+    for bucket in payload.get("bucket", []):
+        for name, dataset in zip(names, bucket.get("dataset", [])):
+            value = NORMALIZERS[name](dataset.get("point", []))
+            if value is not None:
+                yield name, int(bucket["startTimeMillis"]), int(bucket["endTimeMillis"]), value
+
+def normalize_buckets(names: List[str], payload: dict) -> Dict[str, list]:
+    out = {name: [] for name in names}
+    for name, start, end, value in iter_buckets(names, payload):
+        out[name].append({"start": _ms_to_iso(start), "end": _ms_to_iso(end), **value})
+    return out
+
+def build_wearable_requests(metrics: List[str], start_ms: int = None, end_ms: int = None,
+                            bucket_ms: int = None) -> List[tuple]:
+    """Group metrics into as few aggregate calls as possible.
+
+    Metrics with the same bucketing (and time range) share one body with
+    several aggregateBy entries; returns [(metric names, body), ...].
+    ``bucket_ms`` forces one bucket size on every metric, sleep included.
+    """
+    groups: Dict[tuple, tuple] = {}
+    for name in metrics:
+        template = WEARABLE_METRICS[name]
+        start = start_ms if start_ms is not None else template["startTimeMillis"]
+        end = end_ms if end_ms is not None else template["endTimeMillis"]
+        bucket = bucket_ms or template.get("bucketByTime", {}).get("durationMillis")
+        key = (bucket, start, end)
+        if key not in groups:
+            body = {"aggregateBy": [], "startTimeMillis": start, "endTimeMillis": end}
+            if bucket:
+                body["bucketByTime"] = {"durationMillis": bucket}
+            groups[key] = ([], body)
+        names, body = groups[key]
+        names.append(name)
+        body["aggregateBy"] += template["aggregateBy"]
+    return list(groups.values())
+
+async def fetch_wearable(access_token: str, metrics: List[str], start_ms: int = None, end_ms: int = None) -> Dict[str, list]:
+    requests = build_wearable_requests(metrics, start_ms, end_ms)
+    payloads = await asyncio.gather(*(fetch_aggregate(access_token, body) for _, body in requests))
+    result: Dict[str, list] = {}
+    for (names, _), payload in zip(requests, payloads):
+        result.update(normalize_buckets(names, payload))
+    return result
+
+async def fetch_wearable_buckets(access_token: str, metrics: List[str], start_ms: int, end_ms: int,
+                                 bucket_ms: int = None, quota=None) -> List[tuple]:
+    # quota: anything with an async acquire(), charged once per aggregate call
+    requests = build_wearable_requests(metrics, start_ms, end_ms, bucket_ms)
+
+    async def call(body):
+        if quota is not None:
+            await quota.acquire()
+        return await fetch_aggregate(access_token, body)
 
+    payloads = await asyncio.gather(*(call(body) for _, body in requests))
+    return [row for (names, _), payload in zip(requests, payloads) for row in iter_buckets(names, payload)]
@@ -0,0 +1,176 @@
+import asyncio
+import logging
+import os
+import secrets
+import time
+from datetime import datetime, timezone
+from typing import Dict, Optional
+
+import httpx
+from cachetools import LRUCache
+
+from services.httpClientService import request_with_retry
+
+GOOGLE_TOKEN_URL = os.environ.get("GOOGLE_TOKEN_URL", "https://oauth2.googleapis.com/token")
+GOOGLE_TOKEN_REFRESH_SKEW_SECONDS = int(os.environ.get("GOOGLE_TOKEN_REFRESH_SKEW_SECONDS", 300))
+GOOGLE_TOKEN_CACHE_SIZE = int(os.environ.get("GOOGLE_TOKEN_CACHE_SIZE", 10000))
+GOOGLE_OAUTH_STATE_TTL_SECONDS = int(os.environ.get("GOOGLE_OAUTH_STATE_TTL_SECONDS", 600))
+
+TOKEN_PROJECTION = {"_id": 0, "google_access_token": 1, "google_refresh_token": 1, "google_token_expires_at_ms": 1}
+
+
+class GoogleAuthError(Exception):
+    """The user has no usable Google grant and has to connect Google Fit again."""
+
+
+def _now_ms() -> int:
+    return int(time.time() * 1000)
+
+
+class GoogleTokenStore:
+    """Google OAuth tokens: refresh tokens in Mongo, access tokens cached in memory.
+
+    Tokens live on the user document (``google_access_token``,
+    ``google_refresh_token``, ``google_token_expires_at_ms``).
+    ``get_access_token`` hands out the cached access token until it is within
+    ``refresh_skew`` seconds of expiry, then refreshes it. Concurrent callers
+    for one user share a single refresh call.
+    """
+
+    def __init__(self, db, user_cache=None, refresh_skew: int = GOOGLE_TOKEN_REFRESH_SKEW_SECONDS,
+                 maxsize: int = GOOGLE_TOKEN_CACHE_SIZE):
+        self.db = db
+        self.user_cache = user_cache
+        self.refresh_skew_ms = refresh_skew * 1000
+        self._cache: LRUCache = LRUCache(maxsize=maxsize)
+        self._inflight: Dict[str, asyncio.Task] = {}
+        self.hits = 0
+        self.refreshes = 0
+        self.failures = 0
+
+    def _usable(self, expires_at_ms: Optional[int]) -> bool:
+        return expires_at_ms is not None and expires_at_ms - _now_ms() > self.refresh_skew_ms
+
+    async def _post_token(self, data: dict) -> dict:
+        response = await request_with_retry(
+            "POST", GOOGLE_TOKEN_URL, data=data, headers={"Content-Type": "application/x-www-form-urlencoded"}
+        )
+        response.raise_for_status()
+        return response.json()
+
+    async def exchange_code(self, code: str, redirect_uri: str) -> dict:
+        return await self._post_token({
+            "code": code,
+            "client_id": os.getenv("GOOGLE_CLIENT_ID"),
+            "client_secret": os.getenv("GOOGLE_CLIENT_SECRET"),
+            "redirect_uri": redirect_uri,
+            "grant_type": "authorization_code",
+        })
+
+    async def save(self, user_id: str, token_data: dict):
+        expires_at = _now_ms() + int(token_data.get("expires_in", 3600)) * 1000
+        update = {
+            "google_access_token": token_data["access_token"],
+            "google_token_expires_at_ms": expires_at,
+            "google_token_updated_at": datetime.now(timezone.utc),
+        }
+        # Google only sends a refresh token on consent (and sometimes rotates it); keep the old one otherwise
+        if token_data.get("refresh_token"):
+            update["google_refresh_token"] = token_data["refresh_token"]
+        if token_data.get("scope"):
+            update["google_token_scope"] = token_data["scope"]
+        await self.db.users.update_one({"id": user_id}, {"$set": update})
+        self._cache[user_id] = (token_data["access_token"], expires_at)
+        if self.user_cache:
+            self.user_cache.invalidate(user_id)
+
+    async def _refresh(self, user_id: str, refresh_token: str) -> str:
+        self.refreshes += 1
+        try:
+            token_data = await self._post_token({
+                "client_id": os.getenv("GOOGLE_CLIENT_ID"),
+                "client_secret": os.getenv("GOOGLE_CLIENT_SECRET"),
+                "refresh_token": refresh_token,
+                "grant_type": "refresh_token",
+            })
+        except httpx.HTTPStatusError as e:
+            self.failures += 1
+            if e.response.status_code in (400, 401):
+                # invalid_grant: revoked or expired consent; drop the tokens so the scheduler skips this user
+                logging.warning(f"Google refresh token for {user_id} was rejected; user must reconnect")
+                await self.disconnect(user_id)
+                raise GoogleAuthError("Google account must be reconnected") from e
+            raise
+        except httpx.HTTPError:
+            self.failures += 1
+            raise
+        await self.save(user_id, token_data)
+        return token_data["access_token"]
+
+    async def get_access_token(self, user_id: str, user: Optional[dict] = None) -> str:
+        cached = self._cache.get(user_id)
+        if cached and self._usable(cached[1]):
+            self.hits += 1
+            return cached[0]
+
+        doc = await self.db.users.find_one({"id": user_id}, TOKEN_PROJECTION) or {}
+        access_token = doc.get("google_access_token") or (user or {}).get("google_access_token")
+        expires_at = doc.get("google_token_expires_at_ms")
+        refresh_token = doc.get("google_refresh_token")
+        if access_token and self._usable(expires_at):
+            self._cache[user_id] = (access_token, expires_at)
+            return access_token
+        if not refresh_token:
+            if access_token:
+                # Stored before refresh tokens were kept: use it until Google rejects it
+                return access_token
+            raise GoogleAuthError("Google Fit is not connected")
+
+        # Single-flight: a burst of requests near expiry triggers one refresh call
+        task = self._inflight.get(user_id)
+        if task is None:
+            task = asyncio.ensure_future(self._refresh(user_id, refresh_token))
+            self._inflight[user_id] = task
+            task.add_done_callback(lambda _: self._inflight.pop(user_id, None))
+        return await asyncio.shield(task)
+
+    async def invalidate(self, user_id: str):
+        """Force a refresh on next use, e.g. after Google rejected the access token with 401."""
+        self._cache.pop(user_id, None)
+        await self.db.users.update_one({"id": user_id}, {"$set": {"google_token_expires_at_ms": 0}})
+
+    async def disconnect(self, user_id: str):
+        self._cache.pop(user_id, None)
+        await self.db.users.update_one({"id": user_id}, {"$unset": {
+            "google_access_token": "", "google_refresh_token": "", "google_token_expires_at_ms": "",
+        }})
+        if self.user_cache:
+            self.user_cache.invalidate(user_id)
+
+    async def create_state(self, user_id: str) -> str:
+        # Opaque OAuth "state" tying Google's redirect back to the user who started the flow
+        state = secrets.token_urlsafe(32)
+        await self.db.oauth_states.insert_one({
+            "state": state, "user_id": user_id, "created_at": datetime.now(timezone.utc),
+        })
+        return state
+
+    async def consume_state(self, state: str) -> Optional[str]:
+        doc = await self.db.oauth_states.find_one_and_delete({"state": state})
+        if not doc:
+            return None
+        created = doc["created_at"]
+        if created.tzinfo is None:
+            created = created.replace(tzinfo=timezone.utc)
+        if (datetime.now(timezone.utc) - created).total_seconds() > GOOGLE_OAUTH_STATE_TTL_SECONDS:
+            return None
+        return doc["user_id"]
+
+    def stats(self) -> dict:
+        return {
+            "cached": len(self._cache),
+            "hits": self.hits,
+            "refreshes": self.refreshes,
+            "failures": self.failures,
+            "inflight": len(self._inflight),
+        }
@@ -0,0 +1,91 @@
+import asyncio
+import logging
+import os
+import random
+from typing import Optional
+
+import httpx
+
+HTTP_MAX_CONNECTIONS = int(os.environ.get("HTTP_MAX_CONNECTIONS", 100))
+HTTP_MAX_KEEPALIVE = int(os.environ.get("HTTP_MAX_KEEPALIVE", 20))
+HTTP_KEEPALIVE_EXPIRY = float(os.environ.get("HTTP_KEEPALIVE_EXPIRY", 30))
+HTTP_CONNECT_TIMEOUT = float(os.environ.get("HTTP_CONNECT_TIMEOUT", 5))
+HTTP_TIMEOUT = float(os.environ.get("HTTP_TIMEOUT", 15))
+HTTP_MAX_RETRIES = int(os.environ.get("HTTP_MAX_RETRIES", 3))
+HTTP_BACKOFF_BASE = float(os.environ.get("HTTP_BACKOFF_BASE", 0.25))
+HTTP_BACKOFF_MAX = float(os.environ.get("HTTP_BACKOFF_MAX", 8))
+HTTP2_ENABLED = os.environ.get("HTTP2_ENABLED", "true").lower() in ("1", "true", "yes")
+
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+_client: Optional[httpx.AsyncClient] = None
+
+
+def _http2_available() -> bool:
+    try:
+        import h2  # noqa: F401
+        return True
+    except ImportError:
+        return False
+
+
+def build_client(**overrides) -> httpx.AsyncClient:
+    options = {
+        "http2": HTTP2_ENABLED and _http2_available(),
+        "limits": httpx.Limits(
+            max_connections=HTTP_MAX_CONNECTIONS,
+            max_keepalive_connections=HTTP_MAX_KEEPALIVE,
+            keepalive_expiry=HTTP_KEEPALIVE_EXPIRY,
+        ),
+        "timeout": httpx.Timeout(HTTP_TIMEOUT, connect=HTTP_CONNECT_TIMEOUT),
+    }
+    options.update(overrides)
+    return httpx.AsyncClient(**options)
+
+
+def get_http_client() -> httpx.AsyncClient:
+    # One pooled client for the life of the process so Google calls reuse warm TLS connections
+    global _client
+    if _client is None or _client.is_closed:
+        _client = build_client()
+    return _client
+
+
+async def close_http_client():
+    global _client
+    if _client is not None and not _client.is_closed:
+        await _client.aclose()
+    _client = None
+
+
+def _retry_delay(attempt: int, response: Optional[httpx.Response]) -> float:
+    if response is not None:
+        retry_after = response.headers.get("Retry-After")
+        if retry_after and retry_after.isdigit():
+            return min(float(retry_after), HTTP_BACKOFF_MAX)
+    # Exponential backoff with full jitter
+    return random.uniform(0, min(HTTP_BACKOFF_MAX, HTTP_BACKOFF_BASE * (2 ** attempt)))
+
+
+async def request_with_retry(method: str, url: str, client: Optional[httpx.AsyncClient] = None,
+                             max_retries: int = HTTP_MAX_RETRIES, **kwargs) -> httpx.Response:
+    """Send a request on the shared client, retrying 429/5xx and transport errors.
+
+    The final response is returned as-is (callers still raise_for_status);
+    transport errors are re-raised once retries are exhausted.
+    """
+    client = client or get_http_client()
+    for attempt in range(max_retries + 1):
+        response = None
+        try:
+            response = await client.request(method, url, **kwargs)
+            if response.status_code not in RETRY_STATUSES or attempt == max_retries:
+                return response
+        except httpx.TransportError as e:
+            if attempt == max_retries:
+                raise
+            logging.warning(f"{method} {url} failed ({e!r}), retrying")
+        delay = _retry_delay(attempt, response)
+        if response is not None:
+            logging.warning(f"{method} {url} returned {response.status_code}, retrying in {delay:.2f}s")
+        await asyncio.sleep(delay)
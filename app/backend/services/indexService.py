@@ -0,0 +1,132 @@
+import asyncio
+import logging
+import os
+from typing import List
+
+from pymongo import ASCENDING, DESCENDING
+from pymongo.errors import OperationFailure
+
+from services.googleTokenService import GOOGLE_OAUTH_STATE_TTL_SECONDS
+
+MONGO_AUTO_INDEX = os.environ.get("MONGO_AUTO_INDEX", "true").lower() in ("1", "true", "yes")
+MONGO_INDEX_DIAGNOSTICS = os.environ.get("MONGO_INDEX_DIAGNOSTICS", "false").lower() in ("1", "true", "yes")
+
+# (collection, keys, options) for every index the hot queries in server.py rely on
+INDEX_SPECS = [
+    ("users", [("id", ASCENDING)], {"unique": True, "name": "users_id_unique"}),
+    ("users", [("email", ASCENDING)], {"unique": True, "name": "users_email_unique"}),
+    ("users", [("role", ASCENDING), ("full_name", ASCENDING), ("id", ASCENDING)], {"name": "users_role_name_id"}),
+    # Keyset pagination sorts on (timestamp, id), so id ends the compound keys
+    ("vitals", [("user_id", ASCENDING), ("timestamp", DESCENDING), ("id", DESCENDING)], {"name": "vitals_user_timestamp_id"}),
+    ("vitals", [("id", ASCENDING)], {"unique": True, "name": "vitals_id_unique"}),
+    ("risk_scores", [("user_id", ASCENDING), ("timestamp", DESCENDING), ("id", DESCENDING)], {"name": "risk_scores_user_timestamp_id"}),
+    ("appointments", [("patient_id", ASCENDING), ("scheduled_time", DESCENDING), ("id", DESCENDING)], {"name": "appointments_patient_time_id"}),
+    ("appointments", [("doctor_id", ASCENDING), ("scheduled_time", DESCENDING), ("id", DESCENDING)], {"name": "appointments_doctor_time_id"}),
+    # Slot claims: the unique keys are what make concurrent double-booking impossible
+    ("appointment_slots", [("doctor_id", ASCENDING), ("slot", ASCENDING)], {"unique": True, "name": "appointment_slots_doctor_slot"}),
+    ("appointment_slots", [("patient_id", ASCENDING), ("slot", ASCENDING)], {"unique": True, "name": "appointment_slots_patient_slot"}),
+    ("appointment_slots", [("appointment_id", ASCENDING)], {"name": "appointment_slots_appointment"}),
+    ("chats", [("user_id", ASCENDING), ("session_id", ASCENDING), ("timestamp", DESCENDING)], {"name": "chats_session_timestamp"}),
+    ("risk_state", [("user_id", ASCENDING)], {"unique": True, "name": "risk_state_user_unique"}),
+    ("fit_buckets", [("user_id", ASCENDING), ("metric", ASCENDING), ("start_ms", ASCENDING)], {"unique": True, "name": "fit_buckets_user_metric_start"}),
+    ("fit_sync_state", [("user_id", ASCENDING), ("metric", ASCENDING)], {"unique": True, "name": "fit_sync_state_user_metric"}),
+    ("chat_sessions", [("session_id", ASCENDING), ("user_id", ASCENDING)], {"unique": True, "name": "chat_sessions_session_user"}),
+    ("vital_rollups", [("user_id", ASCENDING), ("day", ASCENDING)], {"unique": True, "name": "vital_rollups_user_day"}),
+    ("patient_summaries", [("id", ASCENDING)], {"unique": True, "name": "patient_summaries_id_unique"}),
+    ("patient_summaries", [("doctor_ids", ASCENDING), ("risk_sort", DESCENDING), ("id", DESCENDING)], {"name": "patient_summaries_doctor_risk_id"}),
+    ("patient_summaries", [("doctor_ids", ASCENDING), ("full_name", ASCENDING), ("id", ASCENDING)], {"name": "patient_summaries_doctor_name_id"}),
+    ("oauth_states", [("state", ASCENDING)], {"unique": True, "name": "oauth_states_state_unique"}),
+    ("oauth_states", [("created_at", ASCENDING)], {"expireAfterSeconds": GOOGLE_OAUTH_STATE_TTL_SECONDS, "name": "oauth_states_ttl"}),
+]
+
+# Superseded by a wider index above; dropped so they don't cost every insert for nothing
+RETIRED_INDEXES = [
+    ("risk_scores", "risk_scores_user_timestamp"),
+]
+
+# (name, collection, filter, sort) mirroring the queries the API actually issues
+HOT_QUERIES = [
+    ("users by id", "users", {"id": "__probe__"}, None),
+    ("users by email", "users", {"email": "__probe__"}, None),
+    ("patients list", "users", {"role": "patient"}, [("full_name", ASCENDING), ("id", ASCENDING)]),
+    ("vitals history", "vitals", {"user_id": "__probe__"}, [("timestamp", DESCENDING), ("id", DESCENDING)]),
+    ("latest risk score", "risk_scores", {"user_id": "__probe__"}, [("timestamp", DESCENDING)]),
+    ("vitals export", "vitals", {"user_id": "__probe__"}, [("timestamp", ASCENDING), ("id", ASCENDING)]),
+    ("risk score export", "risk_scores", {"user_id": "__probe__"}, [("timestamp", ASCENDING), ("id", ASCENDING)]),
+    ("patient appointments", "appointments", {"patient_id": "__probe__"}, [("scheduled_time", DESCENDING), ("id", DESCENDING)]),
+    ("doctor appointments", "appointments", {"doctor_id": "__probe__"}, [("scheduled_time", DESCENDING), ("id", DESCENDING)]),
+    ("doctor availability", "appointment_slots", {"doctor_id": "__probe__"}, [("slot", ASCENDING)]),
+    ("doctor panel by risk", "patient_summaries", {"doctor_ids": "__probe__"}, [("risk_sort", DESCENDING), ("id", DESCENDING)]),
+    ("doctor panel by name", "patient_summaries", {"doctor_ids": "__probe__"}, [("full_name", ASCENDING), ("id", ASCENDING)]),
+    ("chat context", "chats", {"user_id": "__probe__", "session_id": "__probe__"}, [("timestamp", DESCENDING)]),
+]
+
+
+async def ensure_indexes(db) -> List[str]:
+    # create_index is a no-op when an identical index exists, so this is safe on every boot
+    created = []
+    for collection, keys, options in INDEX_SPECS:
+        try:
+            created.append(await db[collection].create_index(keys, **options))
+        except OperationFailure as e:
+            # e.g. duplicate emails left over from before the unique index existed
+            logging.error(f"Could not create index {options.get('name')} on {collection}: {e}")
+    for collection, name in RETIRED_INDEXES:
+        try:
+            await db[collection].drop_index(name)
+            logging.info(f"Dropped retired index {name} on {collection}")
+        except OperationFailure:
+            pass  # already gone
+    logging.info(f"Ensured {len(created)}/{len(INDEX_SPECS)} MongoDB indexes")
+    return created
+
+
+def _plan_stages(plan: dict) -> List[str]:
+    stages = [plan.get("stage")] if plan.get("stage") else []
+    for key in ("inputStage", "queryPlan"):
+        if key in plan:
+            stages += _plan_stages(plan[key])
+    for child in plan.get("inputStages", []):
+        stages += _plan_stages(child)
+    return stages
+
+
+async def verify_query_plans(db) -> List[dict]:
+    report = []
+    for name, collection, query, sort in HOT_QUERIES:
+        cursor = db[collection].find(query)
+        if sort:
+            cursor = cursor.sort(sort)
+        explain = await cursor.limit(1).explain()
+        stages = _plan_stages(explain.get("queryPlanner", {}).get("winningPlan", {}))
+        collscan = "COLLSCAN" in stages
+        # A SORT stage means the index doesn't provide the order and Mongo sorts the whole match in memory
+        blocking_sort = "SORT" in stages
+        if collscan:
+            logging.warning(f"Query '{name}' on {collection} falls back to COLLSCAN")
+        elif blocking_sort:
+            logging.warning(f"Query '{name}' on {collection} sorts in memory")
+        report.append({"query": name, "collection": collection, "stages": stages, "collscan": collscan,
+                       "blocking_sort": blocking_sort})
+    return report
+
+
+if __name__ == "__main__":
+    # python -m services.indexService  -> create indexes and print the plan report
+    from pathlib import Path
+    from dotenv import load_dotenv
+    from motor.motor_asyncio import AsyncIOMotorClient
+
+    load_dotenv(Path(__file__).parent.parent / ".env")
+
+    async def _main():
+        client = AsyncIOMotorClient(os.environ.get("MONGO_URL", "mongodb://localhost:27017"))
+        db = client[os.environ.get("DB_NAME", "carecompanion_db")]
+        await ensure_indexes(db)
+        for row in await verify_query_plans(db):
+            flag = "COLLSCAN" if row["collscan"] else "SORT" if row["blocking_sort"] else "ok"
+            print(f"{flag:9} {row['collection']:13} {row['query']:22} {' <- '.join(row['stages'])}")
+        client.close()
+
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(_main())
@@ -0,0 +1,241 @@
+import asyncio
+import os
+import time
+from contextvars import ContextVar
+from typing import Dict, Optional
+
+from prometheus_client import (
+    CONTENT_TYPE_LATEST, CollectorRegistry, Counter, Gauge, Histogram, disable_created_metrics, generate_latest,
+)
+from pymongo import monitoring
+
+METRICS_ENABLED = os.environ.get("METRICS_ENABLED", "true").lower() in ("1", "true", "yes")
+# If set, GET /metrics requires "Authorization: Bearer <token>"
+METRICS_TOKEN = os.environ.get("METRICS_TOKEN")
+METRICS_LOOP_LAG_INTERVAL_SECONDS = float(os.environ.get("METRICS_LOOP_LAG_INTERVAL_SECONDS", 0.5))
+
+# Requests are mostly tens of ms; Gemini and Google Fit calls run to seconds
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+LAG_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5)
+
+# The *_created series only add scrape size
+disable_created_metrics()
+
+# With PROMETHEUS_MULTIPROC_DIR set (several uvicorn workers), /metrics merges every worker's files
+MULTIPROCESS = "PROMETHEUS_MULTIPROC_DIR" in os.environ
+
+REQUEST_SECONDS = Histogram(
+    "carecompanion_http_request_duration_seconds",
+    "Time until the response headers are sent (time to first byte for streamed responses)",
+    ["method", "route", "status"], buckets=LATENCY_BUCKETS,
+)
+REQUEST_STAGE_SECONDS = Histogram(
+    "carecompanion_http_request_stage_seconds",
+    "Time one request spent in each dependency, summed over its calls (concurrent calls can add up to more than the request)",
+    ["route", "stage"], buckets=LATENCY_BUCKETS,
+)
+REQUESTS_IN_PROGRESS = Gauge(
+    "carecompanion_http_requests_in_progress", "Requests currently being handled", multiprocess_mode="livesum",
+)
+DEPENDENCY_SECONDS = Histogram(
+    "carecompanion_dependency_duration_seconds",
+    "Duration of individual calls to MongoDB, bcrypt, Gemini and Google Fit",
+    ["stage", "operation"], buckets=LATENCY_BUCKETS,
+)
+DEPENDENCY_ERRORS = Counter(
+    "carecompanion_dependency_errors_total", "Dependency calls that raised", ["stage", "operation"],
+)
+LOOP_LAG_SECONDS = Gauge(
+    "carecompanion_event_loop_lag_seconds", "How late the last event-loop probe woke up", multiprocess_mode="livemax",
+)
+LOOP_LAG_HISTOGRAM = Histogram(
+    "carecompanion_event_loop_lag_distribution_seconds", "How late event-loop probes woke up", buckets=LAG_BUCKETS,
+)
+STARTUP_SECONDS = Gauge(
+    "carecompanion_startup_seconds", "How long this worker took to import the app and run its lifespan startup",
+    ["phase"], multiprocess_mode="max",
+)
+STARTUP_RSS_BYTES = Gauge(
+    "carecompanion_startup_rss_bytes", "Resident memory of this worker once startup finished", multiprocess_mode="max",
+)
+
+# Per-request seconds by stage, set by the middleware. Motor copies the context into its
+# executor threads, so the Mongo listener adds to the right request.
+_STAGES: ContextVar[Optional[Dict[str, float]]] = ContextVar("request_stages", default=None)
+
+
+def _record(stage: str, operation: str, seconds: float, failed: bool = False):
+    DEPENDENCY_SECONDS.labels(stage, operation).observe(seconds)
+    if failed:
+        DEPENDENCY_ERRORS.labels(stage, operation).inc()
+    stages = _STAGES.get()
+    if stages is not None:
+        stages[stage] = stages.get(stage, 0.0) + seconds
+
+
+class timed:
+    """``with timed("gemini", "generate"):`` records the block's duration against the current request."""
+
+    __slots__ = ("stage", "operation", "started")
+
+    def __init__(self, stage: str, operation: str):
+        self.stage = stage
+        self.operation = operation
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if METRICS_ENABLED:
+            # A streaming client that disconnects closes the generator; that isn't a failed call
+            failed = exc_type is not None and not issubclass(exc_type, GeneratorExit)
+            _record(self.stage, self.operation, time.perf_counter() - self.started, failed)
+        return False
+
+
+class MongoCommandMetrics(monitoring.CommandListener):
+    """Times every command the driver sends, by command name and collection."""
+
+    def __init__(self):
+        self._collections: Dict[tuple, str] = {}
+
+    def started(self, event):
+        command = event.command
+        name = command.get(event.command_name)
+        if not isinstance(name, str):
+            # getMore names its collection separately; admin commands have none
+            name = command.get("collection", "")
+        self._collections[(event.connection_id, event.request_id)] = name
+
+    def _finished(self, event, failed: bool):
+        collection = self._collections.pop((event.connection_id, event.request_id), "")
+        _record("mongo", f"{event.command_name}:{collection}" if collection else event.command_name,
+                event.duration_micros / 1e6, failed)
+
+    def succeeded(self, event):
+        self._finished(event, False)
+
+    def failed(self, event):
+        self._finished(event, True)
+
+
+def mongo_listeners() -> list:
+    return [MongoCommandMetrics()] if METRICS_ENABLED else []
+
+
+class MetricsMiddleware:
+    """Pure ASGI middleware: per-route latency plus that request's time in each dependency.
+
+    Routes are labelled with their path template (``/api/doctor/patient/{patient_id}/vitals``),
+    and anything that matched no route as ``unmatched``, so label cardinality stays bounded.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        started = time.perf_counter()
+        stages: Dict[str, float] = {}
+        token = _STAGES.set(stages)
+        headers_sent = False
+
+        def route() -> str:
+            matched = scope.get("route")
+            return getattr(matched, "path", "unmatched")
+
+        async def send_timed(message):
+            nonlocal headers_sent
+            if message["type"] == "http.response.start":
+                headers_sent = True
+                REQUEST_SECONDS.labels(scope["method"], route(), str(message["status"])).observe(
+                    time.perf_counter() - started
+                )
+            await send(message)
+
+        REQUESTS_IN_PROGRESS.inc()
+        try:
+            await self.app(scope, receive, send_timed)
+        except Exception:
+            if not headers_sent:
+                REQUEST_SECONDS.labels(scope["method"], route(), "500").observe(time.perf_counter() - started)
+            raise
+        finally:
+            REQUESTS_IN_PROGRESS.dec()
+            _STAGES.reset(token)
+            path = route()
+            for stage, seconds in stages.items():
+                REQUEST_STAGE_SECONDS.labels(path, stage).observe(seconds)
+
+
+class LoopLagMonitor:
+    """Sleeps ``interval`` in a loop and records how much later than asked it woke up.
+
+    Anything that blocks the event loop (sync I/O, heavy CPU in a handler) shows up here
+    even when no request is slow enough to notice it.
+    """
+
+    def __init__(self, interval: float = METRICS_LOOP_LAG_INTERVAL_SECONDS):
+        self.interval = interval
+        self._task: Optional[asyncio.Task] = None
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            before = loop.time()
+            await asyncio.sleep(self.interval)
+            lag = max(0.0, loop.time() - before - self.interval)
+            LOOP_LAG_SECONDS.set(lag)
+            LOOP_LAG_HISTOGRAM.observe(lag)
+
+    def start(self):
+        if METRICS_ENABLED and (self._task is None or self._task.done()):
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+
+def rss_bytes() -> int:
+    """Current resident set size of this process."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        # Not Linux: fall back to the peak, which ru_maxrss reports in KiB (bytes on macOS)
+        import resource
+        import sys
+
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if sys.platform == "darwin" else peak * 1024
+
+
+def record_startup(import_seconds: float, startup_seconds: float) -> dict:
+    """Export the startup timings and RSS, and return them for the startup log line."""
+    rss = rss_bytes()
+    STARTUP_SECONDS.labels("import").set(import_seconds)
+    STARTUP_SECONDS.labels("lifespan").set(startup_seconds)
+    STARTUP_RSS_BYTES.set(rss)
+    return {"import_seconds": round(import_seconds, 3), "startup_seconds": round(startup_seconds, 3),
+            "rss_mb": round(rss / 2**20, 1)}
+
+
+def render() -> tuple:
+    """Body and content type for GET /metrics."""
+    if MULTIPROCESS:
+        from prometheus_client import multiprocess
+
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return generate_latest(registry), CONTENT_TYPE_LATEST
+    return generate_latest(), CONTENT_TYPE_LATEST
+
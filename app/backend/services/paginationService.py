@@ -0,0 +1,87 @@
+import base64
+import json
+import os
+from datetime import datetime
+from typing import Iterable, List, Optional, Tuple
+
+from pymongo import ASCENDING, DESCENDING
+
+from services.dateService import as_utc, to_iso
+
+PAGE_SIZE_DEFAULT = int(os.environ.get("PAGE_SIZE_DEFAULT", 50))
+PAGE_SIZE_MAX = int(os.environ.get("PAGE_SIZE_MAX", 500))
+
+
+class CursorError(ValueError):
+    pass
+
+
+def encode_cursor(sort_value, doc_id: str) -> str:
+    # Dates are tagged so the next page compares against a date, not its ISO string
+    if isinstance(sort_value, datetime):
+        sort_value = {"$date": to_iso(sort_value)}
+    raw = json.dumps([sort_value, doc_id], separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Tuple[object, str]:
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        sort_value, doc_id = json.loads(raw)
+        if isinstance(sort_value, dict):
+            sort_value = as_utc(sort_value["$date"])
+    except (ValueError, TypeError, KeyError) as e:
+        raise CursorError("Malformed cursor") from e
+    if not isinstance(doc_id, str):
+        raise CursorError("Malformed cursor")
+    return sort_value, doc_id
+
+
+def parse_fields(fields: Optional[str], allowed: Iterable[str], required: Iterable[str]) -> Optional[dict]:
+    """Mongo projection for a ``fields=a,b`` query param, or None for whole documents.
+
+    ``required`` fields (the sort key and id) are always included so the
+    next cursor can be built. Unknown names raise ValueError.
+    """
+    if not fields:
+        return None
+    requested = [f.strip() for f in fields.split(",") if f.strip()]
+    unknown = [f for f in requested if f not in allowed]
+    if unknown:
+        raise ValueError(f"Unknown fields: {', '.join(unknown)}")
+    projection = {"_id": 0}
+    for name in list(required) + requested:
+        projection[name] = 1
+    return projection
+
+
+async def fetch_page(collection, query: dict, sort_field: str, limit: int, cursor: Optional[str] = None,
+                     projection: Optional[dict] = None, descending: bool = True) -> Tuple[List[dict], Optional[str]]:
+    """One keyset page ordered by (sort_field, id).
+
+    Instead of skip/limit, the cursor carries the last (sort value, id)
+    seen and the next page starts strictly after it, so every page costs
+    one index seek however deep the client has paged. Needs an index on
+    the query fields followed by ``sort_field`` and ``id``.
+    """
+    if cursor:
+        value, doc_id = decode_cursor(cursor)
+        op = "$lt" if descending else "$gt"
+        query = {"$and": [query, {"$or": [
+            {sort_field: {op: value}},
+            {sort_field: value, "id": {op: doc_id}},
+        ]}]}
+    direction = DESCENDING if descending else ASCENDING
+    docs = await (
+        collection.find(query, projection or {"_id": 0})
+        .sort([(sort_field, direction), ("id", direction)])
+        .limit(limit + 1)
+        .to_list(limit + 1)
+    )
+    # The extra document only tells us whether another page exists
+    next_cursor = None
+    if len(docs) > limit:
+        docs = docs[:limit]
+        last = docs[-1]
+        next_cursor = encode_cursor(last.get(sort_field), last["id"])
+    return docs, next_cursor
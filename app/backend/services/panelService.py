@@ -0,0 +1,199 @@
+import logging
+import os
+from typing import Dict, Iterable, List, Optional
+
+from pymongo import UpdateOne
+from pymongo.errors import DuplicateKeyError
+
+from services.dateService import as_utc, utcnow
+
+PANEL_REBUILD_BATCH = int(os.environ.get("PANEL_REBUILD_BATCH", 1000))
+
+# Sort keys for GET /doctor/panel: (summary field, descending)
+PANEL_SORTS = {"risk": ("risk_sort", True), "name": ("full_name", False)}
+# risk_sort for patients without a score yet; keeps them in the keyset order (a missing key would not be)
+UNSCORED = -1.0
+
+PATIENT_FIELDS = ("full_name", "email", "age")
+APPOINTMENT_FIELDS = ("id", "patient_id", "patient_name", "doctor_id", "doctor_name", "scheduled_time", "reason",
+                      "status", "created_at")
+
+
+def _newer_than(field: str, timestamp) -> dict:
+    # Matches when the stored value is missing or not newer, so out-of-order writes can't roll it back
+    return {"$or": [{f"{field}.timestamp": {"$lte": timestamp}}, {field: None}]}
+
+
+def _strip(doc: dict) -> dict:
+    return {k: v for k, v in doc.items() if k != "_id"}
+
+
+def risk_fields(risk_doc: dict) -> dict:
+    return {"latest_risk": _strip(risk_doc), "risk_level": risk_doc["risk_level"], "risk_sort": float(risk_doc["score"])}
+
+
+def risk_update(risk_doc: dict) -> UpdateOne:
+    """Bulk op that moves a patient's summary to ``risk_doc`` unless it already holds a newer score."""
+    return UpdateOne({"id": risk_doc["user_id"], **_newer_than("latest_risk", risk_doc["timestamp"])},
+                     {"$set": {**risk_fields(risk_doc), "updated_at": utcnow()}})
+
+
+class PatientPanel:
+    """One ``patient_summaries`` document per patient for the doctor panel.
+
+    Each summary carries the patient's latest vitals, latest risk score and
+    next scheduled appointment, plus ``doctor_ids`` (every doctor the
+    patient has booked with), so a doctor's whole panel is one indexed
+    query sorted by risk or name. Writers call the ``on_*`` hooks;
+    ``rebuild`` backfills from the source collections.
+    """
+
+    def __init__(self, db):
+        self.db = db
+
+    async def _upsert_if_newer(self, patient_id: str, field: str, doc: dict,
+                               extra: Optional[dict] = None) -> Optional[dict]:
+        # The summary as it was before this write ({} if new), or None if it already held something newer
+        try:
+            before = await self.db.patient_summaries.find_one_and_update(
+                {"id": patient_id, **_newer_than(field, doc["timestamp"])},
+                {"$set": {field: _strip(doc), **(extra or {}), "updated_at": utcnow()},
+                 "$setOnInsert": {"doctor_ids": [], **({} if extra else {"risk_sort": UNSCORED})}},
+                projection={"_id": 0, "risk_level": 1},
+                upsert=True,
+            )
+        except DuplicateKeyError:
+            return None
+        return before or {}
+
+    async def on_vitals(self, patient_id: str, docs: Iterable[dict]):
+        docs = [d for d in docs if d.get("timestamp")]
+        if docs:
+            await self._upsert_if_newer(patient_id, "latest_vitals", max(docs, key=lambda d: as_utc(d["timestamp"])))
+
+    async def on_risk(self, risk_doc: dict) -> Optional[dict]:
+        fields = risk_fields(risk_doc)
+        return await self._upsert_if_newer(risk_doc["user_id"], "latest_risk", risk_doc,
+                                    {k: v for k, v in fields.items() if k != "latest_risk"})
+
+    async def on_appointment(self, appointment: dict, patient: dict):
+        await self.db.patient_summaries.update_one(
+            {"id": appointment["patient_id"]},
+            {"$set": {**{f: patient.get(f) for f in PATIENT_FIELDS}, "updated_at": utcnow()},
+             "$addToSet": {"doctor_ids": appointment["doctor_id"]},
+             "$setOnInsert": {"risk_sort": UNSCORED}},
+            upsert=True,
+        )
+        await self.refresh_next_appointments([appointment["patient_id"]])
+
+    async def on_profile(self, user: dict):
+        # A renamed user: the patient's own summary fields, and the names copied into next_appointment
+        if user.get("role") == "patient":
+            await self.db.patient_summaries.update_one(
+                {"id": user["id"]}, {"$set": {**{f: user.get(f) for f in PATIENT_FIELDS}, "updated_at": utcnow()}}
+            )
+            await self.db.patient_summaries.update_one(
+                {"id": user["id"], "next_appointment.patient_id": user["id"]},
+                {"$set": {"next_appointment.patient_name": user["full_name"]}},
+            )
+        elif user.get("role") == "doctor":
+            await self.db.patient_summaries.update_many(
+                {"doctor_ids": user["id"], "next_appointment.doctor_id": user["id"],
+                 "next_appointment.doctor_name": {"$ne": user["full_name"]}},
+                {"$set": {"next_appointment.doctor_name": user["full_name"]}},
+            )
+
+    async def _next_appointments(self, patient_ids: List[str]) -> Dict[str, dict]:
+        # Earliest upcoming scheduled appointment per patient, off the (patient_id, scheduled_time) index
+        pipeline = [
+            {"$match": {"patient_id": {"$in": patient_ids}, "status": "scheduled", "scheduled_time": {"$gte": utcnow()}}},
+            {"$sort": {"patient_id": 1, "scheduled_time": 1}},
+            {"$group": {"_id": "$patient_id", "next": {"$first": "$$ROOT"}}},
+        ]
+        rows = await self.db.appointments.aggregate(pipeline).to_list(None)
+        return {row["_id"]: {f: row["next"].get(f) for f in APPOINTMENT_FIELDS} for row in rows}
+
+    async def refresh_next_appointments(self, patient_ids: List[str]):
+        if not patient_ids:
+            return
+        upcoming = await self._next_appointments(patient_ids)
+        await self.db.patient_summaries.bulk_write([
+            UpdateOne({"id": pid}, {"$set": {"next_appointment": upcoming.get(pid)}}) for pid in patient_ids
+        ], ordered=False)
+
+    async def refresh_due(self, doctor_id: str) -> int:
+        """Roll ``next_appointment`` forward for the doctor's patients whose appointment has passed."""
+        due = await self.db.patient_summaries.find(
+            {"doctor_ids": doctor_id, "next_appointment.scheduled_time": {"$lt": utcnow()}}, {"_id": 0, "id": 1}
+        ).to_list(None)
+        await self.refresh_next_appointments([d["id"] for d in due])
+        return len(due)
+
+    async def _latest_per_patient(self, collection, patient_ids: List[str]) -> Dict[str, dict]:
+        pipeline = [
+            {"$match": {"user_id": {"$in": patient_ids}}},
+            {"$sort": {"user_id": 1, "timestamp": -1}},
+            {"$group": {"_id": "$user_id", "latest": {"$first": "$$ROOT"}}},
+        ]
+        rows = await self.db[collection].aggregate(pipeline).to_list(None)
+        return {row["_id"]: _strip(row["latest"]) for row in rows}
+
+    async def _rebuild_batch(self, patients: List[dict]) -> int:
+        ids = [p["id"] for p in patients]
+        vitals = await self._latest_per_patient("vitals", ids)
+        risks = await self._latest_per_patient("risk_scores", ids)
+        upcoming = await self._next_appointments(ids)
+        doctors = {row["_id"]: row["doctor_ids"] for row in await self.db.appointments.aggregate([
+            {"$match": {"patient_id": {"$in": ids}}},
+            {"$group": {"_id": "$patient_id", "doctor_ids": {"$addToSet": "$doctor_id"}}},
+        ]).to_list(None)}
+        now = utcnow()
+        ops = []
+        for patient in patients:
+            pid = patient["id"]
+            summary = {
+                **{f: patient.get(f) for f in PATIENT_FIELDS},
+                "doctor_ids": doctors.get(pid, []),
+                "latest_vitals": vitals.get(pid),
+                "latest_risk": None, "risk_level": None, "risk_sort": UNSCORED,
+                "next_appointment": upcoming.get(pid),
+                "updated_at": now,
+            }
+            if pid in risks:
+                summary.update(risk_fields(risks[pid]))
+            ops.append(UpdateOne({"id": pid}, {"$set": summary}, upsert=True))
+        if ops:
+            await self.db.patient_summaries.bulk_write(ops, ordered=False)
+        return len(ops)
+
+    async def rebuild(self, batch_size: int = PANEL_REBUILD_BATCH) -> int:
+        """Backfill patient_summaries for every patient (e.g. data written before the panel existed)."""
+        total, batch = 0, []
+        cursor = self.db.users.find({"role": "patient"}, {"_id": 0, "id": 1, **{f: 1 for f in PATIENT_FIELDS}})
+        async for patient in cursor.batch_size(batch_size):
+            batch.append(patient)
+            if len(batch) >= batch_size:
+                total += await self._rebuild_batch(batch)
+                batch = []
+        total += await self._rebuild_batch(batch)
+        logging.info(f"Rebuilt {total} patient summaries")
+        return total
+
+
+if __name__ == "__main__":
+    # python -m services.panelService  (backfill patient_summaries)
+    import asyncio
+    from pathlib import Path
+    from dotenv import load_dotenv
+    from motor.motor_asyncio import AsyncIOMotorClient
+
+    load_dotenv(Path(__file__).parent.parent / ".env")
+    logging.basicConfig(level=logging.INFO)
+
+    async def _main():
+        client = AsyncIOMotorClient(os.environ.get("MONGO_URL", "mongodb://localhost:27017"), tz_aware=True)
+        db = client[os.environ.get("DB_NAME", "carecompanion_db")]
+        print(f"Rebuilt {await PatientPanel(db).rebuild()} patient summaries")
+        client.close()
+
+    asyncio.run(_main())
@@ -0,0 +1,98 @@
+import asyncio
+import logging
+import multiprocessing
+import os
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Optional
+
+from passlib.context import CryptContext
+
+from services.metricsService import timed
+
+BCRYPT_ROUNDS = int(os.environ.get("BCRYPT_ROUNDS", 12))
+PASSWORD_EXECUTOR = os.environ.get("PASSWORD_EXECUTOR", "process")
+PASSWORD_WORKERS = int(os.environ.get("PASSWORD_WORKERS", os.cpu_count() or 2))
+PASSWORD_MAX_PENDING = int(os.environ.get("PASSWORD_MAX_PENDING", 64))
+
+_contexts = {}
+
+
+def _context(rounds: int) -> CryptContext:
+    # One context per worker process/thread set; building it is not free
+    ctx = _contexts.get(rounds)
+    if ctx is None:
+        ctx = _contexts[rounds] = CryptContext(schemes=["bcrypt"], deprecated="auto", bcrypt__rounds=rounds)
+    return ctx
+
+
+def hash_password_sync(password: str, rounds: int = BCRYPT_ROUNDS) -> str:
+    return _context(rounds).hash(password)
+
+
+def verify_password_sync(plain_password: str, hashed_password: str) -> bool:
+    try:
+        return _context(BCRYPT_ROUNDS).verify(plain_password, hashed_password)
+    except ValueError:
+        # Empty or malformed stored hash
+        return False
+
+
+class PasswordBusyError(Exception):
+    """Raised when too many hash/verify calls are already pending."""
+
+
+class PasswordHasher:
+    """Runs bcrypt off the event loop on a bounded executor.
+
+    ``mode`` is "process" (default, sidesteps the GIL for bcrypt's CPU work)
+    or "thread". At most ``max_pending`` calls may be queued or running; the
+    rest are rejected with PasswordBusyError so a login storm degrades into
+    fast 503s instead of an ever-growing backlog.
+    """
+
+    def __init__(self, mode: str = PASSWORD_EXECUTOR, workers: int = PASSWORD_WORKERS,
+                 max_pending: int = PASSWORD_MAX_PENDING, rounds: int = BCRYPT_ROUNDS):
+        self.mode = mode
+        self.workers = workers
+        self.max_pending = max_pending
+        self.rounds = rounds
+        self._executor: Optional[Executor] = None
+        self._pending = 0
+
+    def _get_executor(self) -> Executor:
+        if self._executor is None:
+            if self.mode == "process":
+                # spawn, not fork: the parent runs an event loop and driver threads
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.workers, mp_context=multiprocessing.get_context("spawn")
+                )
+            else:
+                self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="bcrypt")
+        return self._executor
+
+    async def _run(self, operation: str, fn, *args):
+        if self._pending >= self.max_pending:
+            raise PasswordBusyError("Too many authentication requests, please retry shortly")
+        self._pending += 1
+        try:
+            loop = asyncio.get_running_loop()
+            with timed("bcrypt", operation):
+                return await loop.run_in_executor(self._get_executor(), fn, *args)
+        finally:
+            self._pending -= 1
+
+    async def hash(self, password: str) -> str:
+        return await self._run("hash", hash_password_sync, password, self.rounds)
+
+    async def verify(self, plain_password: str, hashed_password: str) -> bool:
+        return await self._run("verify", verify_password_sync, plain_password, hashed_password)
+
+    def stats(self) -> dict:
+        return {"mode": self.mode, "workers": self.workers, "pending": self._pending,
+                "max_pending": self.max_pending}
+
+    def shutdown(self):
+        if self._executor is not None:
+            logging.info("Shutting down password hashing pool")
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
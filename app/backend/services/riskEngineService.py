@@ -0,0 +1,236 @@
+import os
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from pymongo import ReturnDocument
+
+from services.dateService import utcnow
+
+RISK_WINDOW_SIZE = int(os.environ.get("RISK_WINDOW_SIZE", 7))
+
+METRICS = (
+    "heart_rate",
+    "blood_pressure_systolic",
+    "blood_pressure_diastolic",
+    "temperature",
+    "oxygen_saturation",
+    "sleep_hours",
+    "activity_minutes",
+)
+
+# Clinical thresholds shared by the per-user engine and the population re-scoring job
+HEART_RATE_RANGE = (60, 100)
+BLOOD_PRESSURE_LIMITS = (140, 90)
+TEMPERATURE_RANGE = (36.1, 37.8)
+OXYGEN_MIN = 95
+SLEEP_MIN_HOURS = 6
+HIGH_RISK_SCORE = 50
+MEDIUM_RISK_SCORE = 25
+
+# Google Fit daily aggregates carry only heart rate, SpO2 and sleep. As a patient's "latest reading" they
+# would hide a manual blood pressure or temperature reading, so risk is scored from the other readings only
+UNSCORED_SOURCES = ["google_fit"]
+SCORED_VITALS = {"source": {"$nin": UNSCORED_SOURCES}}
+
+NO_DATA_RESULT = {
+    "score": 0.0,
+    "risk_level": "low",
+    "factors": ["No vitals data available"],
+    "recommendations": ["Please log your vitals regularly for accurate monitoring"],
+}
+
+
+# (low, high) range per metric; None leaves that side unbounded
+Bounds = Dict[str, Tuple[Optional[float], Optional[float]]]
+
+
+class RiskRule:
+    """A single scoring rule.
+
+    ``check(latest, context)`` returns a factor description when the rule
+    fires and None otherwise. ``context`` carries the rolling window, its
+    per-metric aggregates and the latest trend deltas, so rules aren't
+    limited to looking at the newest reading.
+
+    Rules built with ``threshold_rule`` also carry their ``bounds`` and
+    ``message``, which lets the population re-scoring job evaluate them as
+    array comparisons instead of calling ``check`` row by row.
+    """
+
+    def __init__(self, name: str, points: float, check: Callable[[dict, dict], Optional[str]],
+                 bounds: Optional[Bounds] = None, message: Optional[str] = None):
+        self.name = name
+        self.points = points
+        self.check = check
+        self.bounds = bounds
+        self.message = message
+
+
+def threshold_rule(name: str, points: float, bounds: Bounds, message: str) -> RiskRule:
+    """Fires when every metric in ``bounds`` is recorded and any of them is outside its range.
+
+    A 0 counts as not recorded, as it always has. ``message`` is formatted
+    with the reading, e.g. ``"Abnormal heart rate: {heart_rate} bpm"``.
+    """
+    limits = tuple(bounds.items())
+
+    def check(v, ctx):
+        fired = False
+        for m, (low, high) in limits:
+            value = v.get(m)
+            if not value:
+                return None
+            if (low is not None and value < low) or (high is not None and value > high):
+                fired = True
+        return message.format_map(v) if fired else None
+
+    return RiskRule(name, points, check, bounds=bounds, message=message)
+
+
+DEFAULT_RULES = [
+    threshold_rule("heart_rate", 15, {"heart_rate": HEART_RATE_RANGE}, "Abnormal heart rate: {heart_rate} bpm"),
+    threshold_rule("blood_pressure", 20,
+                   {"blood_pressure_systolic": (None, BLOOD_PRESSURE_LIMITS[0]),
+                    "blood_pressure_diastolic": (None, BLOOD_PRESSURE_LIMITS[1])},
+                   "Elevated blood pressure: {blood_pressure_systolic}/{blood_pressure_diastolic}"),
+    threshold_rule("temperature", 25, {"temperature": TEMPERATURE_RANGE}, "Abnormal temperature: {temperature}°C"),
+    threshold_rule("oxygen_saturation", 30, {"oxygen_saturation": (OXYGEN_MIN, None)},
+                   "Low oxygen saturation: {oxygen_saturation}%"),
+    threshold_rule("sleep", 10, {"sleep_hours": (SLEEP_MIN_HOURS, None)}, "Insufficient sleep: {sleep_hours} hours"),
+]
+
+
+def risk_level_for(score: float) -> str:
+    if score >= HIGH_RISK_SCORE:
+        return "high"
+    if score >= MEDIUM_RISK_SCORE:
+        return "medium"
+    return "low"
+
+
+RECOMMENDATIONS = {
+    "high": ["Schedule urgent doctor consultation", "Monitor vitals closely"],
+    "medium": ["Schedule check-up in 24-48 hours", "Rest and monitor symptoms"],
+    "low": ["Continue regular monitoring", "Maintain healthy lifestyle"],
+}
+
+
+def window_entry(vital: dict) -> dict:
+    return {"id": vital["id"], "timestamp": vital["timestamp"], **{m: vital.get(m) for m in METRICS}}
+
+
+def build_context(window: List[dict]) -> Dict[str, Any]:
+    aggregates = {}
+    for m in METRICS:
+        values = [e[m] for e in window if e.get(m) is not None]
+        if values:
+            aggregates[m] = {"min": min(values), "max": max(values), "mean": sum(values) / len(values), "count": len(values)}
+    trend = {}
+    if len(window) >= 2:
+        prev, last = window[-2], window[-1]
+        for m in METRICS:
+            if prev.get(m) is not None and last.get(m) is not None:
+                trend[m] = last[m] - prev[m]
+    return {"window": window, "aggregates": aggregates, "trend": trend}
+
+
+class RiskEngine:
+    """Incremental risk scoring over a per-user rolling window.
+
+    Each user's last ``window_size`` readings live in one ``risk_state``
+    document. A new vital is folded in with a single atomic
+    find_one_and_update ($push/$sort/$slice), so the state survives restarts,
+    stays consistent across workers and costs O(1) per reading instead of
+    re-reading the vitals history.
+    """
+
+    def __init__(self, db, rules: Optional[List[RiskRule]] = None, window_size: int = RISK_WINDOW_SIZE):
+        self.db = db
+        self.rules = list(rules) if rules is not None else list(DEFAULT_RULES)
+        self.window_size = window_size
+
+    def register_rule(self, rule: RiskRule):
+        self.rules = [r for r in self.rules if r.name != rule.name] + [rule]
+
+    def score_window(self, window: List[dict]) -> Dict[str, Any]:
+        if not window:
+            return {**NO_DATA_RESULT, "factors": list(NO_DATA_RESULT["factors"]),
+                    "recommendations": list(NO_DATA_RESULT["recommendations"])}
+        context = build_context(window)
+        latest = window[-1]
+        score = 0
+        factors: List[str] = []
+        for rule in self.rules:
+            factor = rule.check(latest, context)
+            if factor:
+                factors.append(factor)
+                score += rule.points
+        risk_level = risk_level_for(score)
+        if not factors:
+            factors.append("All vitals within normal range")
+        return {
+            "score": round(score, 2),
+            "risk_level": risk_level,
+            "factors": factors,
+            "recommendations": list(RECOMMENDATIONS[risk_level]),
+        }
+
+    async def _bootstrap(self, user_id: str) -> dict:
+        # First time we see this user: seed the window from stored history, once
+        recent = await self.db.vitals.find({"user_id": user_id, **SCORED_VITALS}, {"_id": 0}).sort("timestamp", -1).limit(self.window_size).to_list(self.window_size)
+        window = [window_entry(v) for v in reversed(recent)]
+        await self.db.risk_state.update_one(
+            {"user_id": user_id},
+            {"$setOnInsert": {"user_id": user_id, "window": window, "updated_at": utcnow()}},
+            upsert=True,
+        )
+        return await self.db.risk_state.find_one({"user_id": user_id}, {"_id": 0})
+
+    async def state(self, user_id: str) -> dict:
+        state = await self.db.risk_state.find_one({"user_id": user_id}, {"_id": 0})
+        return state or await self._bootstrap(user_id)
+
+    async def observe(self, user_id: str, vitals: List[dict]) -> Dict[str, Any]:
+        """Fold new vitals into the user's window and return the new score."""
+        entries = [window_entry(v) for v in vitals if v.get("source") not in UNSCORED_SOURCES]
+        if not entries:
+            return await self.score_user(user_id)
+        ids = [e["id"] for e in entries]
+
+        async def push():
+            return await self.db.risk_state.find_one_and_update(
+                # Only if none of these readings is in the window yet, so concurrent observers can't duplicate them
+                {"user_id": user_id, "window.id": {"$nin": ids}},
+                {
+                    "$push": {"window": {"$each": entries, "$sort": {"timestamp": 1}, "$slice": -self.window_size}},
+                    "$set": {"updated_at": utcnow()},
+                },
+                projection={"_id": 0},
+                return_document=ReturnDocument.AFTER,
+            )
+
+        state = await push()
+        if state is None:
+            # No state yet, or some readings are already in the window: picked up by the bootstrap, or
+            # rewritten since (a Google Fit re-sync upserts the same id with new values). Drop those
+            # copies and push again, so the window holds what is stored now. The bootstrap may or may
+            # not have seen the new readings, depending on when they were stored
+            await self.state(user_id)
+            await self.db.risk_state.update_one({"user_id": user_id}, {"$pull": {"window": {"id": {"$in": ids}}}})
+            state = await push() or await self.state(user_id)
+        return self.score_window(state["window"])
+
+    async def preview(self, user_id: str, vitals: List[dict]) -> Dict[str, Any]:
+        """The score ``observe(user_id, vitals)`` will give, without folding the readings in."""
+        entries = [window_entry(v) for v in vitals if v.get("source") not in UNSCORED_SOURCES]
+        state = await self.state(user_id)
+        ids = {e["id"] for e in entries}
+        window = sorted([e for e in state["window"] if e["id"] not in ids] + entries, key=lambda e: e["timestamp"])
+        return self.score_window(window[-self.window_size:])
+
+    async def score_user(self, user_id: str) -> Dict[str, Any]:
+        state = await self.state(user_id)
+        return self.score_window(state["window"])
+
+    async def reset(self, user_id: Optional[str] = None):
+        # Drop cached windows, e.g. after vitals were deleted or rewritten out of band
+        await self.db.risk_state.delete_many({"user_id": user_id} if user_id else {})
@@ -0,0 +1,190 @@
+import asyncio
+import logging
+import os
+import time
+import uuid
+from datetime import datetime, timezone
+from typing import TYPE_CHECKING, AsyncIterator, Callable, Dict, List, Optional
+
+from pymongo import InsertOne
+
+from services.panelService import risk_update
+from services.riskEngineService import (
+    DEFAULT_RULES,
+    HIGH_RISK_SCORE,
+    MEDIUM_RISK_SCORE,
+    METRICS,
+    RECOMMENDATIONS,
+    SCORED_VITALS,
+    RiskRule,
+    build_context,
+)
+
+if TYPE_CHECKING:
+    import numpy as np
+
+RESCORE_CHUNK_SIZE = int(os.environ.get("RESCORE_CHUNK_SIZE", 5000))
+
+
+def _present(col: "np.ndarray") -> "np.ndarray":
+    # Mirrors the scalar rules' truthiness test: missing and 0 both mean "not recorded"
+    import numpy as np
+
+    return ~np.isnan(col) & (col != 0)
+
+
+def to_columns(latest: List[dict]) -> Dict[str, "np.ndarray"]:
+    import numpy as np
+
+    return {
+        m: np.array([np.nan if v.get(m) is None else v[m] for v in latest], dtype=np.float64)
+        for m in METRICS
+    }
+
+
+def rule_mask(rule: RiskRule, cols: Dict[str, "np.ndarray"], latest: List[dict]) -> "np.ndarray":
+    """Rows where ``rule`` fires, from the rule's own bounds (see threshold_rule)."""
+    import numpy as np
+
+    if rule.bounds is None:
+        # A custom rule with arbitrary logic: run its check on each latest reading
+        return np.array([bool(rule.check(v, build_context([v]))) for v in latest], dtype=bool)
+    present = np.ones(len(latest), dtype=bool)
+    outside = np.zeros(len(latest), dtype=bool)
+    for metric, (low, high) in rule.bounds.items():
+        col = cols[metric]
+        present &= _present(col)
+        if low is not None:
+            outside |= col < low
+        if high is not None:
+            outside |= col > high
+    return present & outside
+
+
+def describe(rule: RiskRule, vital: dict) -> str:
+    if rule.message is not None:
+        return rule.message.format_map(vital)
+    return rule.check(vital, build_context([vital]))
+
+
+def score_chunk(latest: List[dict], rules: Optional[List[RiskRule]] = None) -> List[dict]:
+    """Score one chunk of latest-per-user readings; returns results in input order.
+
+    Uses the same rule objects as RiskEngine (DEFAULT_RULES unless given), so the thresholds can't drift.
+    """
+    rules = rules if rules is not None else DEFAULT_RULES
+    if not latest:
+        return []
+    import numpy as np
+
+    cols = to_columns(latest)
+    masks = [rule_mask(rule, cols, latest) for rule in rules]
+    scores = np.zeros(len(latest), dtype=np.float64)
+    for rule, mask in zip(rules, masks):
+        scores += np.where(mask, rule.points, 0)
+    levels = np.where(scores >= HIGH_RISK_SCORE, "high", np.where(scores >= MEDIUM_RISK_SCORE, "medium", "low"))
+
+    factors: List[List[str]] = [[] for _ in latest]
+    for rule, mask in zip(rules, masks):
+        for i in np.flatnonzero(mask):
+            factors[i].append(describe(rule, latest[i]))
+    recommendations = {level: RECOMMENDATIONS[level] for level in ("low", "medium", "high")}
+
+    results = []
+    for vital, score, level, row_factors in zip(latest, scores.tolist(), levels.tolist(), factors):
+        results.append({
+            "user_id": vital["user_id"],
+            "score": round(int(score) if score.is_integer() else score, 2),
+            "risk_level": level,
+            "factors": row_factors or ["All vitals within normal range"],
+            "recommendations": list(recommendations[level]),
+        })
+    return results
+
+
+async def iter_latest_vitals(db, chunk_size: int = RESCORE_CHUNK_SIZE,
+                             user_ids: Optional[List[str]] = None) -> AsyncIterator[List[dict]]:
+    # Sorting on the {user_id, timestamp} index lets $group take the newest reading per user
+    # without a blocking in-memory sort; results stream back in cursor batches.
+    match = dict(SCORED_VITALS)
+    if user_ids:
+        match["user_id"] = {"$in": user_ids}
+    pipeline = [
+        {"$match": match},
+        {"$sort": {"user_id": 1, "timestamp": -1}},
+        {"$group": {"_id": "$user_id", "latest": {"$first": "$$ROOT"}}},
+        {"$replaceRoot": {"newRoot": "$latest"}},
+        {"$project": {"_id": 0, "user_id": 1, **{m: 1 for m in METRICS}}},
+    ]
+    cursor = db.vitals.aggregate(pipeline, allowDiskUse=True, batchSize=chunk_size)
+    chunk: List[dict] = []
+    async for doc in cursor:
+        chunk.append(doc)
+        if len(chunk) >= chunk_size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+async def rescore_population(db, chunk_size: int = RESCORE_CHUNK_SIZE, user_ids: Optional[List[str]] = None,
+                             rules: Optional[List[RiskRule]] = None, write: bool = True,
+                             on_recorded: Optional[Callable[[dict, Optional[str]], None]] = None) -> dict:
+    """Re-score every patient (or ``user_ids``) and bulk-insert fresh risk_scores documents.
+
+    Each chunk is recorded the way record_risk records one score: the
+    risk_scores insert, the panel summary update, and ``on_recorded(doc,
+    previous_level)`` (the alert hub) for every patient. The chunk's
+    risk_state windows are dropped in the same pass, so RiskEngine re-seeds
+    them from the stored history this job just scored instead of serving
+    a score computed from a stale window.
+    """
+    started = time.perf_counter()
+    patients = 0
+    levels = {"low": 0, "medium": 0, "high": 0}
+    async for latest in iter_latest_vitals(db, chunk_size, user_ids):
+        results = score_chunk(latest, rules)
+        now = datetime.now(timezone.utc)
+        for r in results:
+            levels[r["risk_level"]] += 1
+        if write and results:
+            ids = [r["user_id"] for r in results]
+            previous = {}
+            if on_recorded is not None:
+                async for summary in db.patient_summaries.find({"id": {"$in": ids}}, {"_id": 0, "id": 1, "risk_level": 1}):
+                    previous[summary["id"]] = summary.get("risk_level")
+            docs = [{"id": str(uuid.uuid4()), **r, "timestamp": now} for r in results]
+            await db.risk_scores.bulk_write([InsertOne(d) for d in docs], ordered=False)
+            await db.patient_summaries.bulk_write([risk_update(d) for d in docs], ordered=False)
+            await db.risk_state.delete_many({"user_id": {"$in": ids}})
+            if on_recorded is not None:
+                for d in docs:
+                    on_recorded(d, previous.get(d["user_id"]))
+        patients += len(results)
+    elapsed = time.perf_counter() - started
+    logging.info(f"Re-scored {patients} patients in {elapsed:.2f}s")
+    return {
+        "patients": patients,
+        "levels": levels,
+        "seconds": round(elapsed, 3),
+        "patients_per_sec": round(patients / elapsed, 1) if elapsed else None,
+    }
+
+
+if __name__ == "__main__":
+    # python -m services.riskRescoreService [--dry-run]
+    import sys
+    from pathlib import Path
+    from dotenv import load_dotenv
+    from motor.motor_asyncio import AsyncIOMotorClient
+
+    load_dotenv(Path(__file__).parent.parent / ".env")
+    logging.basicConfig(level=logging.INFO)
+
+    async def _main():
+        client = AsyncIOMotorClient(os.environ.get("MONGO_URL", "mongodb://localhost:27017"), tz_aware=True)
+        db = client[os.environ.get("DB_NAME", "carecompanion_db")]
+        print(await rescore_population(db, write="--dry-run" not in sys.argv))
+        client.close()
+
+    asyncio.run(_main())
@@ -0,0 +1,239 @@
+import asyncio
+import logging
+import os
+from datetime import datetime, timedelta, timezone
+from typing import TYPE_CHECKING, Dict, Iterable, List, Optional, Tuple
+
+from pymongo import UpdateOne
+
+from services.dateService import as_utc, utcnow
+from services.riskEngineService import METRICS
+
+if TYPE_CHECKING:
+    import numpy as np
+
+ROLLUP_MAX_BUCKETS = int(os.environ.get("ROLLUP_MAX_BUCKETS", 2000))
+DOWNSAMPLE_MAX_POINTS = int(os.environ.get("DOWNSAMPLE_MAX_POINTS", 5000))
+
+BUCKETS = {"hour": timedelta(hours=1), "day": timedelta(days=1), "week": timedelta(weeks=1)}
+# $dateToString keys (UTC) for the buckets aggregated in Mongo; weeks are folded from days
+_KEY_FORMAT = {"hour": "%Y-%m-%dT%H", "day": "%Y-%m-%d"}
+
+
+def _iso(dt: datetime) -> str:
+    return dt.astimezone(timezone.utc).isoformat()
+
+
+def _bucket_start(key: str) -> datetime:
+    # "2024-01-01T05" (hour) or "2024-01-01" (day)
+    return datetime.fromisoformat(key + (":00:00" if "T" in key else "T00:00:00")).replace(tzinfo=timezone.utc)
+
+
+def _range_match(user_id: str, start: datetime, end: datetime) -> dict:
+    return {"user_id": user_id, "timestamp": {"$gte": as_utc(start), "$lt": as_utc(end)}}
+
+
+def bucket_pipeline(match: dict, bucket: str, metrics: Iterable[str]) -> List[dict]:
+    """min/max/sum/count/last per metric and hour or day bucket, in one round trip.
+
+    Each metric gets its own $facet branch so null readings drop out of
+    that metric only, and ``last`` is the newest non-null value.
+    """
+    metrics = list(metrics)
+
+    def branch(metric: str) -> List[dict]:
+        return [
+            {"$match": {metric: {"$ne": None}}},
+            {"$group": {
+                "_id": "$bucket",
+                "min": {"$min": f"${metric}"},
+                "max": {"$max": f"${metric}"},
+                "sum": {"$sum": f"${metric}"},
+                "count": {"$sum": 1},
+                "last": {"$last": f"${metric}"},
+                "last_at": {"$last": "$timestamp"},
+            }},
+            {"$sort": {"_id": 1}},
+        ]
+
+    return [
+        {"$match": match},
+        # Sorted before grouping so $last is the newest reading in each bucket
+        {"$sort": {"timestamp": 1}},
+        {"$project": {"_id": 0, "timestamp": 1, **{m: 1 for m in metrics},
+                      "bucket": {"$dateToString": {"format": _KEY_FORMAT[bucket], "date": "$timestamp"}}}},
+        {"$facet": {m: branch(m) for m in metrics}},
+    ]
+
+
+def _summary(stats: dict) -> dict:
+    return {
+        "min": stats["min"],
+        "max": stats["max"],
+        "mean": round(stats["sum"] / stats["count"], 2),
+        "last": stats["last"],
+        "count": stats["count"],
+    }
+
+
+def _fold(into: Optional[dict], stats: dict) -> dict:
+    if into is None:
+        return dict(stats)
+    newer = stats["last_at"] >= into["last_at"]
+    return {
+        "min": min(into["min"], stats["min"]),
+        "max": max(into["max"], stats["max"]),
+        "sum": into["sum"] + stats["sum"],
+        "count": into["count"] + stats["count"],
+        "last": stats["last"] if newer else into["last"],
+        "last_at": stats["last_at"] if newer else into["last_at"],
+    }
+
+
+def lttb(x: "np.ndarray", y: "np.ndarray", threshold: int) -> "np.ndarray":
+    """Indices of the points Largest-Triangle-Three-Buckets keeps.
+
+    Always keeps the first and last point; each bucket in between
+    contributes the point forming the largest triangle with the previously
+    kept point and the next bucket's average, which preserves peaks and
+    dips that plain averaging would flatten.
+    """
+    import numpy as np
+
+    n = len(x)
+    if threshold >= n or threshold < 3:
+        return np.arange(n)
+    keep = np.empty(threshold, dtype=np.int64)
+    keep[0], keep[-1] = 0, n - 1
+    edges = np.linspace(1, n - 1, threshold - 1).astype(np.int64)
+    a = 0
+    for i in range(threshold - 2):
+        start, end = edges[i], edges[i + 1]
+        next_start, next_end = edges[i + 1], edges[i + 2] if i + 2 < len(edges) else n
+        avg_x = x[next_start:next_end].mean()
+        avg_y = y[next_start:next_end].mean()
+        area = np.abs((x[a] - avg_x) * (y[start:end] - y[a]) - (x[a] - x[start:end]) * (avg_y - y[a]))
+        a = start + int(area.argmax())
+        keep[i + 1] = a
+    return keep
+
+
+class VitalRollups:
+    """Per-metric vitals buckets for charts.
+
+    Hour buckets are aggregated from db.vitals on request. Day buckets are
+    precomputed into ``vital_rollups`` (one document per user and day) and
+    refreshed for the days a write touches; week buckets are folded from
+    those. ``downsample`` returns raw points thinned with LTTB.
+    """
+
+    def __init__(self, db, metrics: Iterable[str] = METRICS):
+        self.db = db
+        self.metrics = tuple(metrics)
+
+    async def _aggregate(self, match: dict, bucket: str, metrics: Iterable[str]) -> Dict[str, list]:
+        result = await self.db.vitals.aggregate(bucket_pipeline(match, bucket, metrics)).to_list(1)
+        return result[0] if result else {}
+
+    async def _write_days(self, user_id: str, match: dict, days: Iterable[str] = ()):
+        facets = await self._aggregate(match, "day", self.metrics)
+        # Touched days that came back empty are reset too
+        by_day: Dict[str, dict] = {day: {} for day in days}
+        for metric, rows in facets.items():
+            for row in rows:
+                by_day.setdefault(row["_id"], {})[metric] = {k: v for k, v in row.items() if k != "_id"}
+        if not by_day:
+            return
+        now = utcnow()
+        await self.db.vital_rollups.bulk_write([
+            UpdateOne({"user_id": user_id, "day": day}, {"$set": {"metrics": metrics, "updated_at": now}}, upsert=True)
+            for day, metrics in by_day.items()
+        ], ordered=False)
+
+    async def refresh(self, user_id: str, docs: Iterable[dict]):
+        """Recompute the daily rollups for every day the given vitals fall on.
+
+        Recomputing (rather than incrementing) stays correct when a write
+        replaces an existing reading, as wearable re-syncs do.
+        """
+        days = sorted({as_utc(doc["timestamp"]).strftime(_KEY_FORMAT["day"]) for doc in docs if doc.get("timestamp")})
+        if not days:
+            return
+        ranges = []
+        for day in days:
+            start = _bucket_start(day)
+            ranges.append({"timestamp": {"$gte": start, "$lt": start + BUCKETS["day"]}})
+        await self._write_days(user_id, {"user_id": user_id, "$or": ranges}, days)
+
+    async def buckets(self, user_id: str, bucket: str, start: datetime, end: datetime,
+                      metrics: Optional[List[str]] = None) -> Dict[str, list]:
+        metrics = metrics or list(self.metrics)
+        out: Dict[str, list] = {m: [] for m in metrics}
+        if bucket == "hour":
+            facets = await self._aggregate(_range_match(user_id, start, end), "hour", metrics)
+            for metric in metrics:
+                for row in facets.get(metric, []):
+                    out[metric].append({"start": _iso(_bucket_start(row["_id"])), **_summary(row)})
+            return out
+
+        docs = await self.db.vital_rollups.find(
+            # Every day that starts before ``end``
+            {"user_id": user_id, "day": {"$gte": _iso(start)[:10], "$lte": _iso(end - timedelta(microseconds=1))[:10]}},
+            {"_id": 0, "day": 1, **{f"metrics.{m}": 1 for m in metrics}},
+        ).sort("day", 1).to_list(None)
+        for metric in metrics:
+            folded: Dict[datetime, dict] = {}
+            for doc in docs:
+                stats = doc.get("metrics", {}).get(metric)
+                if not stats:
+                    continue
+                key = _bucket_start(doc["day"])
+                if bucket == "week":
+                    key -= timedelta(days=key.weekday())  # weeks start on Monday
+                folded[key] = _fold(folded.get(key), stats)
+            out[metric] = [{"start": _iso(key), **_summary(stats)} for key, stats in folded.items()]
+        return out
+
+    async def downsample(self, user_id: str, metric: str, start: datetime, end: datetime,
+                         points: int) -> Tuple[List[list], int]:
+        match = {**_range_match(user_id, start, end), metric: {"$ne": None}}
+        cursor = self.db.vitals.find(match, {"_id": 0, "timestamp": 1, metric: 1}).sort("timestamp", 1)
+        # Two floats per reading rather than a dict each
+        xs, ys = [], []
+        async for doc in cursor:
+            xs.append(as_utc(doc["timestamp"]).timestamp())
+            ys.append(doc[metric])
+        if not xs:
+            return [], 0
+        import numpy as np
+
+        x, y = np.asarray(xs, dtype=np.float64), np.asarray(ys, dtype=np.float64)
+        keep = await asyncio.to_thread(lttb, x, y, points)
+        return [[_iso(datetime.fromtimestamp(x[i], tz=timezone.utc)), ys[i]] for i in keep], len(xs)
+
+    async def rebuild(self, user_ids: Optional[List[str]] = None) -> int:
+        """Backfill vital_rollups from existing vitals (e.g. data written before rollups existed)."""
+        if user_ids is None:
+            user_ids = await self.db.vitals.distinct("user_id")
+        for user_id in user_ids:
+            # Skip readings whose timestamp is still a legacy string; $dateToString rejects them
+            await self._write_days(user_id, {"user_id": user_id, "timestamp": {"$type": "date"}})
+        return len(user_ids)
+
+
+if __name__ == "__main__":
+    # python -m services.rollupService  (backfill daily rollups for every user)
+    from pathlib import Path
+    from dotenv import load_dotenv
+    from motor.motor_asyncio import AsyncIOMotorClient
+
+    load_dotenv(Path(__file__).parent.parent / ".env")
+    logging.basicConfig(level=logging.INFO)
+
+    async def _main():
+        client = AsyncIOMotorClient(os.environ.get("MONGO_URL", "mongodb://localhost:27017"), tz_aware=True)
+        db = client[os.environ.get("DB_NAME", "carecompanion_db")]
+        print(f"Rebuilt daily rollups for {await VitalRollups(db).rebuild()} users")
+        client.close()
+
+    asyncio.run(_main())
@@ -0,0 +1,277 @@
+import asyncio
+import logging
+import os
+import uuid
+from datetime import datetime, timedelta, timezone
+from typing import Awaitable, Callable, Dict, List, Set, Tuple
+
+from pymongo import UpdateMany
+from pymongo.errors import DuplicateKeyError
+
+from services.dateService import as_utc, utcnow
+
+APPOINTMENT_SLOT_MINUTES = int(os.environ.get("APPOINTMENT_SLOT_MINUTES", 30))
+# Working hours offered by the availability endpoint, in UTC; booking itself only checks for conflicts
+APPOINTMENT_DAY_START_HOUR = int(os.environ.get("APPOINTMENT_DAY_START_HOUR", 9))
+APPOINTMENT_DAY_END_HOUR = int(os.environ.get("APPOINTMENT_DAY_END_HOUR", 17))
+APPOINTMENT_WORKDAYS = {int(d) for d in os.environ.get("APPOINTMENT_WORKDAYS", "0,1,2,3,4").split(",") if d.strip()}
+APPOINTMENT_AVAILABILITY_MAX_DAYS = int(os.environ.get("APPOINTMENT_AVAILABILITY_MAX_DAYS", 31))
+# A slot claim this old with no scheduled appointment behind it was left by a crashed booking
+APPOINTMENT_ORPHAN_SECONDS = int(os.environ.get("APPOINTMENT_ORPHAN_SECONDS", 60))
+APPOINTMENT_REBUILD_BATCH = int(os.environ.get("APPOINTMENT_REBUILD_BATCH", 1000))
+
+USER_PROJECTION = {"_id": 0, "id": 1, "role": 1, "full_name": 1, "email": 1, "age": 1}
+_EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+
+class SchedulingError(Exception):
+    """Base for booking failures the API reports to the caller."""
+
+
+class ParticipantNotFound(SchedulingError):
+    """The patient or doctor id doesn't name a user with that role."""
+
+
+class SlotTaken(SchedulingError):
+    """The doctor or the patient already has an appointment in that slot."""
+
+
+def slot_of(when: datetime, minutes: int = APPOINTMENT_SLOT_MINUTES) -> datetime:
+    """Start of the fixed-length slot containing ``when`` (slots are aligned to the Unix epoch, in UTC)."""
+    step = timedelta(minutes=minutes)
+    return _EPOCH + ((as_utc(when) - _EPOCH) // step) * step
+
+
+class AppointmentScheduler:
+    """Books appointments against a per-slot claim index, and keeps denormalized names fresh.
+
+    Booking first inserts a claim into ``appointment_slots``. Claims have
+    unique indexes on (doctor_id, slot) and (patient_id, slot). Two
+    concurrent bookings of one slot therefore race on a single index
+    insert, and exactly one wins; the loser gets SlotTaken. Only then is
+    the appointment written. If that write fails, the claim is released.
+    A claim left behind by a crash between the two writes is reclaimed
+    the next time someone books that slot, and ``rebuild`` sweeps it up.
+
+    Appointments copy ``patient_name`` and ``doctor_name`` at booking
+    time. ``names_changed`` rewrites those copies in the background, along
+    with anything registered through ``on_renamed``. Refreshes for the
+    same user are coalesced, and each run re-reads the current name, so
+    quick successive renames settle on the last one.
+    """
+
+    def __init__(self, db, slot_minutes: int = APPOINTMENT_SLOT_MINUTES):
+        self.db = db
+        self.slot_minutes = slot_minutes
+        self._rename_hooks: List[Callable[[dict], Awaitable]] = []
+        self._dirty: Set[str] = set()
+        self._tasks: Dict[str, asyncio.Task] = {}
+        self.booked = 0
+        self.conflicts = 0
+        self.reclaimed = 0
+        self.renames = 0
+
+    # --- Booking ---
+    async def participants(self, patient_id: str, doctor_id: str) -> Tuple[dict, dict]:
+        # One round trip for both users
+        users = await self.db.users.find({"id": {"$in": [patient_id, doctor_id]}}, USER_PROJECTION).to_list(2)
+        by_id = {u["id"]: u for u in users}
+        patient, doctor = by_id.get(patient_id), by_id.get(doctor_id)
+        if not patient or not doctor or patient.get("role") != "patient" or doctor.get("role") != "doctor":
+            raise ParticipantNotFound("Patient or doctor not found")
+        return patient, doctor
+
+    async def _reclaim(self, claim: dict) -> bool:
+        # Frees a claim whose booking never produced a scheduled appointment
+        if claim.get("created_at") and utcnow() - as_utc(claim["created_at"]) < timedelta(seconds=APPOINTMENT_ORPHAN_SECONDS):
+            return False
+        if await self.db.appointments.find_one({"id": claim["appointment_id"], "status": "scheduled"}, {"_id": 1}):
+            return False
+        result = await self.db.appointment_slots.delete_one({"_id": claim["_id"]})
+        self.reclaimed += result.deleted_count
+        return result.deleted_count == 1
+
+    async def _claim(self, appointment_id: str, patient_id: str, doctor_id: str, slot: datetime):
+        claim = {"appointment_id": appointment_id, "doctor_id": doctor_id, "patient_id": patient_id,
+                 "slot": slot, "created_at": utcnow()}
+        for attempt in range(2):
+            try:
+                await self.db.appointment_slots.insert_one(dict(claim))
+                return
+            except DuplicateKeyError:
+                holders = await self.db.appointment_slots.find(
+                    {"slot": slot, "$or": [{"doctor_id": doctor_id}, {"patient_id": patient_id}]}
+                ).to_list(2)
+                # No holders left: the competing claim was released in between, so the slot may be free again
+                if attempt == 0 and (not holders or all([await self._reclaim(h) for h in holders])):
+                    continue
+                self.conflicts += 1
+                if not holders:
+                    raise SlotTaken("This time slot was just taken, please pick another")
+                if any(h["doctor_id"] == doctor_id for h in holders):
+                    raise SlotTaken("The doctor already has an appointment at this time")
+                raise SlotTaken("The patient already has an appointment at this time")
+
+    async def book(self, patient_id: str, doctor_id: str, scheduled_time: datetime, reason: str) -> Tuple[dict, dict]:
+        """Returns (appointment, patient). Raises ParticipantNotFound or SlotTaken."""
+        patient, doctor = await self.participants(patient_id, doctor_id)
+        appointment = {
+            "id": str(uuid.uuid4()),
+            "patient_id": patient_id,
+            "patient_name": patient["full_name"],
+            "doctor_id": doctor_id,
+            "doctor_name": doctor["full_name"],
+            "scheduled_time": as_utc(scheduled_time),
+            "reason": reason,
+            "status": "scheduled",
+            "created_at": utcnow(),
+        }
+        await self._claim(appointment["id"], patient_id, doctor_id, slot_of(scheduled_time, self.slot_minutes))
+        try:
+            await self.db.appointments.insert_one(appointment)
+        except BaseException:
+            await self.db.appointment_slots.delete_one({"appointment_id": appointment["id"]})
+            raise
+        self.booked += 1
+        return appointment, patient
+
+    # --- Availability ---
+    def working_slots(self, start: datetime, end: datetime) -> List[datetime]:
+        step = timedelta(minutes=self.slot_minutes)
+        slot = slot_of(start, self.slot_minutes)
+        if slot < as_utc(start):
+            slot += step
+        out = []
+        while slot < end:
+            if slot.weekday() in APPOINTMENT_WORKDAYS and APPOINTMENT_DAY_START_HOUR <= slot.hour < APPOINTMENT_DAY_END_HOUR:
+                out.append(slot)
+            slot += step
+        return out
+
+    async def availability(self, doctor_id: str, start: datetime, end: datetime) -> Tuple[List[datetime], int]:
+        """Free working-hour slots in [start, end), and how many slots in that range are booked."""
+        start, end = max(as_utc(start), utcnow()), as_utc(end)
+        taken = {
+            as_utc(c["slot"]) for c in await self.db.appointment_slots.find(
+                {"doctor_id": doctor_id, "slot": {"$gte": slot_of(start, self.slot_minutes), "$lt": end}},
+                {"_id": 0, "slot": 1},
+            ).to_list(None)
+        }
+        return [s for s in self.working_slots(start, end) if s not in taken], len(taken)
+
+    # --- Denormalized names ---
+    def on_renamed(self, hook: Callable[[dict], Awaitable]):
+        self._rename_hooks.append(hook)
+
+    async def refresh_names(self, user_id: str) -> int:
+        """Rewrites this user's name on their appointments (and whatever the hooks maintain)."""
+        user = await self.db.users.find_one({"id": user_id}, USER_PROJECTION)
+        if not user:
+            return 0
+        name = user["full_name"]
+        result = await self.db.appointments.bulk_write([
+            UpdateMany({"patient_id": user_id, "patient_name": {"$ne": name}}, {"$set": {"patient_name": name}}),
+            UpdateMany({"doctor_id": user_id, "doctor_name": {"$ne": name}}, {"$set": {"doctor_name": name}}),
+        ], ordered=False)
+        for hook in self._rename_hooks:
+            await hook(user)
+        self.renames += 1
+        return result.modified_count
+
+    async def _refresh_loop(self, user_id: str):
+        try:
+            while user_id in self._dirty:
+                self._dirty.discard(user_id)
+                try:
+                    await self.refresh_names(user_id)
+                except Exception as e:
+                    logging.error(f"Name refresh for {user_id} failed: {e}", exc_info=True)
+        finally:
+            self._tasks.pop(user_id, None)
+
+    def names_changed(self, user_id: str):
+        """Schedules a background refresh; calls while one is running just make it go round once more."""
+        self._dirty.add(user_id)
+        if user_id not in self._tasks:
+            self._tasks[user_id] = asyncio.create_task(self._refresh_loop(user_id))
+
+    async def stop(self):
+        # Anything cut short here is picked up by `rebuild --names`
+        tasks = list(self._tasks.values())
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    # --- Backfill ---
+    async def rebuild(self, names: bool = False, batch_size: int = APPOINTMENT_REBUILD_BATCH) -> dict:
+        """Claim slots for scheduled appointments that have none and drop claims without one.
+
+        Double bookings made before the slot index existed keep their
+        appointments. Only the first one gets the claim; the rest are
+        counted and logged. With ``names``, every user's name is also
+        pushed to their appointments.
+        """
+        stats = {"claimed": 0, "double_booked": 0, "orphans_removed": 0, "renamed": 0}
+        started = utcnow()
+        claimed = {c["appointment_id"] async for c in self.db.appointment_slots.find({}, {"_id": 0, "appointment_id": 1})}
+        # _id order is insertion order, so the earliest of two overlapping bookings keeps the slot
+        cursor = self.db.appointments.find(
+            {"status": "scheduled"}, {"_id": 0, "id": 1, "patient_id": 1, "doctor_id": 1, "scheduled_time": 1}
+        ).sort("_id", 1)
+        scheduled = set()
+        async for appointment in cursor.batch_size(batch_size):
+            scheduled.add(appointment["id"])
+            if appointment["id"] in claimed or not isinstance(appointment.get("scheduled_time"), datetime):
+                continue
+            try:
+                await self.db.appointment_slots.insert_one({
+                    "appointment_id": appointment["id"], "doctor_id": appointment["doctor_id"],
+                    "patient_id": appointment["patient_id"],
+                    "slot": slot_of(appointment["scheduled_time"], self.slot_minutes), "created_at": utcnow(),
+                })
+                stats["claimed"] += 1
+            except DuplicateKeyError:
+                stats["double_booked"] += 1
+                logging.warning(f"Appointment {appointment['id']} overlaps an earlier booking; left without a slot claim")
+        orphans = list(claimed - scheduled)
+        # Claims younger than that may belong to a booking whose appointment insert is still in flight
+        settled = started - timedelta(seconds=APPOINTMENT_ORPHAN_SECONDS)
+        for i in range(0, len(orphans), batch_size):
+            result = await self.db.appointment_slots.delete_many(
+                {"appointment_id": {"$in": orphans[i:i + batch_size]}, "created_at": {"$lt": settled}}
+            )
+            stats["orphans_removed"] += result.deleted_count
+        if names:
+            async for user in self.db.users.find({}, {"_id": 0, "id": 1}).batch_size(batch_size):
+                stats["renamed"] += await self.refresh_names(user["id"])
+        logging.info(f"Appointment slot index rebuilt: {stats}")
+        return stats
+
+    def stats(self) -> dict:
+        return {"booked": self.booked, "conflicts": self.conflicts, "reclaimed": self.reclaimed,
+                "name_refreshes": self.renames, "refreshes_running": len(self._tasks)}
+
+
+if __name__ == "__main__":
+    # python -m services.schedulingService [--names]  (backfill the slot index; --names also re-syncs copied names)
+    import sys
+    from pathlib import Path
+    from dotenv import load_dotenv
+    from motor.motor_asyncio import AsyncIOMotorClient
+
+    load_dotenv(Path(__file__).parent.parent / ".env")
+    logging.basicConfig(level=logging.INFO)
+
+    async def _main():
+        from services.indexService import ensure_indexes
+        from services.panelService import PatientPanel
+
+        client = AsyncIOMotorClient(os.environ.get("MONGO_URL", "mongodb://localhost:27017"), tz_aware=True)
+        db = client[os.environ.get("DB_NAME", "carecompanion_db")]
+        await ensure_indexes(db)
+        scheduler = AppointmentScheduler(db)
+        scheduler.on_renamed(PatientPanel(db).on_profile)
+        print(await scheduler.rebuild(names="--names" in sys.argv))
+        client.close()
+
+    asyncio.run(_main())
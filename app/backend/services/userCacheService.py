@@ -0,0 +1,54 @@
+import os
+from typing import Optional
+
+from cachetools import TTLCache
+
+USER_CACHE_SIZE = int(os.environ.get("USER_CACHE_SIZE", 10000))
+USER_CACHE_TTL_SECONDS = int(os.environ.get("USER_CACHE_TTL_SECONDS", 60))
+AUTH_TRUST_TOKEN_CLAIMS = os.environ.get("AUTH_TRUST_TOKEN_CLAIMS", "false").lower() in ("1", "true", "yes")
+
+# Secrets stay out of the cache; GoogleTokenStore reads the refresh token itself
+USER_PROJECTION = {"_id": 0, "password": 0, "google_refresh_token": 0}
+
+
+class UserCache:
+    """In-process TTL + LRU cache of user documents keyed by user id.
+
+    Anything that writes to a user document (profile edits, stored Google
+    tokens) must call ``invalidate`` so the next request reloads it.
+    """
+
+    def __init__(self, db, maxsize: int = USER_CACHE_SIZE, ttl: int = USER_CACHE_TTL_SECONDS):
+        self.db = db
+        self._cache = TTLCache(maxsize=maxsize, ttl=ttl)
+        self.hits = 0
+        self.misses = 0
+
+    async def get(self, user_id: str) -> Optional[dict]:
+        user = self._cache.get(user_id)
+        if user is not None:
+            self.hits += 1
+            return user
+        self.misses += 1
+        user = await self.db.users.find_one({"id": user_id}, USER_PROJECTION)
+        if user:
+            self._cache[user_id] = user
+        return user
+
+    def put(self, user: dict):
+        self._cache[user["id"]] = {k: v for k, v in user.items() if k not in USER_PROJECTION}
+
+    def invalidate(self, user_id: str):
+        self._cache.pop(user_id, None)
+
+    def clear(self):
+        self._cache.clear()
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / total, 4) if total else 0.0,
+            "size": len(self._cache),
+        }
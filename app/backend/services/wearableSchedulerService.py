@@ -0,0 +1,264 @@
+import asyncio
+import logging
+import os
+import socket
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+from typing import Awaitable, Callable, List, Optional
+
+import httpx
+from pymongo import UpdateOne
+from pymongo.errors import DuplicateKeyError
+
+from services.dateService import utcnow
+from services.googleFitService import WEARABLE_METRICS
+from services.googleTokenService import GoogleAuthError
+
+FIT_SCHEDULER_ENABLED = os.environ.get("FIT_SCHEDULER_ENABLED", "true").lower() in ("1", "true", "yes")
+FIT_SCHEDULER_INTERVAL_SECONDS = float(os.environ.get("FIT_SCHEDULER_INTERVAL_SECONDS", 900))
+FIT_SCHEDULER_CONCURRENCY = int(os.environ.get("FIT_SCHEDULER_CONCURRENCY", 8))
+FIT_SYNC_USER_MIN_INTERVAL_SECONDS = float(os.environ.get("FIT_SYNC_USER_MIN_INTERVAL_SECONDS", 600))
+FIT_QUOTA_PER_MINUTE = float(os.environ.get("FIT_QUOTA_PER_MINUTE", 300))
+# A pass holds a Mongo lease, renewed while it runs, so one worker syncs at a time; the rest poll for the next pass
+FIT_SCHEDULER_LEASE_SECONDS = float(os.environ.get("FIT_SCHEDULER_LEASE_SECONDS", 120))
+FIT_SCHEDULER_POLL_SECONDS = float(os.environ.get("FIT_SCHEDULER_POLL_SECONDS", 60))
+LEASE_ID = "wearable_sync"
+
+
+class TokenBucket:
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def try_acquire(self, tokens: float = 1) -> bool:
+        self._refill()
+        if self.tokens >= tokens:
+            self.tokens -= tokens
+            return True
+        return False
+
+    async def acquire(self, tokens: float = 1):
+        while not self.try_acquire(tokens):
+            await asyncio.sleep((tokens - self.tokens) / self.rate)
+
+
+def wearable_vitals(user_id: str, rows: List[tuple]) -> List[dict]:
+    """Fold synced daily buckets into one db.vitals document per user and day.
+
+    Each document is timestamped at the start of its day. Today's bucket
+    ends at the moment of the sync, so dating it by its end would move it
+    forward on every pass.
+    """
+    days = {}
+    for metric, start, end, value in rows:
+        day = days.setdefault(start, {})
+        if metric == "heartrate":
+            day["heart_rate"] = round(value["avg"])
+        elif metric == "oxygen":
+            day["oxygen_saturation"] = round(value["avg"])
+        elif metric == "sleep" and value["minutes"]:
+            day["sleep_hours"] = round(value["minutes"] / 60, 1)
+    docs = []
+    for start, day in days.items():
+        if not day:
+            continue
+        docs.append({
+            # Deterministic id: re-syncing a day updates its vital instead of adding another
+            "id": f"gfit-{user_id}-{start}",
+            "user_id": user_id,
+            "heart_rate": day.get("heart_rate"),
+            "blood_pressure_systolic": None,
+            "blood_pressure_diastolic": None,
+            "temperature": None,
+            "oxygen_saturation": day.get("oxygen_saturation"),
+            "sleep_hours": day.get("sleep_hours"),
+            "activity_minutes": None,
+            "notes": "Synced from Google Fit",
+            "source": "google_fit",
+            "timestamp": datetime.fromtimestamp(start / 1000, tz=timezone.utc),
+        })
+    return docs
+
+
+class WearableSyncScheduler:
+    """Refreshes connected users' Google Fit data in the background.
+
+    Every ``interval`` seconds it walks users with a stored Google token and
+    syncs them through FitSync, at most ``concurrency`` at a time. Every
+    uvicorn worker runs a scheduler, so the coordination lives in Mongo:
+
+    - a pass is claimed on the ``scheduler_leases`` document, which also
+      records when the next pass is due. The lease is renewed while the
+      pass runs, so only one worker syncs at a time and the quota bucket
+      (which is per process) is the only one spending Google Fit calls.
+    - each user is claimed by moving ``fit_next_sync_at`` on their users
+      document ``user_min_interval`` ahead, so a user is never synced more
+      often than that, whichever worker runs the pass.
+
+    The quota bucket holds the pass under ``quota_per_minute`` aggregate
+    calls and is charged per upstream call, not per user. Access tokens come
+    from ``tokens`` (a GoogleTokenStore) when given, so expired ones are
+    refreshed first. Synced days that are new or changed are upserted into
+    db.vitals and handed to ``after_write`` (e.g. to refresh rollups and the
+    panel).
+    """
+
+    def __init__(self, db, fit_sync, tokens=None, after_write: Optional[Callable[[str, List[dict]], Awaitable]] = None,
+                 interval: float = FIT_SCHEDULER_INTERVAL_SECONDS, concurrency: int = FIT_SCHEDULER_CONCURRENCY,
+                 user_min_interval: float = FIT_SYNC_USER_MIN_INTERVAL_SECONDS,
+                 quota_per_minute: float = FIT_QUOTA_PER_MINUTE, lease_seconds: float = FIT_SCHEDULER_LEASE_SECONDS,
+                 poll_seconds: float = FIT_SCHEDULER_POLL_SECONDS):
+        self.db = db
+        self.fit_sync = fit_sync
+        self.tokens = tokens
+        self.after_write = after_write
+        self.interval = interval
+        self.concurrency = concurrency
+        self.user_min_interval = user_min_interval
+        self.quota = TokenBucket(rate=quota_per_minute / 60, capacity=max(1.0, quota_per_minute / 60 * 5))
+        self.lease_seconds = lease_seconds
+        self.poll_seconds = min(interval, poll_seconds)
+        self.owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self._renewed = 0.0
+        self._task: Optional[asyncio.Task] = None
+        self.stats = {"runs": 0, "standby": 0, "synced": 0, "throttled": 0, "failed": 0, "vitals_written": 0}
+
+    async def _claim_run(self) -> bool:
+        # Due and not leased by a worker still running the previous pass; a missing document is inserted
+        now = utcnow()
+        try:
+            await self.db.scheduler_leases.update_one(
+                {"_id": LEASE_ID, "next_run_at": {"$lte": now},
+                 "$or": [{"lease_until": {"$lte": now}}, {"owner": self.owner}]},
+                {"$set": {"owner": self.owner, "lease_until": now + timedelta(seconds=self.lease_seconds),
+                          "next_run_at": now + timedelta(seconds=self.interval)}},
+                upsert=True,
+            )
+        except DuplicateKeyError:
+            return False
+        self._renewed = time.monotonic()
+        return True
+
+    async def _renew(self) -> bool:
+        if time.monotonic() - self._renewed < self.lease_seconds / 3:
+            return True
+        result = await self.db.scheduler_leases.update_one(
+            {"_id": LEASE_ID, "owner": self.owner},
+            {"$set": {"lease_until": utcnow() + timedelta(seconds=self.lease_seconds)}},
+        )
+        self._renewed = time.monotonic()
+        return result.matched_count == 1
+
+    async def _release(self):
+        await self.db.scheduler_leases.update_one({"_id": LEASE_ID, "owner": self.owner}, {"$set": {"lease_until": utcnow()}})
+
+    async def _claim_user(self, user_id: str) -> bool:
+        now = utcnow()
+        result = await self.db.users.update_one(
+            {"id": user_id, "$or": [{"fit_next_sync_at": None}, {"fit_next_sync_at": {"$lte": now}}]},
+            {"$set": {"fit_next_sync_at": now + timedelta(seconds=self.user_min_interval)}},
+        )
+        return result.modified_count == 1
+
+    async def _connected_users(self):
+        cursor = self.db.users.find(
+            {"$or": [{"google_access_token": {"$nin": [None, ""]}}, {"google_refresh_token": {"$nin": [None, ""]}}]},
+            {"_id": 0, "id": 1, "google_access_token": 1},
+        )
+        async for user in cursor:
+            yield user
+
+    async def _changed(self, docs: List[dict]) -> List[dict]:
+        # Most passes re-sync days that haven't changed; only new or different days are written and reported
+        if not docs:
+            return []
+        stored = {}
+        async for existing in self.db.vitals.find({"id": {"$in": [d["id"] for d in docs]}}, {"_id": 0}):
+            stored[existing["id"]] = existing
+        return [d for d in docs if any(stored.get(d["id"], {}).get(k, object()) != v for k, v in d.items())]
+
+    async def sync_user(self, user: dict):
+        user_id = user["id"]
+        try:
+            access_token = user.get("google_access_token")
+            if self.tokens:
+                access_token = await self.tokens.get_access_token(user_id, user)
+            rows = await self.fit_sync.sync_once(user_id, access_token, list(WEARABLE_METRICS), quota=self.quota)
+            docs = await self._changed(wearable_vitals(user_id, rows))
+            if docs:
+                await self.db.vitals.bulk_write(
+                    [UpdateOne({"id": d["id"]}, {"$set": d}, upsert=True) for d in docs], ordered=False
+                )
+                if self.after_write:
+                    await self.after_write(user_id, docs)
+            self.stats["synced"] += 1
+            self.stats["vitals_written"] += len(docs)
+        except GoogleAuthError:
+            self.stats["failed"] += 1
+            logging.info(f"Wearable sync skipped {user_id}: Google Fit needs reconnecting")
+        except httpx.HTTPStatusError as e:
+            self.stats["failed"] += 1
+            if e.response.status_code == 401 and self.tokens:
+                # Revoked before its expiry; refresh on the next pass
+                await self.tokens.invalidate(user_id)
+            logging.warning(f"Wearable sync for {user_id} got {e.response.status_code} from Google Fit")
+        except Exception as e:
+            self.stats["failed"] += 1
+            logging.error(f"Wearable sync for {user_id} failed: {e}", exc_info=True)
+
+    async def run_once(self) -> bool:
+        """Run a pass if it is due and no other worker is running one. Returns whether it ran."""
+        if not await self._claim_run():
+            self.stats["standby"] += 1
+            return False
+        semaphore = asyncio.Semaphore(self.concurrency)
+        tasks = set()
+        try:
+            async for user in self._connected_users():
+                if not await self._renew():
+                    logging.warning("Wearable sync lease was taken over; stopping this pass")
+                    break
+                if not await self._claim_user(user["id"]):
+                    self.stats["throttled"] += 1
+                    continue
+                await semaphore.acquire()
+                task = asyncio.create_task(self.sync_user(user))
+                task.add_done_callback(lambda _: semaphore.release())
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+            if tasks:
+                await asyncio.gather(*tasks)
+        finally:
+            await self._release()
+        self.stats["runs"] += 1
+        return True
+
+    async def _loop(self):
+        while True:
+            try:
+                await self.run_once()
+            except Exception as e:
+                logging.error(f"Wearable sync run failed: {e}", exc_info=True)
+            await asyncio.sleep(self.poll_seconds)
+
+    def start(self):
+        if self._task is None or self._task.done():
+            logging.info(f"Starting wearable sync scheduler (every {self.interval:.0f}s, worker {self.owner})")
+            self._task = asyncio.create_task(self._loop())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
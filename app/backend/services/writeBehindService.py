@@ -0,0 +1,311 @@
+import asyncio
+import logging
+import os
+import time
+from collections import defaultdict
+from datetime import timezone
+from pathlib import Path
+from typing import Awaitable, Callable, Dict, Iterator, List, Optional, Tuple
+
+from bson import ObjectId, json_util
+from bson.json_util import CANONICAL_JSON_OPTIONS
+from pymongo.errors import BulkWriteError, PyMongoError
+
+# Trade-off: a queued document reaches Mongo up to WRITE_BEHIND_FLUSH_MS after its request returned 200 (longer
+# if it was spilled). Reads that must see the caller's own writes merge ``pending`` from the same worker; another
+# worker, or anything derived in an on_flushed hook, lags by up to one flush
+WRITE_BEHIND_ENABLED = os.environ.get("WRITE_BEHIND_ENABLED", "false").lower() in ("1", "true", "yes")
+WRITE_BEHIND_QUEUE_SIZE = int(os.environ.get("WRITE_BEHIND_QUEUE_SIZE", 10000))
+WRITE_BEHIND_BATCH_SIZE = int(os.environ.get("WRITE_BEHIND_BATCH_SIZE", 500))
+WRITE_BEHIND_FLUSH_MS = float(os.environ.get("WRITE_BEHIND_FLUSH_MS", 200))
+# A batch insert slower than this is treated as failed and spilled to disk
+WRITE_BEHIND_WRITE_TIMEOUT_SECONDS = float(os.environ.get("WRITE_BEHIND_WRITE_TIMEOUT_SECONDS", 5))
+WRITE_BEHIND_REPLAY_INTERVAL_SECONDS = float(os.environ.get("WRITE_BEHIND_REPLAY_INTERVAL_SECONDS", 30))
+WRITE_BEHIND_SHUTDOWN_SECONDS = float(os.environ.get("WRITE_BEHIND_SHUTDOWN_SECONDS", 10))
+WRITE_BEHIND_SPILL_PATH = os.environ.get(
+    "WRITE_BEHIND_SPILL_PATH", str(Path(__file__).parent.parent / "write_behind_spill.ndjson")
+)
+
+# Canonical Extended JSON keeps ObjectIds, dates and int/float types exact across a spill and replay
+_SPILL_JSON = CANONICAL_JSON_OPTIONS.with_options(tz_aware=True, tzinfo=timezone.utc)
+_DUPLICATE_KEY = 11000
+
+Item = Tuple[str, dict]
+
+
+def _append_lines(path: str, lines: List[str]):
+    with open(path, "a", encoding="utf-8") as f:
+        f.write("".join(lines))
+        f.flush()
+        os.fsync(f.fileno())
+
+
+def _read_chunks(path: str, size: int) -> Iterator[List[Item]]:
+    chunk: List[Item] = []
+    with open(path, encoding="utf-8") as f:
+        for number, line in enumerate(f, 1):
+            try:
+                record = json_util.loads(line, json_options=_SPILL_JSON)
+            except ValueError:
+                # Only a crash mid-append leaves a torn line, and that write was never acknowledged
+                logging.error(f"Skipping unreadable line {number} in {path}")
+                continue
+            chunk.append((record["c"], record["d"]))
+            if len(chunk) >= size:
+                yield chunk
+                chunk = []
+    if chunk:
+        yield chunk
+
+
+class WriteBehindQueue:
+    """Optional write-behind for insert-only documents (vitals, risk scores, chat turns).
+
+    With ``enabled``, ``insert`` assigns the ``_id`` and puts the document on a
+    bounded queue, then returns. A background flusher groups queued documents
+    into one ``insert_many`` per collection, every ``batch_size`` documents or
+    ``flush_ms``, whichever comes first. If the queue is full, a batch insert
+    fails or takes longer than ``write_timeout``, or the process shuts down
+    with documents still queued, those documents are appended (and fsynced)
+    to a spill file. The spill file is replayed at startup and every
+    ``replay_interval``, whether or not the queue ever drains. Because
+    ``_id`` is fixed at enqueue time, replaying a document that already
+    reached Mongo is a harmless duplicate-key error.
+
+    Until it is flushed, a queued document is only visible through
+    ``pending``, keyed by collection and ``user_id``, so a caller's next
+    read on this worker can still see its own write.
+
+    Disabled, or before ``start``, ``insert`` writes straight through.
+    Either way, hooks registered with ``on_flushed`` run once the documents
+    are in Mongo.
+    """
+
+    def __init__(self, db, enabled: bool = WRITE_BEHIND_ENABLED, queue_size: int = WRITE_BEHIND_QUEUE_SIZE,
+                 batch_size: int = WRITE_BEHIND_BATCH_SIZE, flush_ms: float = WRITE_BEHIND_FLUSH_MS,
+                 write_timeout: float = WRITE_BEHIND_WRITE_TIMEOUT_SECONDS,
+                 replay_interval: float = WRITE_BEHIND_REPLAY_INTERVAL_SECONDS,
+                 spill_path: str = WRITE_BEHIND_SPILL_PATH):
+        self.db = db
+        self.enabled = enabled
+        self.queue_size = queue_size
+        self.batch_size = batch_size
+        self.flush_seconds = flush_ms / 1000
+        self.write_timeout = write_timeout
+        self.replay_interval = replay_interval
+        self.spill_path = spill_path
+        self._hooks: Dict[str, Callable[[List[dict]], Awaitable]] = {}
+        self._queue: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+        self._spill_lock: Optional[asyncio.Lock] = None
+        self._inflight: List[Item] = []
+        self._pending: Dict[Tuple[str, str], Dict[ObjectId, dict]] = {}
+        self._closing = False
+        self.enqueued = 0
+        self.flushed = 0
+        self.batches = 0
+        self.spilled = 0
+        self.replayed = 0
+        self.failures = 0
+
+    def on_flushed(self, collection: str, hook: Callable[[List[dict]], Awaitable]):
+        self._hooks[collection] = hook
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done() and not self._closing
+
+    async def insert(self, collection: str, doc: dict):
+        if not self.running:
+            await self.db[collection].insert_one(doc)
+            await self._after(collection, [doc])
+            return
+        doc.setdefault("_id", ObjectId())
+        try:
+            self._queue.put_nowait((collection, doc))
+            self.enqueued += 1
+        except asyncio.QueueFull:
+            # Mongo isn't keeping up: park it on disk rather than make the request wait
+            await self._spill([(collection, doc)])
+            return
+        self._pending.setdefault((collection, doc.get("user_id")), {})[doc["_id"]] = doc
+
+    def pending(self, collection: str, user_id: str) -> List[dict]:
+        """A user's documents still queued for ``collection``, without ``_id``, oldest first."""
+        docs = self._pending.get((collection, user_id))
+        return [{k: v for k, v in d.items() if k != "_id"} for d in docs.values()] if docs else []
+
+    def _settle(self, items: List[Item]):
+        # Written or spilled: either way no longer served from memory
+        for collection, doc in items:
+            key = (collection, doc.get("user_id"))
+            docs = self._pending.get(key)
+            if docs is not None:
+                docs.pop(doc.get("_id"), None)
+                if not docs:
+                    del self._pending[key]
+
+    async def _after(self, collection: str, docs: List[dict]):
+        hook = self._hooks.get(collection)
+        if hook is None:
+            return
+        try:
+            await hook(docs)
+        except Exception as e:
+            logging.error(f"Write-behind hook for {collection} failed: {e}", exc_info=True)
+
+    async def _insert_many(self, collection: str, docs: List[dict]):
+        try:
+            await self.db[collection].insert_many(docs, ordered=False)
+        except BulkWriteError as e:
+            # Duplicates were written by an earlier attempt that timed out or was replayed
+            if any(err.get("code") != _DUPLICATE_KEY for err in e.details.get("writeErrors", [])):
+                raise
+
+    async def _write(self, items: List[Item]) -> bool:
+        by_collection: Dict[str, List[dict]] = defaultdict(list)
+        for collection, doc in items:
+            by_collection[collection].append(doc)
+        try:
+            for collection, docs in by_collection.items():
+                await asyncio.wait_for(self._insert_many(collection, docs), self.write_timeout)
+        except (PyMongoError, asyncio.TimeoutError) as e:
+            self.failures += 1
+            logging.warning(f"Write-behind flush of {len(items)} documents failed, spilling to disk: {e!r}")
+            await self._spill(items)
+            self._settle(items)
+            return False
+        self._settle(items)
+        self.batches += 1
+        self.flushed += len(items)
+        for collection, docs in by_collection.items():
+            await self._after(collection, docs)
+        return True
+
+    async def _spill(self, items: List[Item]):
+        if not items:
+            return
+        lines = [json_util.dumps({"c": c, "d": d}, json_options=_SPILL_JSON) + "\n" for c, d in items]
+        if self._spill_lock is None:
+            self._spill_lock = asyncio.Lock()
+        async with self._spill_lock:
+            await asyncio.to_thread(_append_lines, self.spill_path, lines)
+        self.spilled += len(items)
+
+    async def replay(self) -> int:
+        """Insert everything in the spill file; whatever still can't be written is spilled again."""
+        # Claimed by rename, so one worker replays a given file and new spills start a fresh one
+        claimed = f"{self.spill_path}.{os.getpid()}.replay"
+        try:
+            os.replace(self.spill_path, claimed)
+        except FileNotFoundError:
+            return 0
+        replayed = 0
+        chunks = _read_chunks(claimed, self.batch_size)
+        try:
+            while True:
+                chunk = await asyncio.to_thread(next, chunks, None)
+                if chunk is None:
+                    break
+                if not await self._write(chunk):
+                    # Mongo is still unhappy; carry the rest over to the next attempt
+                    while (chunk := await asyncio.to_thread(next, chunks, None)) is not None:
+                        await self._spill(chunk)
+                    break
+                replayed += len(chunk)
+        except BaseException:
+            # Interrupted (e.g. shutdown timed out): hand the whole file back; what already landed is a duplicate
+            chunks.close()
+            with open(claimed, encoding="utf-8") as f:
+                _append_lines(self.spill_path, f.readlines())
+            os.remove(claimed)
+            raise
+        os.remove(claimed)
+        if replayed:
+            self.replayed += replayed
+            logging.info(f"Replayed {replayed} spilled documents into MongoDB")
+        return replayed
+
+    async def _next_batch(self) -> List[Item]:
+        loop = asyncio.get_running_loop()
+        try:
+            batch = [await asyncio.wait_for(self._queue.get(), self.flush_seconds)]
+        except asyncio.TimeoutError:
+            return []
+        deadline = loop.time() + self.flush_seconds
+        while len(batch) < self.batch_size:
+            try:
+                batch.append(self._queue.get_nowait())
+                continue
+            except asyncio.QueueEmpty:
+                pass
+            remaining = deadline - loop.time()
+            if remaining <= 0 or self._closing:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), remaining))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def _run(self):
+        last_replay = time.monotonic()
+        await self.replay()
+        while not (self._closing and self._queue.empty()):
+            self._inflight = await self._next_batch()
+            try:
+                if self._inflight:
+                    await self._write(self._inflight)
+                    self._inflight = []
+                # On the timer, busy or not: under sustained load the queue never drains
+                if not self._closing and time.monotonic() - last_replay >= self.replay_interval:
+                    last_replay = time.monotonic()
+                    if os.path.exists(self.spill_path):
+                        await self.replay()
+            except OSError as e:
+                # The spill file itself failed (e.g. disk full); keep flushing what Mongo will take
+                logging.error(f"Write-behind spill failed, {len(self._inflight)} documents lost: {e}")
+                self._settle(self._inflight)
+            self._inflight = []
+
+    async def start(self):
+        if not self.enabled:
+            # Still pick up anything spilled while write-behind was on
+            await self.replay()
+            return
+        if self._task is None or self._task.done():
+            self._queue = asyncio.Queue(maxsize=self.queue_size)
+            self._closing = False
+            self._task = asyncio.create_task(self._run())
+            logging.info(f"Write-behind ingestion on (batch {self.batch_size}, every {self.flush_seconds * 1000:.0f} ms)")
+
+    async def stop(self, timeout: float = WRITE_BEHIND_SHUTDOWN_SECONDS):
+        """Flush what's queued within ``timeout``; anything left over goes to the spill file."""
+        if self._task is None:
+            return
+        self._closing = True
+        try:
+            await asyncio.wait_for(asyncio.shield(self._task), timeout)
+        except asyncio.TimeoutError:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+        leftovers = list(self._inflight)
+        while not self._queue.empty():
+            leftovers.append(self._queue.get_nowait())
+        await self._spill(leftovers)
+        self._settle(leftovers)
+        self._inflight = []
+        self._task = None
+
+    def stats(self) -> dict:
+        return {
+            "enabled": self.enabled,
+            "queued": self._queue.qsize() if self._queue else 0,
+            "pending_users": len(self._pending),
+            "enqueued": self.enqueued,
+            "flushed": self.flushed,
+            "batches": self.batches,
+            "spilled": self.spilled,
+            "replayed": self.replayed,
+            "failures": self.failures,
+        }
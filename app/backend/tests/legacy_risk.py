@@ -0,0 +1,53 @@
+"""The scoring logic from server.py before RiskEngine existed, kept verbatim as the parity oracle."""
+
+
+async def legacy_calculate_risk_score(db, user_id: str):
+    vitals = await db.vitals.find({"user_id": user_id}, {"_id": 0}).sort("timestamp", -1).limit(7).to_list(7)
+    if not vitals:
+        return {
+            "score": 0.0,
+            "risk_level": "low",
+            "factors": ["No vitals data available"],
+            "recommendations": ["Please log your vitals regularly for accurate monitoring"]
+        }
+
+    score = 0
+    factors = []
+    latest_vital = vitals[0]
+    hr = latest_vital.get("heart_rate")
+    if hr and (hr < 60 or hr > 100):
+        factors.append(f"Abnormal heart rate: {hr} bpm")
+        score += 15
+    sys_bp = latest_vital.get("blood_pressure_systolic")
+    dia_bp = latest_vital.get("blood_pressure_diastolic")
+    if sys_bp and dia_bp and (sys_bp > 140 or dia_bp > 90):
+        factors.append(f"Elevated blood pressure: {sys_bp}/{dia_bp}")
+        score += 20
+    temp = latest_vital.get("temperature")
+    if temp and (temp < 36.1 or temp > 37.8):
+        factors.append(f"Abnormal temperature: {temp}°C")
+        score += 25
+    o2 = latest_vital.get("oxygen_saturation")
+    if o2 and o2 < 95:
+        factors.append(f"Low oxygen saturation: {o2}%")
+        score += 30
+    sleep = latest_vital.get("sleep_hours")
+    if sleep and sleep < 6:
+        factors.append(f"Insufficient sleep: {sleep} hours")
+        score += 10
+
+    if score >= 50: risk_level = "high"
+    elif score >= 25: risk_level = "medium"
+    else: risk_level = "low"
+
+    recommendations = []
+    if risk_level == "high":
+        recommendations = ["Schedule urgent doctor consultation", "Monitor vitals closely"]
+    elif risk_level == "medium":
+        recommendations = ["Schedule check-up in 24-48 hours", "Rest and monitor symptoms"]
+    else:
+        recommendations = ["Continue regular monitoring", "Maintain healthy lifestyle"]
+    if not factors:
+        factors.append("All vitals within normal range")
+
+    return {"score": round(score, 2), "risk_level": risk_level, "factors": factors, "recommendations": recommendations}
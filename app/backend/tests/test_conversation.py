@@ -0,0 +1,47 @@
+"""Turns that leave the prompt window are folded into the session summary, whatever pushed them out."""
+import asyncio
+from datetime import datetime, timedelta, timezone
+
+from services.conversationService import ConversationStore
+
+START = datetime(2026, 1, 1, tzinfo=timezone.utc)
+
+
+async def add_turns(db, count, offset=0):
+    await db.chats.insert_many([
+        {"id": f"c{offset + i}", "user_id": "u1", "session_id": "s1", "message": f"Question {offset + i}.",
+         "response": f"Answer {offset + i}.", "timestamp": START + timedelta(minutes=offset + i)}
+        for i in range(count)
+    ])
+
+
+def test_turns_past_max_turns_are_summarized(db):
+    async def check():
+        # Short turns: the token budget alone would keep all of them
+        await add_turns(db, 8)
+        store = ConversationStore(db, context_tokens=10_000, max_turns=5)
+
+        context = await store.load_context("u1", "s1")
+        assert [t["id"] for t in context["turns"]] == ["c3", "c4", "c5", "c6", "c7"]
+        assert "Question 0." in context["summary"] and "Question 2." in context["summary"]
+        assert context["summary"].index("Question 0.") < context["summary"].index("Question 2.")
+
+        # The folded turns aren't read or folded again
+        await add_turns(db, 1, offset=8)
+        context = await store.load_context("u1", "s1")
+        assert [t["id"] for t in context["turns"]] == ["c4", "c5", "c6", "c7", "c8"]
+        assert context["summary"].count("Question 2.") == 1 and "Question 3." in context["summary"]
+
+    asyncio.run(check())
+
+
+def test_token_budget_still_folds_overflow(db):
+    async def check():
+        await add_turns(db, 4)
+        store = ConversationStore(db, context_tokens=8, max_turns=40)
+
+        context = await store.load_context("u1", "s1")
+        assert [t["id"] for t in context["turns"]] == ["c2", "c3"]
+        assert "Question 0." in context["summary"] and "Question 1." in context["summary"]
+
+    asyncio.run(check())
@@ -0,0 +1,39 @@
+"""A Gemini call that outlives the timeout raises GeminiTimeoutError and keeps its permit until the thread ends."""
+import asyncio
+import threading
+
+import pytest
+
+from services.geminiService import GeminiTimeoutError, GeminiWorkerPool
+
+
+class SlowModel:
+    def __init__(self):
+        self.release = threading.Event()
+
+    def generate_content(self, prompt, stream=False):
+        self.release.wait(5)
+        return type("Response", (), {"text": "ok"})()
+
+
+def test_timeout_is_reported_and_holds_the_permit():
+    model = SlowModel()
+    pool = GeminiWorkerPool(model=model, max_concurrency=1, timeout=0.05)
+
+    async def check():
+        with pytest.raises(GeminiTimeoutError):
+            await pool.generate("hello")
+        assert pool.stats()["active"] == 1
+        model.release.set()
+        for _ in range(100):
+            if pool.stats()["active"] == 0:
+                break
+            await asyncio.sleep(0.01)
+        assert pool.stats()["active"] == 0
+        assert await pool.generate("again") == "ok"
+
+    try:
+        asyncio.run(check())
+    finally:
+        model.release.set()
+        pool.shutdown()
@@ -0,0 +1,53 @@
+"""Bookkeeping timestamps are stored as BSON dates, and the migration converts old string values."""
+import asyncio
+from datetime import datetime, timezone
+
+import services.fitSyncService as fit_sync_service
+from services.dateMigrationService import migrate_all
+from services.fitSyncService import FitSync
+from services.riskEngineService import RiskEngine
+from services.rollupService import VitalRollups
+
+WHEN = datetime(2026, 1, 1, 8, tzinfo=timezone.utc)
+LEGACY = "2026-01-01T00:00:00+00:00"
+
+
+def test_writers_store_native_dates(db, monkeypatch):
+    async def fake_buckets(access_token, metrics, start, end, bucket_ms, quota=None):
+        return [(m, start, start + bucket_ms, {"count": 1}) for m in metrics]
+
+    monkeypatch.setattr(fit_sync_service, "fetch_wearable_buckets", fake_buckets)
+
+    async def check():
+        vital = {"id": "v1", "user_id": "u1", "heart_rate": 70, "timestamp": WHEN}
+        await db.vitals.insert_one(dict(vital))
+        await RiskEngine(db).observe("u1", [vital])
+        await VitalRollups(db).refresh("u1", [vital])
+        await FitSync(db, backfill_days=1).sync("u1", "token", ["steps"])
+
+        assert isinstance((await db.risk_state.find_one())["updated_at"], datetime)
+        assert isinstance((await db.vital_rollups.find_one())["updated_at"], datetime)
+        assert isinstance((await db.fit_buckets.find_one())["synced_at"], datetime)
+        assert isinstance((await db.fit_sync_state.find_one())["synced_at"], datetime)
+
+    asyncio.run(check())
+
+
+def test_migration_converts_bookkeeping_fields(db):
+    async def check():
+        await db.risk_state.insert_one({"user_id": "u1", "window": [{"id": "v1", "timestamp": LEGACY}], "updated_at": LEGACY})
+        await db.fit_buckets.insert_one({"user_id": "u1", "metric": "steps", "start_ms": 0, "synced_at": LEGACY})
+        await db.fit_sync_state.insert_one({"user_id": "u1", "metric": "steps", "synced_at": LEGACY})
+        await db.vital_rollups.insert_one({"user_id": "u1", "day": "2026-01-01", "updated_at": LEGACY})
+
+        results = await migrate_all(db, pause_ms=0)
+        for name in ("risk_state", "fit_buckets", "fit_sync_state", "vital_rollups"):
+            assert results[name]["converted"] == 1, name
+        assert results["risk_state.window"]["converted"] == 1
+
+        state = await db.risk_state.find_one()
+        assert state["updated_at"] == state["window"][0]["timestamp"] == datetime(2026, 1, 1, tzinfo=timezone.utc)
+        for name, field in (("fit_buckets", "synced_at"), ("fit_sync_state", "synced_at"), ("vital_rollups", "updated_at")):
+            assert isinstance((await db[name].find_one())[field], datetime), name
+
+    asyncio.run(check())
@@ -0,0 +1,135 @@
+"""RiskEngine must score exactly like the full recomputation it replaced."""
+import asyncio
+import random
+import uuid
+from datetime import datetime, timedelta, timezone
+
+from services.riskEngineService import METRICS, NO_DATA_RESULT, RiskEngine
+
+from legacy_risk import legacy_calculate_risk_score
+
+START = datetime(2026, 1, 1, tzinfo=timezone.utc)
+
+
+def vital(user_id: str, when: datetime, **values) -> dict:
+    return {"id": str(uuid.uuid4()), "user_id": user_id, **{m: None for m in METRICS},
+            "notes": None, "timestamp": when, **values}
+
+
+def random_vital(rng: random.Random, user_id: str, when: datetime) -> dict:
+    def maybe(value):
+        roll = rng.random()
+        return None if roll < 0.15 else 0 if roll < 0.18 else value
+
+    return vital(
+        user_id, when,
+        heart_rate=maybe(rng.randint(45, 125)),
+        blood_pressure_systolic=maybe(rng.randint(95, 170)),
+        blood_pressure_diastolic=maybe(rng.randint(55, 105)),
+        temperature=maybe(round(rng.uniform(35.5, 39.0), 1)),
+        oxygen_saturation=maybe(rng.randint(88, 100)),
+        sleep_hours=maybe(round(rng.uniform(3, 10), 1)),
+        activity_minutes=maybe(rng.randint(0, 120)),
+    )
+
+
+async def ingest(db, engine: RiskEngine, user_id: str, vitals: list) -> dict:
+    await db.vitals.insert_many([dict(v) for v in vitals])
+    return await engine.observe(user_id, vitals)
+
+
+def test_matches_full_recomputation_on_random_streams(db):
+    async def check():
+        engine = RiskEngine(db)
+        rng = random.Random(7)
+        for _ in range(10):
+            user_id = str(uuid.uuid4())
+            clock = START
+            # Some users already have history before the engine first sees them
+            for _ in range(rng.choice([0, 3, 12])):
+                clock += timedelta(minutes=rng.randint(1, 600))
+                await db.vitals.insert_one(random_vital(rng, user_id, clock))
+            for _ in range(25):
+                clock += timedelta(minutes=rng.randint(1, 600))
+                # Occasionally a device uploads a reading older than the newest one
+                when = clock - timedelta(hours=rng.randint(1, 48)) if rng.random() < 0.1 else clock
+                batch = [random_vital(rng, user_id, when + timedelta(seconds=i)) for i in range(rng.choice([1, 1, 5]))]
+                assert await ingest(db, engine, user_id, batch) == await legacy_calculate_risk_score(db, user_id)
+            assert await engine.score_user(user_id) == await legacy_calculate_risk_score(db, user_id)
+
+    asyncio.run(check())
+
+
+def test_empty_history(db):
+    async def check():
+        engine = RiskEngine(db)
+        score = await engine.score_user("nobody")
+        assert score == NO_DATA_RESULT == await legacy_calculate_risk_score(db, "nobody")
+        # Callers may mutate the result; the shared constant must survive that
+        score["factors"].append("x")
+        assert NO_DATA_RESULT["factors"] == ["No vitals data available"]
+
+    asyncio.run(check())
+
+
+def test_null_and_zero_metrics(db):
+    async def check():
+        engine = RiskEngine(db)
+        user_id = str(uuid.uuid4())
+        readings = [
+            vital(user_id, START),
+            vital(user_id, START + timedelta(hours=1), heart_rate=0, oxygen_saturation=0, temperature=0),
+            vital(user_id, START + timedelta(hours=2), blood_pressure_systolic=160),  # no diastolic
+            vital(user_id, START + timedelta(hours=3), oxygen_saturation=90, sleep_hours=None),
+        ]
+        for reading in readings:
+            assert await ingest(db, engine, user_id, [reading]) == await legacy_calculate_risk_score(db, user_id)
+        assert (await engine.score_user(user_id))["factors"] == ["Low oxygen saturation: 90%"]
+
+    asyncio.run(check())
+
+
+def test_reading_replaced_by_resync(db):
+    async def check():
+        engine = RiskEngine(db)
+        user_id = str(uuid.uuid4())
+        await ingest(db, engine, user_id, [vital(user_id, START, heart_rate=70, oxygen_saturation=98)])
+        synced = vital(user_id, START + timedelta(hours=1), heart_rate=72, oxygen_saturation=97)
+        await ingest(db, engine, user_id, [synced])
+
+        # A later sync of the same bucket rewrites the document under the same id
+        resynced = {**synced, "heart_rate": 130, "oxygen_saturation": 91}
+        await db.vitals.replace_one({"id": synced["id"]}, dict(resynced))
+        score = await engine.observe(user_id, [resynced])
+        assert score == await legacy_calculate_risk_score(db, user_id)
+        assert score["risk_level"] == "medium"
+        state = await engine.state(user_id)
+        assert [e["id"] for e in state["window"]].count(synced["id"]) == 1
+
+    asyncio.run(check())
+
+
+def test_state_survives_restart_and_duplicate_observe(db):
+    async def check():
+        user_id = str(uuid.uuid4())
+        reading = vital(user_id, START, temperature=38.5)
+        first = await ingest(db, RiskEngine(db), user_id, [reading])
+        # A new process sees the persisted window; re-observing the same reading changes nothing
+        engine = RiskEngine(db)
+        assert await engine.observe(user_id, [reading]) == first == await legacy_calculate_risk_score(db, user_id)
+        assert len((await engine.state(user_id))["window"]) == 1
+
+    asyncio.run(check())
+
+
+def test_preview_matches_observe_without_folding_in(db):
+    async def check():
+        engine = RiskEngine(db)
+        user_id = str(uuid.uuid4())
+        await ingest(db, engine, user_id, [vital(user_id, START, heart_rate=70, oxygen_saturation=98)])
+        queued = vital(user_id, START + timedelta(hours=1), heart_rate=130)
+        preview = await engine.preview(user_id, [queued])
+        assert len((await engine.state(user_id))["window"]) == 1
+        assert preview == await ingest(db, engine, user_id, [queued]) == await legacy_calculate_risk_score(db, user_id)
+
+    asyncio.run(check())
@@ -0,0 +1,85 @@
+"""The population re-scoring job must agree with RiskEngine and leave every consumer consistent."""
+import asyncio
+import random
+import uuid
+from datetime import datetime, timedelta, timezone
+
+from services.riskEngineService import DEFAULT_RULES, METRICS, RiskEngine, RiskRule, threshold_rule
+from services.riskRescoreService import rescore_population, score_chunk
+
+START = datetime(2026, 1, 1, tzinfo=timezone.utc)
+
+
+def random_rows(n: int, seed: int = 3) -> list:
+    rng = random.Random(seed)
+
+    def maybe(value):
+        roll = rng.random()
+        return None if roll < 0.15 else 0 if roll < 0.18 else value
+
+    return [{
+        "user_id": str(uuid.uuid4()),
+        "heart_rate": maybe(rng.randint(45, 125)),
+        "blood_pressure_systolic": maybe(rng.randint(95, 170)),
+        "blood_pressure_diastolic": maybe(rng.randint(55, 105)),
+        "temperature": maybe(round(rng.uniform(35.5, 39.0), 1)),
+        "oxygen_saturation": maybe(rng.randint(88, 100)),
+        "sleep_hours": maybe(round(rng.uniform(3, 10), 1)),
+        "activity_minutes": maybe(rng.randint(0, 120)),
+    } for _ in range(n)]
+
+
+def scalar_scores(rows: list, rules: list) -> list:
+    engine = RiskEngine(db=None, rules=rules)
+    return [{"user_id": v["user_id"], **engine.score_window([v])} for v in rows]
+
+
+def test_vectorized_scores_match_engine():
+    rows = random_rows(2000)
+    assert score_chunk(rows) == scalar_scores(rows, DEFAULT_RULES)
+
+
+def test_changed_thresholds_and_custom_rules_apply_to_both():
+    rows = random_rows(500)
+    rules = [r for r in DEFAULT_RULES if r.name != "heart_rate"] + [
+        threshold_rule("heart_rate", 15, {"heart_rate": (55, 90)}, "Abnormal heart rate: {heart_rate} bpm"),
+        RiskRule("no_activity", 5, lambda v, ctx: "No activity recorded" if not v.get("activity_minutes") else None),
+    ]
+    assert score_chunk(rows, rules) == scalar_scores(rows, rules)
+
+
+def test_rescore_records_like_record_risk(db):
+    async def check():
+        engine = RiskEngine(db)
+        users = [str(uuid.uuid4()) for _ in range(3)]
+        for i, user_id in enumerate(users):
+            await db.vitals.insert_many([
+                {"id": str(uuid.uuid4()), "user_id": user_id, **{m: None for m in METRICS},
+                 "heart_rate": 70, "timestamp": START},
+                {"id": str(uuid.uuid4()), "user_id": user_id, **{m: None for m in METRICS},
+                 "heart_rate": 130 if i else 70, "oxygen_saturation": 90 if i else 98, "temperature": 39.0 if i == 2 else 37.0,
+                 "timestamp": START + timedelta(hours=1)},
+            ])
+            await db.patient_summaries.insert_one({"id": user_id, "risk_level": "low"})
+        # A window that went stale, e.g. the newest reading was rewritten out of band
+        stale = {"id": "stale", "user_id": users[0], "heart_rate": 40, "oxygen_saturation": 85, "temperature": 40.0,
+                 "timestamp": START + timedelta(hours=2)}
+        await engine.observe(users[0], [stale])
+
+        recorded = []
+        result = await rescore_population(db, chunk_size=2, on_recorded=lambda doc, before: recorded.append((doc, before)))
+        assert result["patients"] == 3
+        assert result["levels"] == {"low": 1, "medium": 1, "high": 1}
+        assert sorted((d["user_id"], d["risk_level"], before) for d, before in recorded) == sorted(
+            zip(users, ["low", "medium", "high"], ["low"] * 3))
+        assert await db.risk_state.count_documents({}) == 0
+
+        for user_id in users:
+            stored = await db.risk_scores.find_one({"user_id": user_id}, {"_id": 0})
+            summary = await db.patient_summaries.find_one({"id": user_id})
+            assert summary["risk_level"] == stored["risk_level"]
+            # The engine re-seeds from the same history and agrees with the stored score
+            live = await engine.score_user(user_id)
+            assert {k: stored[k] for k in live} == live
+
+    asyncio.run(check())
@@ -0,0 +1,126 @@
+"""Background Google Fit sync must not disturb risk scoring, rewrite unchanged days or run once per worker."""
+import asyncio
+import time
+from datetime import datetime, timezone
+
+import services.googleFitService as google_fit_service
+from services.fitSyncService import FitSync
+from services.riskEngineService import METRICS, RiskEngine
+from services.wearableSchedulerService import WearableSyncScheduler, wearable_vitals
+
+DAY_MS = 24 * 3600 * 1000
+TODAY = int(datetime(2026, 3, 2, tzinfo=timezone.utc).timestamp() * 1000)
+
+
+class FakeFitSync:
+    def __init__(self, delay=0.0):
+        self.rows = []
+        self.delay = delay
+        self.synced = []
+
+    async def sync_once(self, user_id, access_token, metrics, quota=None):
+        self.synced.append(user_id)
+        await asyncio.sleep(self.delay)
+        return list(self.rows)
+
+
+class CountingQuota:
+    def __init__(self):
+        self.charged = 0
+
+    async def acquire(self, tokens=1):
+        self.charged += tokens
+
+
+def test_aggregates_are_dated_at_bucket_start():
+    rows = [("heartrate", TODAY, TODAY + 3600 * 1000, {"avg": 71.6}), ("oxygen", TODAY, TODAY + 7200 * 1000, {"avg": 97.2})]
+    (doc,) = wearable_vitals("u1", rows)
+    assert doc["timestamp"] == datetime.fromtimestamp(TODAY / 1000, tz=timezone.utc)
+    assert (doc["heart_rate"], doc["oxygen_saturation"], doc["source"]) == (72, 97, "google_fit")
+    # A later pass over the same (still growing) bucket keeps the same id and timestamp
+    later = wearable_vitals("u1", [("heartrate", TODAY, TODAY + 5 * 3600 * 1000, {"avg": 71.6})])
+    assert (later[0]["id"], later[0]["timestamp"]) == (doc["id"], doc["timestamp"])
+
+
+def test_sync_writes_only_changed_days_and_keeps_manual_risk(db):
+    async def check():
+        engine = RiskEngine(db)
+        manual = {"id": "m1", "user_id": "u1", **{m: None for m in METRICS}, "blood_pressure_systolic": 165,
+                  "blood_pressure_diastolic": 100, "temperature": 38.6,
+                  "timestamp": datetime.fromtimestamp((TODAY - DAY_MS) / 1000, tz=timezone.utc)}
+        await db.vitals.insert_one(dict(manual))
+        before = await engine.observe("u1", [manual])
+        assert before["risk_level"] == "medium" and len(before["factors"]) == 2
+
+        written = []
+
+        async def after_write(user_id, docs):
+            written.append(docs)
+            await engine.observe(user_id, docs)
+
+        fit = FakeFitSync()
+        scheduler = WearableSyncScheduler(db, fit, after_write=after_write)
+        fit.rows = [("heartrate", TODAY - DAY_MS, TODAY, {"avg": 70}), ("heartrate", TODAY, TODAY + 3600 * 1000, {"avg": 72}),
+                    ("oxygen", TODAY, TODAY + 3600 * 1000, {"avg": 98})]
+        await scheduler.sync_user({"id": "u1", "google_access_token": "t"})
+        assert [len(docs) for docs in written] == [2]
+
+        # Same data on the next pass: nothing written, nothing reported
+        fit.rows[1] = ("heartrate", TODAY, TODAY + 2 * 3600 * 1000, {"avg": 72})
+        await scheduler.sync_user({"id": "u1", "google_access_token": "t"})
+        assert len(written) == 1
+
+        # Today's average moved: only today is rewritten
+        fit.rows[1] = ("heartrate", TODAY, TODAY + 3 * 3600 * 1000, {"avg": 75})
+        await scheduler.sync_user({"id": "u1", "google_access_token": "t"})
+        assert [d["heart_rate"] for d in written[-1]] == [75]
+        assert await db.vitals.count_documents({"user_id": "u1"}) == 3
+
+        # The newer wearable days don't hide the manual BP and temperature, live or after a restart
+        assert await engine.score_user("u1") == before
+        await engine.reset("u1")
+        assert await engine.score_user("u1") == before
+
+    asyncio.run(check())
+
+
+def test_workers_share_one_pass_and_per_user_claims(db):
+    async def check():
+        await db.users.insert_many([{"id": f"u{i}", "google_access_token": "t"} for i in range(5)])
+        fit = FakeFitSync(delay=0.01)
+        # Three uvicorn workers, each with its own scheduler
+        workers = [WearableSyncScheduler(db, fit, interval=0, user_min_interval=600) for _ in range(3)]
+
+        ran = await asyncio.gather(*(w.run_once() for w in workers))
+        assert sorted(ran) == [False, False, True]
+        assert sorted(fit.synced) == [f"u{i}" for i in range(5)]
+
+        # The next pass is due (interval=0), but every user was synced less than user_min_interval ago
+        assert await workers[1].run_once()
+        assert len(fit.synced) == 5 and workers[1].stats["throttled"] == 5
+
+        # Not due yet: nobody runs
+        late = WearableSyncScheduler(db, fit, interval=900)
+        assert await late.run_once()
+        assert not any([await w.run_once() for w in workers + [late]])
+
+    asyncio.run(check())
+
+
+def test_quota_is_charged_per_aggregate_call(db, monkeypatch):
+    calls = []
+
+    async def fake_aggregate(access_token, body):
+        calls.append(body)
+        return {"bucket": []}
+
+    monkeypatch.setattr(google_fit_service, "fetch_aggregate", fake_aggregate)
+
+    async def check():
+        # Heart rate resumes from yesterday, the rest backfill: two aggregate calls for one user
+        await db.fit_sync_state.insert_one({"user_id": "u1", "metric": "heartrate", "high_water_ms": int(time.time() * 1000) - DAY_MS})
+        quota = CountingQuota()
+        await FitSync(db, backfill_days=3).sync("u1", "t", ["heartrate", "sleep", "oxygen"], quota=quota)
+        assert quota.charged == len(calls) == 2
+
+    asyncio.run(check())
@@ -0,0 +1,58 @@
+"""Queued writes stay visible to their own user until flushed, and spills replay even while the queue is busy."""
+import asyncio
+from datetime import datetime, timedelta, timezone
+
+from services.conversationService import ConversationStore
+from services.writeBehindService import WriteBehindQueue
+
+START = datetime(2026, 1, 1, tzinfo=timezone.utc)
+
+
+def chat(i, user_id="u1"):
+    return {"id": f"c{i}", "user_id": user_id, "session_id": "s1", "message": f"Question {i}.",
+            "response": f"Answer {i}.", "timestamp": START + timedelta(minutes=i)}
+
+
+def test_pending_turns_are_read_back_until_flushed(db, tmp_path):
+    async def check():
+        writes = WriteBehindQueue(db, enabled=True, flush_ms=10_000, spill_path=str(tmp_path / "spill.ndjson"))
+        store = ConversationStore(db, pending=lambda user_id: writes.pending("chats", user_id))
+        await db.chats.insert_one(chat(0))
+        await writes.start()
+
+        await writes.insert("chats", chat(1))
+        await writes.insert("chats", chat(2, user_id="u2"))
+        assert await db.chats.count_documents({}) == 1
+        assert [t["id"] for t in writes.pending("chats", "u1")] == ["c1"]
+        assert "_id" not in writes.pending("chats", "u1")[0]
+
+        context = await store.load_context("u1", "s1")
+        assert [t["id"] for t in context["turns"]] == ["c0", "c1"]
+
+        await writes.stop()
+        assert writes.pending("chats", "u1") == [] and writes.stats()["pending_users"] == 0
+        assert await db.chats.count_documents({}) == 3
+        context = await store.load_context("u1", "s1")
+        assert [t["id"] for t in context["turns"]] == ["c0", "c1"]
+
+    asyncio.run(check())
+
+
+def test_spill_replays_while_the_queue_never_drains(db, tmp_path):
+    async def check():
+        spill_path = str(tmp_path / "spill.ndjson")
+        writes = WriteBehindQueue(db, enabled=True, flush_ms=20, replay_interval=0.05, spill_path=spill_path)
+        await writes.start()
+        # Spilled after startup, e.g. by a batch that failed during a blip
+        await writes._spill([("vitals", {"_id": 1, "id": "spilled", "user_id": "u1"})])
+
+        # A reading every millisecond: every batch comes back non-empty, the queue is never idle
+        for i in range(200):
+            await writes.insert("vitals", {"id": f"live-{i}", "user_id": "u1"})
+            await asyncio.sleep(0.001)
+        assert await db.vitals.find_one({"id": "spilled"}) is not None
+        assert writes.stats()["replayed"] == 1
+        await writes.stop()
+        assert await db.vitals.count_documents({}) == 201
+
+    asyncio.run(check())
@@ -8,11 +8,11 @@ import { Card, CardContent, CardDescription, CardHeader, CardTitle } from '@/com
 import { Tabs, TabsContent, TabsList, TabsTrigger } from '@/components/tabs';
 import { Heart, Activity, Thermometer, Droplet, Moon, Clock, AlertTriangle, MessageCircle, Users, LogOut, Brain } from 'lucide-react';
 import { toast } from 'sonner';
+import GoogleFitConnect from '@/components/GoogleFitConnect';
 
 const BACKEND_URL = process.env.REACT_APP_BACKEND_URL;
 const API = `${BACKEND_URL}/api`;
 
-// AuthPage component with added Google sign-in button
 const AuthPage = ({ onLogin }) => {
   const [isLogin, setIsLogin] = useState(true);
   const [formData, setFormData] = useState({
@@ -25,11 +25,6 @@ const AuthPage = ({ onLogin }) => {
   });
   const [loading, setLoading] = useState(false);
 
-  const handleGoogleSignIn = () => {
-    // Redirects to backend to start Google OAuth flow
-    window.location.href = `${BACKEND_URL}/auth/google`;
-  };
-
   const handleSubmit = async (e) => {
     e.preventDefault();
     setLoading(true);
@@ -182,12 +177,6 @@ const AuthPage = ({ onLogin }) => {
                 {loading ? 'Processing...' : (isLogin ? 'Sign In' : 'Sign Up')}
               </Button>
             </form>
-            {/* Google Sign-In Button */}
-            <div style={{ marginTop: '1rem', textAlign: 'center' }}>
-              <Button variant="outline" onClick={handleGoogleSignIn}>
-                Sign in with Google
-              </Button>
-            </div>
             <p className="auth-toggle">
               {isLogin ? "Don't have an account? " : 'Already have an account? '}
               <button 
@@ -206,28 +195,18 @@ const AuthPage = ({ onLogin }) => {
   );
 };
 
-// OAuthCallback component to handle backend OAuth redirect
-const OAuthCallback = ({ onLogin }) => {
+// The backend's OAuth callback lands here once Google Fit tokens are stored
+const GoogleFitConnected = () => {
   const navigate = useNavigate();
 
   useEffect(() => {
-    const fetchAuthAfterOAuth = async () => {
-      try {
-        const response = await axios.get(`${API}/auth/oauth-user`);
-        localStorage.setItem('token', response.data.access_token);
-        localStorage.setItem('user', JSON.stringify(response.data.user));
-        onLogin(response.data.user);
-        navigate('/');
-      } catch (error) {
-        toast.error('Google authentication failed');
-        navigate('/');
-      }
-    };
-    fetchAuthAfterOAuth();
-  }, [onLogin, navigate]);
+    toast.success('Google Fit connected');
+    navigate('/');
+  }, [navigate]);
 
-  return <div>Signing you in...</div>;
+  return <div className="loading">Connecting Google Fit...</div>;
 };
+
 const PatientDashboard = ({ user, onLogout }) => {
   const [vitals, setVitals] = useState([]);
   const [riskScore, setRiskScore] = useState(null);
@@ -334,6 +313,7 @@ const PatientDashboard = ({ user, onLogout }) => {
         <div className="nav-user">
           <span className="user-name">{user.full_name}</span>
           <span className="user-role">Patient</span>
+          <GoogleFitConnect />
           <Button data-testid="logout-button" variant="ghost" size="sm" onClick={onLogout}>
             <LogOut size={18} />
           </Button>
@@ -578,13 +558,32 @@ const DoctorDashboard = ({ user, onLogout }) => {
     fetchFAQs();
   }, []);
 
+  // Risk changes and new vitals are pushed instead of polled
+  useEffect(() => {
+    const socket = new WebSocket(`${API.replace(/^http/, 'ws')}/ws/alerts?token=${localStorage.getItem('token')}`);
+    socket.onmessage = (message) => {
+      const event = JSON.parse(message.data);
+      if (event.type === 'risk_transition') {
+        toast.warning(`Patient risk changed: ${event.from || 'none'} → ${event.to}`);
+        fetchPatients();
+      } else if (event.type === 'resync') {
+        fetchPatients();
+      } else if (event.type === 'vitals') {
+        setPatients((current) => current.map((p) => (
+          p.id === event.patient_id ? { ...p, latest_vitals: event.latest } : p
+        )));
+      }
+    };
+    return () => socket.close();
+  }, []);
+
   const getAuthHeaders = () => ({
     headers: { Authorization: `Bearer ${localStorage.getItem('token')}` }
   });
 
   const fetchPatients = async () => {
     try {
-      const response = await axios.get(`${API}/doctor/patients`, getAuthHeaders());
+      const response = await axios.get(`${API}/doctor/panel`, getAuthHeaders());
       setPatients(response.data);
     } catch (error) {
       toast.error('Failed to fetch patients');
@@ -812,7 +811,7 @@ function App() {
   return (
     <BrowserRouter>
       <Routes>
-        <Route path="/oauth2callback" element={<OAuthCallback onLogin={handleLogin} />} />
+        <Route path="/google-success" element={<GoogleFitConnected />} />
         <Route path="/" element={
           !user ? (
             <AuthPage onLogin={handleLogin} />
@@ -11,28 +11,14 @@ function Dashboard() {
   useEffect(() => {
     async function fetchAll() {
       try {
-        const [
-          stepsRes,
-          hrRes,
-          sleepRes,
-          oxygenRes,
-          stressRes
-        ] = await Promise.all([
-          fetch('/api/vitals/steps'),
-          fetch('/api/vitals/heartrate'),
-          fetch('/api/vitals/sleep'),
-          fetch('/api/vitals/oxygen'),
-        ]);
-        const stepsData = await stepsRes.json();
-        const heartRateData = await hrRes.json();
-        const sleepData = await sleepRes.json();
-        const oxygenData = await oxygenRes.json();
-        const stressData = await stressRes.json();
+        // One combined request; the backend fans out to Google Fit and normalizes the result
+        const res = await fetch('/api/vitals/wearable?metrics=steps,heartrate,sleep,oxygen');
+        const { metrics = {} } = await res.json();
 
-        setSteps(stepsData.steps || []);
-        setHeartRate(heartRateData.heartRate || []);
-        setSleep(sleepData.sleep || []);
-        setOxygen(oxygenData.oxygen || []);
+        setSteps(metrics.steps || []);
+        setHeartRate(metrics.heartrate || []);
+        setSleep(metrics.sleep || []);
+        setOxygen(metrics.oxygen || []);
       } catch (err) {
         setError(err.message || 'Error fetching data');
       } finally {
@@ -64,8 +50,8 @@ function Dashboard() {
             <tbody>
               {steps.map((entry, idx) => (
                 <tr key={idx}>
-                  <td>{entry.date}</td>
-                  <td>{entry.count}</td>
+                  <td>{entry.start.slice(0, 10)}</td>
+                  <td>{entry.value}</td>
                 </tr>
               ))}
             </tbody>
@@ -83,8 +69,8 @@ function Dashboard() {
             <tbody>
               {heartRate.map((entry, idx) => (
                 <tr key={idx}>
-                  <td>{entry.date}</td>
-                  <td>{entry.value}</td>
+                  <td>{entry.start.slice(0, 10)}</td>
+                  <td>{entry.avg}</td>
                 </tr>
               ))}
             </tbody>
@@ -102,8 +88,8 @@ function Dashboard() {
             <tbody>
               {sleep.map((entry, idx) => (
                 <tr key={idx}>
-                  <td>{entry.date}</td>
-                  <td>{entry.duration}</td>
+                  <td>{entry.start.slice(0, 10)}</td>
+                  <td>{(entry.minutes / 60).toFixed(1)}</td>
                 </tr>
               ))}
             </tbody>
@@ -121,8 +107,8 @@ function Dashboard() {
             <tbody>
               {oxygen.map((entry, idx) => (
                 <tr key={idx}>
-                  <td>{entry.date}</td>
-                  <td>{entry.value}</td>
+                  <td>{entry.start.slice(0, 10)}</td>
+                  <td>{entry.avg}</td>
                 </tr>
               ))}
             </tbody>
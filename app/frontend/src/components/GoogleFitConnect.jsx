@@ -1,16 +1,36 @@
-import React from 'react';
+import React, { useState } from 'react';
+import axios from 'axios';
+import { toast } from 'sonner';
+import { Button } from '@/components/button';
 
-const clientId = "681980167875-2dgp0ks41hqsv4l38iekai85bo56r52k.apps.googleusercontent.com";
-const redirectUri = "http://localhost:3000/oauth2callback";
-const scope = encodeURIComponent("https://www.googleapis.com/auth/fitness.activity.read https://www.googleapis.com/auth/fitness.heart_rate.read");
+const API = `${process.env.REACT_APP_BACKEND_URL}/api`;
+
+// The backend ties the OAuth state to the logged-in user, so the callback knows whose tokens to store
+export const connectGoogleFit = async () => {
+  const response = await axios.post(`${API}/google/connect`, null, {
+    headers: { Authorization: `Bearer ${localStorage.getItem('token')}` }
+  });
+  window.location.href = response.data.url;
+};
 
 function GoogleFitConnect() {
-  const startOAuth = () => {
-    const oauthUrl = `https://accounts.google.com/o/oauth2/v2/auth?client_id=${clientId}&redirect_uri=${encodeURIComponent(redirectUri)}&response_type=code&scope=${scope}&access_type=offline&prompt=consent`;
-    window.location.href = oauthUrl;
+  const [connecting, setConnecting] = useState(false);
+
+  const startOAuth = async () => {
+    setConnecting(true);
+    try {
+      await connectGoogleFit();
+    } catch (error) {
+      toast.error('Could not start Google Fit connection');
+      setConnecting(false);
+    }
   };
 
-  return <button onClick={startOAuth}>Connect Google Fit</button>;
+  return (
+    <Button data-testid="google-fit-connect" variant="outline" size="sm" onClick={startOAuth} disabled={connecting}>
+      {connecting ? 'Connecting...' : 'Connect Google Fit'}
+    </Button>
+  );
 }
 
 export default GoogleFitConnect;